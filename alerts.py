@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+「この地点の半径 r km 以内で、直近 N 日に目撃があったか」を
+多数の監視地点 (駅・学校・登山口など) についてまとめて判定する警報エンジン。
+
+直近 N 日の目撃だけを km 単位の格子に登録した空間インデックスを作り、
+各監視地点は周囲の格子に入っている目撃だけを距離判定する。
+前回までに通知した (監視地点, 目撃) の組は状態ファイルに記録し、
+新しく条件を満たしたものだけを返す。
+
+データ更新パイプライン (scraping_and_processing.py) は、変更ログを書いたあとに毎回
+evaluate_alerts() を呼び、新しい通知を bear_alerts.jsonl に追記する
+(監視地点は watch_points.csv があればそれ、無ければ lines.yaml の全駅)。
+
+使い方:
+  python alerts.py --days 7 --radius 3                 # lines.yaml の全駅を監視
+  python alerts.py --watch watch_points.csv --days 14  # 任意の監視地点 (id,name,lat,lon,radius_km)
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from geo_utils import load_lines_from_yaml
+from sightings_data import load_and_process_data, slice_by_date
+
+CSV_FILE = "bear_sightings_with_coords.csv"
+YAML_FILE = "lines.yaml"
+
+# 通知済みの (監視地点, 目撃) を記録する状態ファイル
+ALERT_STATE_FILE = "alerts_state.json"
+
+# パイプラインから実行したときの監視地点のCSVと、新しい通知の追記先
+WATCH_FILE = "watch_points.csv"
+ALERT_LOG_FILE = "bear_alerts.jsonl"
+
+# 監視半径 (km) と対象期間 (日) の既定値
+DEFAULT_RADIUS_KM = 5.0
+DEFAULT_DAYS = 7
+
+# 格子の一辺の下限 (km)
+MIN_CELL_KM = 0.5
+
+# 地球の半径 (km)。geo_utils.haversine と同じ値
+EARTH_RADIUS_KM = 6371.0
+
+# 緯度1度あたりの距離 (km)
+KM_PER_DEG_LAT = np.pi * EARTH_RADIUS_KM / 180.0
+
+
+# ----------------------------------------------
+# 監視地点
+# ----------------------------------------------
+def subscriptions_from_lines(lines_data: dict, radius_km: float) -> list:
+    """
+    路線YAMLの全駅を監視地点にする (同じ駅名は1つにまとめる)。
+    """
+    subscriptions = {}
+    for line in lines_data['lines']:
+        for st_data in line['stations']:
+            sub_id = f"station:{st_data['name']}"
+            subscriptions.setdefault(sub_id, {
+                "id": sub_id,
+                "name": f"{st_data['name']}駅",
+                "lat": float(st_data['lat']),
+                "lon": float(st_data['lon']),
+                "radius_km": float(radius_km),
+            })
+    return list(subscriptions.values())
+
+
+def load_subscriptions(file_path: str, default_radius_km: float) -> list:
+    """
+    監視地点のCSV (id, name, lat, lon, radius_km) を読み込む。
+    radius_km 列が無い・空の場合は default_radius_km を使う。
+    """
+    df = pd.read_csv(file_path)
+    if 'radius_km' not in df.columns:
+        df['radius_km'] = default_radius_km
+    df['radius_km'] = df['radius_km'].fillna(default_radius_km)
+    if 'name' not in df.columns:
+        df['name'] = df['id']
+    return [
+        {"id": str(r.id), "name": str(r.name), "lat": float(r.lat),
+         "lon": float(r.lon), "radius_km": float(r.radius_km)}
+        for r in df.itertuples(index=False)
+    ]
+
+
+# ----------------------------------------------
+# 直近の目撃の空間インデックス
+# ----------------------------------------------
+def sighting_key(row) -> str:
+    """
+    目撃1件を識別する文字列 (通知済みかどうかの判定に使う)。
+    """
+    return f"{row.date:%Y-%m-%d}|{row.prefecture}|{row.city}|{row.location}|{row.latitude:.6f}|{row.longitude:.6f}"
+
+
+class RecentSightingsIndex:
+    """
+    目撃地点を、基準緯度で平面近似した km 座標の正方格子 (一辺 cell_km) に登録する。
+    半径 r の問い合わせでは、r を覆う格子だけを調べてから厳密な距離で絞り込む。
+    r が格子より大きい場合は覆う格子の数を増やして対応する (格子の大きさは典型的な半径に合わせる)。
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, cell_km: float):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.cell_km = float(cell_km)
+        self.ref_lat = float(self.lat.mean()) if len(self.lat) else 35.5
+        self._km_per_deg_lon = KM_PER_DEG_LAT * np.cos(np.radians(self.ref_lat))
+
+        cx, cy = self._cell_coords(self.lat, self.lon)
+        self._cells = defaultdict(list)
+        for i, key in enumerate(zip(cx.tolist(), cy.tolist())):
+            self._cells[key].append(i)
+        self._cells = {k: np.asarray(v, dtype=np.int64) for k, v in self._cells.items()}
+
+    def _cell_coords(self, lat, lon) -> tuple:
+        x = np.asarray(lon) * self._km_per_deg_lon
+        y = np.asarray(lat) * KM_PER_DEG_LAT
+        return np.floor(x / self.cell_km).astype(np.int64), np.floor(y / self.cell_km).astype(np.int64)
+
+    def query(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        """
+        (lat, lon) から radius_km 以内にある目撃の位置 (行番号) を返す。
+        """
+        # 平面近似の誤差を見込んで格子1つ分広めに候補を集める
+        reach = int(np.ceil(radius_km / self.cell_km)) + 1
+        cx, cy = self._cell_coords(lat, lon)
+        cx, cy = int(cx), int(cy)
+        if (2 * reach + 1) ** 2 > len(self._cells):
+            # 覆う格子が登録済みの格子より多い (半径がとても大きい) ときは、登録済みの格子を走査する
+            candidates = [
+                members for (x, y), members in self._cells.items()
+                if abs(x - cx) <= reach and abs(y - cy) <= reach
+            ]
+        else:
+            candidates = [
+                self._cells[(x, y)]
+                for x in range(cx - reach, cx + reach + 1)
+                for y in range(cy - reach, cy + reach + 1)
+                if (x, y) in self._cells
+            ]
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+
+        idx = np.concatenate(candidates)
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        return idx[dist <= radius_km]
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    geo_utils.haversine の NumPy 版。配列同士でまとめて距離(km)を求める。
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+# ----------------------------------------------
+# 警報エンジン
+# ----------------------------------------------
+class AlertEngine:
+    """
+    監視地点の一覧と期間 (直近 days 日) を持ち、run() のたびに
+    新しく条件を満たした (監視地点, 目撃) の組だけを返す。
+    """
+
+    def __init__(self, subscriptions: list, days: int = 7, state_path: str = ALERT_STATE_FILE):
+        self.subscriptions = subscriptions
+        self.days = int(days)
+        self.state_path = state_path
+
+    def _load_state(self) -> dict:
+        if self.state_path and os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self, state: dict):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def run(self, df: pd.DataFrame, as_of=None) -> list:
+        """
+        日付順ソート済みの df (load_and_process_data の結果) から直近 days 日の目撃を取り出し、
+        全監視地点をまとめて判定する。前回までに通知していない組だけを返す。
+        """
+        as_of = pd.Timestamp(as_of or datetime.now().date()).normalize()
+        window_start = as_of - pd.Timedelta(days=self.days - 1)
+        recent = slice_by_date(df, window_start, as_of)
+
+        state = self._load_state()
+        # 期間外になった目撃の通知記録は捨てる (状態ファイルが膨らまないように)
+        window_first = f"{window_start:%Y-%m-%d}"
+        state = {
+            sub_id: [key for key in keys if key[:10] >= window_first]
+            for sub_id, keys in state.items()
+        }
+
+        alerts = []
+        if len(recent) and self.subscriptions:
+            # 格子は典型的な (中央値の) 半径に合わせる。一部の大きな半径に合わせると、
+            # 多数の小さな半径の問い合わせがほぼ全件を調べることになる
+            typical_radius = float(np.median([sub['radius_km'] for sub in self.subscriptions]))
+            index = RecentSightingsIndex(recent['latitude'].to_numpy(),
+                                         recent['longitude'].to_numpy(),
+                                         cell_km=max(typical_radius, MIN_CELL_KM))
+            rows = list(recent.itertuples(index=False))
+            keys = [sighting_key(row) for row in rows]
+
+            for sub in self.subscriptions:
+                hits = index.query(sub['lat'], sub['lon'], sub['radius_km'])
+                if len(hits) == 0:
+                    continue
+                seen = set(state.get(sub['id'], []))
+                for i in hits.tolist():
+                    if keys[i] in seen:
+                        continue
+                    seen.add(keys[i])
+                    row = rows[i]
+                    alerts.append({
+                        "subscription_id": sub['id'],
+                        "subscription_name": sub['name'],
+                        "date": f"{row.date:%Y-%m-%d}",
+                        "prefecture": row.prefecture,
+                        "city": None if pd.isna(row.city) else row.city,
+                        "location": None if pd.isna(row.location) else row.location,
+                        "latitude": float(row.latitude),
+                        "longitude": float(row.longitude),
+                        "distance_km": round(float(haversine_km(
+                            sub['lat'], sub['lon'], row.latitude, row.longitude)), 2),
+                    })
+                state[sub['id']] = sorted(seen)
+
+        self._save_state({k: v for k, v in state.items() if v})
+        return alerts
+
+
+def default_subscriptions(watch_path: str = WATCH_FILE, lines_path: str = YAML_FILE,
+                          radius_km: float = DEFAULT_RADIUS_KM) -> list:
+    """
+    監視地点のCSVがあればそれを、無ければ路線YAMLの全駅を監視地点にする (どちらも無ければ空)。
+    """
+    if watch_path and os.path.exists(watch_path):
+        return load_subscriptions(watch_path, radius_km)
+    if lines_path and os.path.exists(lines_path):
+        return subscriptions_from_lines(load_lines_from_yaml(lines_path), radius_km)
+    return []
+
+
+def evaluate_alerts(csv_path: str = CSV_FILE, days: int = DEFAULT_DAYS,
+                    log_path: str = ALERT_LOG_FILE, state_path: str = ALERT_STATE_FILE) -> list:
+    """
+    既定の監視地点で判定し、新しい通知を log_path に1行1件の JSON で追記して返す。
+    データ更新パイプラインから更新のたびに呼ぶ。
+    """
+    subscriptions = default_subscriptions()
+    if not subscriptions:
+        return []
+    engine = AlertEngine(subscriptions, days=days, state_path=state_path)
+    alerts = engine.run(load_and_process_data(csv_path))
+    if alerts:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            for alert in alerts:
+                f.write(json.dumps(alert, ensure_ascii=False) + "\n")
+    return alerts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="監視地点の周辺で新しく発生した熊目撃を通知する")
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--lines", default=YAML_FILE, help="--watch が無い場合に全駅を監視地点にする")
+    parser.add_argument("--watch", help="監視地点のCSV (id,name,lat,lon,radius_km)")
+    parser.add_argument("--radius", type=float, default=DEFAULT_RADIUS_KM, help="監視半径の既定値 (km)")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS, help="直近何日の目撃を対象にするか")
+    parser.add_argument("--as-of", help="基準日 (YYYY-MM-DD)。省略時は今日")
+    parser.add_argument("--state", default=ALERT_STATE_FILE)
+    args = parser.parse_args()
+
+    if args.watch:
+        subscriptions = load_subscriptions(args.watch, args.radius)
+    else:
+        subscriptions = subscriptions_from_lines(load_lines_from_yaml(args.lines), args.radius)
+
+    engine = AlertEngine(subscriptions, days=args.days, state_path=args.state)
+    alerts = engine.run(load_and_process_data(args.csv), as_of=args.as_of)
+
+    for alert in alerts:
+        print(json.dumps(alert, ensure_ascii=False))
+    print(f"監視地点 {len(subscriptions)} 件, 新しい通知 {len(alerts)} 件", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+熊の目撃情報を GeoJSON で返す軽量な HTTP API。
+Streamlit の画面を使わずに、警報システムやモバイルアプリから定期取得するためのもの。
+
+エンドポイント:
+  GET /sightings?bbox=西,南,東,北&start=YYYY-MM-DD&end=YYYY-MM-DD&prefecture=山梨県&line=身延線
+      (パラメータはすべて省略可)
+  GET /health
+
+- データの読み込み・期間の切り出し・路線判定はアプリと同じ関数を使う
+- CSV/路線YAMLが更新されたとき、日付が変わったとき (is_recent が変わるため) に自動で読み直す
+- ETag / If-None-Match による 304 応答、gzip 圧縮、クエリ結果のメモリキャッシュに対応
+
+起動例:
+  python api_server.py --port 8502
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+import pandas as pd
+
+from geo_utils import load_lines_from_yaml, add_lines_near_column
+from sightings_data import load_and_process_data, slice_by_date
+
+# 座標付きの熊目撃情報CSVと路線YAML (app.py と同じ)
+CSV_FILE = "bear_sightings_with_coords.csv"
+YAML_FILE = "lines.yaml"
+
+# クエリ結果のキャッシュ件数の上限
+RESULT_CACHE_SIZE = 256
+
+# これより小さい応答は gzip 圧縮しない (バイト)
+GZIP_MIN_BYTES = 1024
+
+# クライアント側でのキャッシュ秒数
+MAX_AGE_SECONDS = 60
+
+
+class QueryError(ValueError):
+    """
+    クエリパラメータが不正な場合に送出する (400 応答になる)。
+    """
+
+
+# ----------------------------------------------
+# データの保持とクエリ
+# ----------------------------------------------
+class SightingsStore:
+    """
+    目撃情報 (lines_near 付き) を保持し、ファイル更新時に読み直す。
+    クエリ結果は (データの版, 正規化したクエリ) をキーにキャッシュする。
+    """
+
+    def __init__(self, csv_path: str = CSV_FILE, yaml_path: str = YAML_FILE):
+        self.csv_path = Path(csv_path)
+        self.yaml_path = Path(yaml_path)
+        self._lock = threading.Lock()
+        self._version = None
+        self._df = None
+        self._cache = OrderedDict()
+
+    def _current_version(self) -> str:
+        """
+        CSV と路線YAMLの更新時刻と今日の日付から、データの版を表す文字列を作る。
+        is_recent (過去1週間か) は読み込んだ日を基準に決まるので、日付が変われば版も変える
+        (ETag とクエリ結果のキャッシュもこの版で分かれる)。
+        """
+        parts = [date.today().isoformat(), str(self.csv_path.stat().st_mtime_ns)]
+        parts.append(str(self.yaml_path.stat().st_mtime_ns) if self.yaml_path.exists() else "-")
+        return "-".join(parts)
+
+    def snapshot(self) -> tuple:
+        """
+        (データの版, DataFrame) を返す。ファイルが更新されていれば読み直す。
+        """
+        version = self._current_version()
+        with self._lock:
+            if version != self._version:
+                lines_data = load_lines_from_yaml(self.yaml_path) if self.yaml_path.exists() else None
+                df = load_and_process_data(self.csv_path)
+                add_lines_near_column(df, lines_data, radius_km=5)
+                self._df = df
+                self._version = version
+                self._cache.clear()
+            return self._version, self._df
+
+    def query(self, params: dict) -> tuple:
+        """
+        クエリを実行し、(ETag, 応答本文, gzip済み本文) を返す。
+        同じ版・同じクエリの結果はキャッシュから返す。
+        """
+        key = normalize_query(params)
+        version, df = self.snapshot()
+        etag = make_etag(version, key)
+
+        with self._lock:
+            if (version, key) in self._cache:
+                self._cache.move_to_end((version, key))
+                return self._cache[(version, key)]
+
+        body = json.dumps(
+            to_geojson(filter_sightings(df, dict(key))),
+            ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        compressed = gzip.compress(body, 6) if len(body) >= GZIP_MIN_BYTES else None
+        result = (etag, body, compressed)
+
+        with self._lock:
+            self._cache[(version, key)] = result
+            if len(self._cache) > RESULT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return result
+
+    def etag_for(self, params: dict) -> str:
+        """
+        クエリを実行せずに ETag だけを求める (If-None-Match の判定用)。
+        """
+        version, _ = self.snapshot()
+        return make_etag(version, normalize_query(params))
+
+
+def normalize_query(params: dict) -> tuple:
+    """
+    クエリパラメータを検証し、キャッシュキーに使える (キー, 値) のタプルにする。
+    """
+    query = {}
+
+    bbox = params.get("bbox")
+    if bbox:
+        try:
+            west, south, east, north = (float(v) for v in bbox.split(","))
+        except ValueError:
+            raise QueryError("bbox は 西,南,東,北 の4つの数値で指定してください")
+        if west > east or south > north:
+            raise QueryError("bbox の範囲が不正です")
+        query["bbox"] = (west, south, east, north)
+
+    for name in ("start", "end"):
+        value = params.get(name)
+        if value:
+            try:
+                query[name] = pd.Timestamp(value).strftime("%Y-%m-%d")
+            except ValueError:
+                raise QueryError(f"{name} は YYYY-MM-DD 形式で指定してください")
+
+    for name in ("prefecture", "line"):
+        value = params.get(name)
+        if value:
+            query[name] = value
+
+    return tuple(sorted(query.items()))
+
+
+def make_etag(version: str, key: tuple) -> str:
+    """
+    データの版とクエリから ETag を作る。結果の本文はこの2つで決まるため、
+    本文を作らなくても 304 を返せる。
+    """
+    digest = hashlib.sha1(f"{version}|{key!r}".encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def filter_sightings(df: pd.DataFrame, query: dict) -> pd.DataFrame:
+    """
+    日付範囲は二分探索で切り出し、その範囲内だけに bbox・都道府県・路線の条件を適用する。
+    """
+    if len(df) == 0:
+        return df
+    start = query.get("start", df["date"].iloc[0])
+    end = query.get("end", df["date"].iloc[-1])
+    df = slice_by_date(df, start, end)
+
+    if "bbox" in query:
+        west, south, east, north = query["bbox"]
+        df = df[df["longitude"].between(west, east) & df["latitude"].between(south, north)]
+    if "prefecture" in query:
+        df = df[df["prefecture"] == query["prefecture"]]
+    if "line" in query:
+        line = query["line"]
+        df = df[df["lines_near"].apply(lambda lines: line in lines)]
+    return df
+
+
+def to_geojson(df: pd.DataFrame) -> dict:
+    """
+    目撃情報の DataFrame を GeoJSON の FeatureCollection にする。
+    """
+    features = []
+    for row in df.itertuples(index=False):
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [round(float(row.longitude), 6), round(float(row.latitude), 6)],
+            },
+            "properties": {
+                "prefecture": row.prefecture,
+                "date": row.date.strftime("%Y-%m-%d"),
+                "city": None if pd.isna(row.city) else row.city,
+                "location": None if pd.isna(row.location) else row.location,
+                "lines_near": list(row.lines_near),
+                "is_recent": bool(row.is_recent),
+            },
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+# ----------------------------------------------
+# HTTP サーバー
+# ----------------------------------------------
+class SightingsRequestHandler(BaseHTTPRequestHandler):
+    """
+    /sightings と /health を処理するハンドラ。server.store に SightingsStore を持たせて使う。
+    """
+
+    server_version = "BearSightingsAPI/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif url.path == "/sightings":
+            self._handle_sightings(url.query)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _handle_sightings(self, raw_query: str):
+        params = {k: v[-1] for k, v in parse_qs(raw_query).items()}
+        store = self.server.store
+        try:
+            etag = store.etag_for(params)
+            if etag in _parse_etags(self.headers.get("If-None-Match", "")):
+                self._send(304, b"", etag=etag)
+                return
+            etag, body, compressed = store.query(params)
+        except QueryError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except FileNotFoundError:
+            self._send_json(503, {"error": "データファイルが見つかりません"})
+            return
+
+        use_gzip = compressed is not None and "gzip" in self.headers.get("Accept-Encoding", "")
+        self._send(200, compressed if use_gzip else body, etag=etag,
+                   content_type="application/geo+json; charset=utf-8",
+                   encoding="gzip" if use_gzip else None)
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, content_type="application/json; charset=utf-8")
+
+    def _send(self, status: int, body: bytes, etag: str = None,
+              content_type: str = None, encoding: str = None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={MAX_AGE_SECONDS}")
+            self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # アクセスログは標準エラーではなく標準出力に簡潔に出す
+        print("[API]", self.address_string(), format % args)
+
+
+def _parse_etags(header: str) -> set:
+    """
+    If-None-Match ヘッダーの値を ETag の集合にする (弱いETagの W/ は無視)。
+    """
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8502,
+                csv_path: str = CSV_FILE, yaml_path: str = YAML_FILE) -> ThreadingHTTPServer:
+    """
+    API サーバーを作って返す (serve_forever() は呼び出し側で行う)。
+    port=0 を指定すると空いているポートが割り当てられる。
+    """
+    server = ThreadingHTTPServer((host, port), SightingsRequestHandler)
+    server.store = SightingsStore(csv_path, yaml_path)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="熊目撃情報の GeoJSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--csv", default=CSV_FILE)
+    parser.add_argument("--lines", default=YAML_FILE)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.csv, args.lines)
+    print(f"API起動: http://{args.host}:{server.server_port}/sightings")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
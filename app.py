@@ -6,83 +6,49 @@ Streamlit で地図表示(Folium)や統計グラフ(Plotly)を表示するアプ
 
 import streamlit as st
 import pandas as pd
-import yaml
 import folium
 from folium import plugins
 from streamlit_folium import st_folium
-from math import sin, cos, sqrt, atan2, radians
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 import plotly.graph_objects as go
-import subprocess
-import sys
+import copy
+import os
+from collections import OrderedDict
+
+from density_grid import DensityGrid, GRID_FILE, build_density_grid
+from rollups import SightingRollups, ROLLUP_FILE, build_rollups
+from hotspots import HotspotIndex, HOTSPOT_FILE, build_hotspots
+from playback import create_playback_layer
+from segment_risk import SegmentRiskView, SEGMENT_RISK_FILE, RECENT_WEEKS, BASELINE_WEEKS, build_segment_risk
+from tile_server import ATTRIBUTION as TILE_ATTRIBUTION
+from refresh_job import RefreshJob
+from arrow_snapshot import load_snapshot, POINTER_FILE
+from render_profiler import RenderProfiler, profiling_requested, summarize
+from sightings_data import load_and_process_data, compact_sightings, slice_by_date, resolve_date_window
+from geo_utils import load_lines_from_yaml, line_bits
 
 # 座標付きの熊目撃情報が格納されているCSVファイル
 CSV_FILE = "bear_sightings_with_coords.csv"
 # 駅情報と路線情報のYAMLファイル
 YAML_FILE = "lines.yaml"
-
-
-# ----------------------------------------------
-# 距離計算 (ハーバーサインの公式)
-# ----------------------------------------------
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    2点の緯度経度 (lat1, lon1) と (lat2, lon2) から
-    地球上の距離(km)を求める。
-    """
-    R = 6371.0
-    lat1_r = radians(lat1)
-    lon1_r = radians(lon1)
-    lat2_r = radians(lat2)
-    lon2_r = radians(lon2)
-    dlat = lat2_r - lat1_r
-    dlon = lon2_r - lon1_r
-
-    a = sin(dlat / 2)**2 + cos(lat1_r) * cos(lat2_r) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    distance = R * c
-    return distance
-
-
-def get_lines_near_sighting(sighting_lat, sighting_lon, lines_data, radius_km=5):
-    """
-    目撃地点 (sighting_lat, sighting_lon) が
-    半径 radius_km km以内にある路線名をリストで返す。
-    """
-    near_lines = []
-    for line in lines_data['lines']:
-        for st_data in line['stations']:
-            dist = haversine(sighting_lat, sighting_lon, st_data['lat'], st_data['lon'])
-            if dist <= radius_km:
-                near_lines.append(line['name'])
-                break  # 同じ路線で重複チェックしないため
-    return near_lines
-
-
-# ----------------------------------------------
-# YAMLファイルを読み込む関数
-# ----------------------------------------------
-def load_lines_from_yaml(file_path: str):
-    """
-    YAMLファイル (lines.yaml) を読み込み、辞書型を返す。
-    想定構造:
-    {
-      'lines': [
-        {
-          'name': 'Minobu',
-          'stations': [
-            {'name': '富士', 'lat': 35.xxx, 'lon': 138.xxx},
-            ...
-          ]
-        },
-        ...
-      ]
-    }
-    """
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
-    return data
+# 密度表示のセルサイズ (表示名 → 度)
+DENSITY_RESOLUTIONS = {
+    "約20km": 0.2,
+    "約10km": 0.1,
+    "約5km": 0.05,
+    "約2km": 0.02,
+    "約1km": 0.01,
+}
+# ローカルのタイルサーバー (tile_server.py) のURLを指定する環境変数
+# 例: http://127.0.0.1:8503/tiles/{z}/{x}/{y}.png  (未設定なら CartoDB から直接取得する)
+TILE_URL_ENV = "BEAR_TILE_URL"
+# 時系列グラフの集計単位 (期間の種類 → 表示名)
+TIME_SERIES_FREQS = {
+    "D": "日別",
+    "W": "週別",
+    "M": "月別",
+}
 
 
 # ----------------------------------------------
@@ -129,62 +95,193 @@ def add_stations_to_map(m: folium.Map, lines_data: dict):
 
 
 # ----------------------------------------------
-# CSV読み込み & 前処理
+# CSV読み込み (全セッションで共有)
 # ----------------------------------------------
-def load_and_process_data(file_path: str) -> pd.DataFrame:
+@st.cache_resource(max_entries=2)
+def load_dataset(csv_path: str, csv_mtime: float, yaml_mtime: float, snapshot_mtime: float,
+                 today, _lines_data: dict) -> pd.DataFrame:
     """
-    CSVからデータを読み込み、緯度経度や日付が欠損の行を除外して返す。
+    CSVの読み込み・前処理と路線近接の判定までを行い、全セッションで共有する。
+    パイプラインが公開した Arrow スナップショットがCSVより新しければ、それをメモリマップで開く
+    (同じホストの複数プロセスで1つのページキャッシュを共有し、CSVの解析も不要になる)。
+    文字列はカテゴリ型、座標は float32、路線近接はビット集合 (lines_mask) の省メモリ表現にする
+    (列ごとの使用量は sightings_data.memory_report で確認できる)。
+    返した DataFrame は書き換えずに読み取り専用として扱うこと。
+    引数の更新時刻と日付 (today) は、ファイル更新時・日付変更時 (is_recent の再計算) に
+    キャッシュを作り直すためのもの。
     """
-    df = pd.read_csv(file_path)
+    if snapshot_mtime >= csv_mtime:
+        df = load_snapshot(_lines_data, yaml_mtime)
+        if df is not None:
+            return df
 
-    # 緯度、経度がNaNの行を除去
-    df = df.dropna(subset=['latitude', 'longitude'])
+    df = load_and_process_data(csv_path)
 
-    # 日付をdatetimeに変換し、変換不可の行を除去
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
-    df = df.dropna(subset=['date'])
+    # --- 省メモリ表現に変換し、「lines_mask」列を追加(路線フィルタ用) ---
+    return compact_sightings(df, _lines_data, radius_km=5)  # 半径5kmで判定
 
-    return df
+
+# ----------------------------------------------
+# 密度表示 (事前集計グリッド)
+# ----------------------------------------------
+@st.cache_resource(max_entries=2)
+def load_density_grid(csv_path: str, csv_mtime: float) -> DensityGrid:
+    """
+    パイプラインが事前集計した bear_density_grid.npz を読み込む。
+    ファイルが無い、またはCSVより古い場合はCSVから作り直す。
+    csv_mtime はキャッシュをCSV更新時に作り直すための引数。
+    """
+    grid_path = Path(GRID_FILE)
+    if grid_path.exists() and grid_path.stat().st_mtime >= csv_mtime:
+        return DensityGrid.load(GRID_FILE)
+    return build_density_grid(load_and_process_data(csv_path))
+
+
+def create_density_layer(grid: DensityGrid, resolution: float, date_range: tuple) -> folium.FeatureGroup:
+    """
+    事前集計グリッドから日付範囲内のセル別件数をPNGにし、
+    半透明の画像レイヤーを入れた FeatureGroup として返す。
+    """
+    start_date, end_date = date_range
+    density_layer = folium.FeatureGroup(name='密度表示', show=True)
+    folium.raster_layers.ImageOverlay(
+        image=grid.png_data_url(resolution, start_date, end_date),
+        bounds=grid.image_bounds(resolution),
+        opacity=0.8,
+        interactive=False,
+        zindex=1
+    ).add_to(density_layer)
+    return density_layer
+
+
+# ----------------------------------------------
+# 統計用ロールアップ (事前集計キューブ)
+# ----------------------------------------------
+@st.cache_resource(max_entries=2)
+def load_rollups(csv_mtime: float, yaml_mtime: float, _df: pd.DataFrame, _lines_data: dict) -> SightingRollups:
+    """
+    パイプラインが事前集計した bear_rollups.npz を読み込む。
+    ファイルが無い、またはCSV・路線YAMLより古い場合は、読み込み済みの _df から作り直す。
+    引数の更新時刻はキャッシュの無効化に使う。
+    """
+    rollup_path = Path(ROLLUP_FILE)
+    if rollup_path.exists() and rollup_path.stat().st_mtime >= max(csv_mtime, yaml_mtime):
+        return SightingRollups.load(ROLLUP_FILE)
+    return build_rollups(_df, _lines_data)
+
+
+# ----------------------------------------------
+# ホットスポット (時空間クラスタ)
+# ----------------------------------------------
+@st.cache_resource(max_entries=2)
+def load_hotspots(csv_mtime: float, _df: pd.DataFrame) -> HotspotIndex:
+    """
+    パイプラインが保存した bear_hotspots.npz を読み込む。
+    ファイルが無い、またはCSVより古い場合は、読み込み済みの _df から作り直す。
+    クラスタ一覧もここで作っておき、再実行のたびには期間での絞り込みだけを行う。
+    """
+    hotspot_path = Path(HOTSPOT_FILE)
+    if hotspot_path.exists() and hotspot_path.stat().st_mtime >= csv_mtime:
+        index = HotspotIndex.load(HOTSPOT_FILE)
+    else:
+        index = build_hotspots(_df)
+    index.cluster_table()
+    return index
+
+
+# ----------------------------------------------
+# 路線区間ごとの週別件数 (事前集計ビュー)
+# ----------------------------------------------
+@st.cache_resource(max_entries=2)
+def load_segment_risk(csv_mtime: float, yaml_mtime: float, _df: pd.DataFrame,
+                      _lines_data: dict) -> SegmentRiskView:
+    """
+    パイプラインが保存した bear_segment_risk.npz を読み込む。
+    ファイルが無い、CSV・路線YAMLより古い、または区間が路線YAMLと合わない場合は、
+    読み込み済みの _df から作り直す。
+    """
+    segment_path = Path(SEGMENT_RISK_FILE)
+    if segment_path.exists() and segment_path.stat().st_mtime >= max(csv_mtime, yaml_mtime):
+        view = SegmentRiskView.load(_lines_data, SEGMENT_RISK_FILE)
+        if view.matches(_lines_data):
+            return view
+    return build_segment_risk(_df, _lines_data)
+
+
+def create_hotspot_layer(table: pd.DataFrame) -> folium.FeatureGroup:
+    """
+    ホットスポットの一覧 (HotspotIndex.cluster_table の結果) を円で描いた FeatureGroup を返す。
+    """
+    hotspot_layer = folium.FeatureGroup(name='ホットスポット', show=True)
+    for row in table.itertuples(index=False):
+        popup_html = f"""
+        <b>ホットスポット:</b> {row.prefecture} {row.city}<br>
+        <b>件数:</b> {row.count} 件<br>
+        <b>期間:</b> {row.start.date()} 〜 {row.end.date()}<br>
+        <b>半径:</b> 約{row.radius_km:.1f} km
+        """
+        folium.Circle(
+            location=[row.latitude, row.longitude],
+            radius=max(row.radius_km, 0.5) * 1000,
+            color='darkred',
+            weight=2,
+            fill=True,
+            fill_opacity=0.25,
+            popup=folium.Popup(popup_html, max_width=300)
+        ).add_to(hotspot_layer)
+    return hotspot_layer
 
 
 # ----------------------------------------------
 # 熊目撃情報をFolium地図に描画する関数
 # ----------------------------------------------
-def create_folium_map(df: pd.DataFrame, date_range: tuple) -> folium.Map:
+def create_base_map(tile_url: str = None) -> folium.Map:
     """
-    Foliumを使って地図を生成し、熊目撃情報のマーカーを追加して返す。
-    ヒートマップは削除し、MarkerCluster + 過去1週間/過去の2レイヤー表示のみ実装。
+    目撃情報に依存しない地図の土台（タイル・全画面ボタン・ミニマップ）を生成する。
+    tile_url を指定すると、背景とミニマップのタイルをそのURL (ローカルのタイルサーバー) から読む。
     """
     # 地図生成（日本の中央あたり, zoom=8）
     m = folium.Map(
         location=[35.5, 138.5],
         zoom_start=8,
-        tiles='CartoDB positron',
+        tiles=tile_url or 'CartoDB positron',
+        attr=TILE_ATTRIBUTION if tile_url else None,
         control_scale=True
     )
 
-    # 日付フィルタ
-    start_date = pd.Timestamp(date_range[0])
-    end_date = pd.Timestamp(date_range[1])
-    now_date = pd.Timestamp(datetime.now().date())
+    # 全画面表示
+    plugins.Fullscreen(
+        position='topleft',
+        title='全画面表示',
+        title_cancel='全画面解除',
+        force_separate_button=True
+    ).add_to(m)
+
+    # ミニマップ
+    minimap = plugins.MiniMap(
+        tile_layer=folium.TileLayer(tile_url, attr=TILE_ATTRIBUTION) if tile_url else None,
+        toggle_display=True,
+        position='bottomright'
+    )
+    m.add_child(minimap)
 
-    data_min = df['date'].min()
-    if start_date < data_min:
-        start_date = data_min
-    if end_date > now_date:
-        end_date = now_date
+    return m
 
-    mask = (df['date'] >= start_date) & (df['date'] <= end_date)
-    filtered_df = df[mask]
 
-    # 過去1週間のフラグ
-    now = datetime.now()
-    one_week_ago = now - timedelta(days=7)
-    filtered_df['is_recent'] = filtered_df['date'] >= one_week_ago
+def create_sighting_layers(df: pd.DataFrame, date_range: tuple) -> list:
+    """
+    熊目撃情報のマーカーを、
+    「クラスター表示」「過去1週間の目撃情報」「過去の目撃情報」の
+    3つの FeatureGroup に振り分けて返す。
+    """
+    # 日付フィルタ (日付順ソート済みなので二分探索で切り出す)
+    start_date, end_date = resolve_date_window(df, date_range)
+    filtered_df = slice_by_date(df, start_date, end_date)
 
-    # MarkerCluster
-    marker_cluster = plugins.MarkerCluster(name='クラスター表示')
-    marker_cluster.add_to(m)
+    # MarkerCluster (レイヤー切り替えのため FeatureGroup に入れる)
+    cluster_layer = folium.FeatureGroup(name='クラスター表示', show=True)
+    marker_cluster = plugins.MarkerCluster()
+    marker_cluster.add_to(cluster_layer)
 
     # 2つのレイヤー（過去1週間/過去の目撃情報）
     recent_layer = folium.FeatureGroup(name='過去1週間の目撃情報', show=True)
@@ -235,45 +332,112 @@ def create_folium_map(df: pd.DataFrame, date_range: tuple) -> folium.Map:
         else:
             circle_marker.add_to(old_layer)
 
-    # レイヤーを地図に追加
-    recent_layer.add_to(m)
-    old_layer.add_to(m)
+    return [cluster_layer, recent_layer, old_layer]
+
+
+def create_folium_map(df: pd.DataFrame, date_range: tuple) -> folium.Map:
+    """
+    Foliumを使って地図を生成し、熊目撃情報のマーカーを追加して返す。
+    ヒートマップは削除し、MarkerCluster + 過去1週間/過去の2レイヤー表示のみ実装。
+    （Streamlitアプリでは get_static_base_map + st_folium の feature_group_to_add を使う）
+    """
+    m = create_base_map()
+    for layer in create_sighting_layers(df, date_range):
+        layer.add_to(m)
 
     # レイヤーコントロール
     folium.LayerControl(collapsed=False).add_to(m)
 
-    # 全画面表示
-    plugins.Fullscreen(
-        position='topleft',
-        title='全画面表示',
-        title_cancel='全画面解除',
-        force_separate_button=True
-    ).add_to(m)
+    return m
+
+
+# ----------------------------------------------
+# 静的レイヤー付きの地図をキャッシュ
+# ----------------------------------------------
+@st.cache_resource
+def get_static_base_map(yaml_mtime: float, _lines_data: dict, tile_url: str = None) -> folium.Map:
+    """
+    地図の土台に路線ポリラインと駅マーカーを載せた地図を一度だけ生成してキャッシュする。
+    フィルタ変更時にはこの地図を作り直さず、目撃情報のレイヤーだけを差し替える。
+    yaml_mtime は路線YAMLの更新時にキャッシュを作り直すための引数。
+    """
+    m = create_base_map(tile_url)
+    if _lines_data:
+        railway_layer = folium.FeatureGroup(name='路線', show=True)
+        station_layer = folium.FeatureGroup(name='駅', show=True)
+        add_railway_lines_to_map(railway_layer, _lines_data)
+        add_stations_to_map(station_layer, _lines_data)
+        railway_layer.add_to(m)
+        station_layer.add_to(m)
+    return m
+
+
+def _copy_element(element, parent):
+    """
+    Folium の要素を子要素ごと浅くコピーする (位置・ポップアップなどの中身は共有する)。
+    """
+    clone = copy.copy(element)
+    clone._parent = parent
+    clone._children = OrderedDict(
+        (name, _copy_element(child, clone)) for name, child in element._children.items()
+    )
+    return clone
 
-    # ミニマップ
-    minimap = plugins.MiniMap(toggle_display=True, position='bottomright')
-    m.add_child(minimap)
 
+def session_map(base_map: folium.Map) -> folium.Map:
+    """
+    キャッシュした地図 (全セッションで共有) を、新しい Figure の下にコピーして返す。
+    レイヤーの追加や描画時のヘッダー登録はコピー側にだけ行われ、共有の地図は変わらない。
+    要素の ID は元と同じなので、ブラウザ側の地図も作り直されない。
+    """
+    figure = folium.Figure()
+    m = _copy_element(base_map, figure)
+    figure.add_child(m)
     return m
 
 
+def render_map_with_layers(base_map: folium.Map, layers: list, width: int = 800, height: int = 600,
+                           profiler: RenderProfiler = None):
+    """
+    キャッシュ済みの地図を st_folium で表示し、目撃情報のレイヤーは
+    feature_group_to_add で差し替える。地図本体のスクリプトは変わらないため、
+    ブラウザ側では地図を作り直さずにレイヤーだけが入れ替わる。
+    レイヤーはセッションごとのコピー (session_map) に追加し、共有の地図は変更しない。
+    profiler が有効なら、レイヤー込みの地図HTMLのバイト数を記録する。
+    """
+    m = session_map(base_map)
+    try:
+        return st_folium(
+            m,
+            width=width,
+            height=height,
+            feature_group_to_add=layers,
+            layer_control=folium.LayerControl(collapsed=False),
+            returned_objects=[]
+        )
+    finally:
+        if profiler is not None and profiler.enabled:
+            profiler.set("map_html_bytes", len(m.get_root().render().encode("utf-8")))
+
+
 # ----------------------------------------------
 # 時系列グラフ（Plotly）
 # ----------------------------------------------
-def create_time_series_plot(df: pd.DataFrame) -> go.Figure:
+def create_time_series_plot(counts: pd.Series, freq: str = 'D') -> go.Figure:
     """
-    日別の熊目撃件数を折れ線で表示。
+    期間別の熊目撃件数 (index=期間の初日, 値=件数) を折れ線で表示。
+    件数は SightingRollups.time_series() で事前集計から取り出したものを渡す。
     """
-    daily_counts = df.groupby('date').size().reset_index(name='count')
+    freq_label = TIME_SERIES_FREQS.get(freq, '日別')
     fig = go.Figure()
     fig.add_trace(go.Scatter(
-        x=daily_counts['date'],
-        y=daily_counts['count'],
+        x=counts.index,
+        y=counts.values,
         mode='lines+markers',
         name='目撃件数'
     ))
     fig.update_layout(
-        title='日別熊目撃件数の推移',
+        title=f'{freq_label}熊目撃件数の推移',
         xaxis_title='日付',
         yaxis_title='目撃件数',
         height=400
@@ -284,11 +448,12 @@ def create_time_series_plot(df: pd.DataFrame) -> go.Figure:
 # ----------------------------------------------
 # 地域分布グラフ（Plotly）
 # ----------------------------------------------
-def create_city_bar_chart(df: pd.DataFrame) -> go.Figure:
+def create_city_bar_chart(city_counts: pd.Series) -> go.Figure:
     """
     市町村別の目撃件数を上位10件だけ棒グラフで表示。
+    件数は SightingRollups.city_counts() で事前集計から取り出したもの (件数の多い順) を渡す。
     """
-    city_counts = df['city'].value_counts().head(10)
+    city_counts = city_counts.head(10)
     fig = go.Figure(go.Bar(
         x=city_counts.values,
         y=city_counts.index,
@@ -303,35 +468,112 @@ def create_city_bar_chart(df: pd.DataFrame) -> go.Figure:
     return fig
 
 
+# ----------------------------------------------
+# 路線区間のヒートストリップ（Plotly）
+# ----------------------------------------------
+def create_segment_heatmap(weekly: pd.DataFrame) -> go.Figure:
+    """
+    路線区間 × 週の目撃件数 (SegmentRiskView.weekly_counts の結果) をヒートマップで表示。
+    """
+    fig = go.Figure(go.Heatmap(
+        z=weekly.to_numpy(),
+        x=weekly.columns,
+        y=weekly.index,
+        colorscale='Reds',
+        hovertemplate='%{y}<br>%{x|%Y-%m-%d}の週: %{z}件<extra></extra>'
+    ))
+    fig.update_layout(
+        title='路線区間別・週別の熊目撃件数',
+        xaxis_title='週',
+        yaxis=dict(autorange='reversed'),
+        height=max(300, 22 * len(weekly) + 120)
+    )
+    return fig
+
+
 # ----------------------------------------------
 # スクリプト呼び出しで更新する関数 (任意)
 # ----------------------------------------------
-def update_bear_data():
+@st.cache_resource
+def get_refresh_job() -> RefreshJob:
     """
-    scraping_and_processing.py を実行し、熊目撃情報を更新（任意）。
+    全セッションで共有するデータ更新ジョブ。パイプラインは同時に1つしか実行されない。
     """
-    try:
-        progress_text = "データ更新中..."
-        progress_bar = st.progress(0)
+    return RefreshJob()
 
-        result = subprocess.run(
-            [sys.executable, "scraping_and_processing.py"],
-            capture_output=True,
-            text=True
-        )
 
-        progress_bar.progress(100)
+def update_bear_data():
+    """
+    scraping_and_processing.py をバックグラウンドで実行し、熊目撃情報を更新（任意）。
+    他のセッションがすでに更新中の場合は新しく起動せず、その進捗を表示する。
+    """
+    if get_refresh_job().start():
+        st.sidebar.info("データ更新を開始しました。")
+    else:
+        st.sidebar.info("データ更新はすでに実行中です。")
+
 
-        if result.returncode == 0:
-            st.success("データの更新が完了しました！")
-            st.session_state.last_update = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            st.error(f"データの更新に失敗しました。\nError: {result.stderr}")
+def show_refresh_status():
+    """
+    データ更新ジョブの進捗と段階ごとの所要時間をサイドバーに表示する。
+    実行中はこの部分だけを1秒ごとに再描画し、更新が完了したら
+    アプリ全体を再実行して新しいデータを読み込ませる。
+    """
+    job = get_refresh_job()
+    # このセッションが表示しているデータの世代 (初回は現在の世代)
+    st.session_state.setdefault('data_generation', job.status()['generation'])
+    running = job.status()['state'] == 'running'
+
+    @st.fragment(run_every=1.0 if running else None)
+    def refresh_panel():
+        status = job.status()
+
+        if status['state'] == 'running':
+            st.progress(status['progress'], text=f"データ更新中: {status['stage']}")
+        elif status['state'] == 'failed':
+            st.error(f"データの更新に失敗しました。\nError: {status['error']}")
+
+        if status['stages']:
+            with st.expander("更新の所要時間", expanded=status['state'] == 'running'):
+                for s in status['stages']:
+                    st.markdown(f"- {s['stage']}: {s['seconds']:.1f} 秒")
+                if status['state'] == 'failed' and status['log_tail']:
+                    st.code("\n".join(status['log_tail']))
+
+        # 別セッションで始まった更新も含め、完了したらデータを読み直す
+        if status['generation'] > st.session_state.data_generation:
+            st.session_state.data_generation = status['generation']
+            st.session_state.last_update = status['finished_at'].strftime("%Y-%m-%d %H:%M:%S")
+            st.toast("データの更新が完了しました！")
+            st.rerun(scope="app")
+        elif running and status['state'] != 'running':
+            # 失敗で終わった場合も、ポーリングを止めるため一度だけ再実行する
+            st.rerun(scope="app")
+
+    with st.sidebar:
+        refresh_panel()
 
-        progress_bar.empty()
 
-    except Exception as e:
-        st.error(f"エラーが発生しました: {str(e)}")
+# ----------------------------------------------
+# 描画の計測結果 (デバッグ表示)
+# ----------------------------------------------
+def show_profile_panel(panel, record: dict):
+    """
+    今回の描画の段階別時間と地図HTMLのサイズ、ログ全体の p50 / p95 をサイドバーに表示する。
+    """
+    with panel.container():
+        with st.expander("レンダリング計測", expanded=True):
+            st.markdown(f"**合計**: {record['total_ms']:.0f} ms")
+            if "map_html_bytes" in record:
+                st.markdown(f"**地図HTML**: {record['map_html_bytes'] / 1024:,.0f} KB")
+            st.dataframe(
+                pd.Series(record["phases"], name="ms").to_frame(),
+                use_container_width=True
+            )
+            summary = summarize()
+            if summary:
+                st.markdown("**これまでの記録 (p50 / p95)**")
+                st.dataframe(pd.DataFrame(summary).T, use_container_width=True)
 
 
 # ----------------------------------------------
@@ -352,6 +594,9 @@ def main():
     # タイトル
     st.title("熊出没情報GIS")
 
+    # 描画の段階ごとの計測 (?profile=1 または環境変数 BEAR_APP_PROFILE=1 のときだけ)
+    profiler = RenderProfiler(profiling_requested(st.query_params))
+
     # -------------------- サイドバー --------------------
     st.sidebar.header("データフィルター")
 
@@ -359,6 +604,9 @@ def main():
     if st.sidebar.button("🔄 情報を更新", help="最新の熊出没情報を取得します"):
         update_bear_data()
 
+    # 更新ジョブの進捗 (バックグラウンド実行)
+    show_refresh_status()
+
     # 最終更新日時の表示
     if 'last_update' in st.session_state:
         st.sidebar.info(f"最終更新: {st.session_state.last_update}")
@@ -370,38 +618,38 @@ def main():
         st.info("「情報を更新」ボタンを押して、データを取得してください。")
         return
 
-    # -------------------- データ読み込み --------------------
-    try:
-        df = load_and_process_data(CSV_FILE)
-    except Exception as e:
-        st.error(f"データの読み込みに失敗しました: {str(e)}")
-        return
-
     # -------------------- 路線データ読み込み --------------------
     lines_data = None
+    yaml_mtime = 0.0
     if Path(YAML_FILE).exists():
         try:
-            lines_data = load_lines_from_yaml(YAML_FILE)
+            with profiler.phase("路線YAML読み込み"):
+                lines_data = load_lines_from_yaml(YAML_FILE)
+            yaml_mtime = Path(YAML_FILE).stat().st_mtime
         except Exception as e:
             st.warning(f"路線データの読み込みに失敗: {e}")
     else:
         st.warning(f"路線データYAMLが見つかりません: {YAML_FILE}")
 
-    # --- 熊目撃データに「lines_near」列を追加(路線フィルタ用) ---
-    if lines_data:
-        df['lines_near'] = df.apply(
-            lambda row: get_lines_near_sighting(
-                row['latitude'], row['longitude'],
-                lines_data, radius_km=5  # 半径5kmで判定
-            ),
-            axis=1
-        )
-    else:
-        df['lines_near'] = [[] for _ in range(len(df))]
+    # -------------------- データ読み込み --------------------
+    # 読み込み・ソート・路線近接の判定はキャッシュし、再実行のたびには行わない
+    try:
+        pointer_path = Path(POINTER_FILE)
+        snapshot_mtime = pointer_path.stat().st_mtime if pointer_path.exists() else 0.0
+        with profiler.phase("データ読み込み"):
+            df = load_dataset(CSV_FILE, csv_path.stat().st_mtime, yaml_mtime, snapshot_mtime,
+                              datetime.now().date(), lines_data)
+    except Exception as e:
+        st.error(f"データの読み込みに失敗しました: {str(e)}")
+        return
+
+    if df.empty:
+        st.warning("表示できる目撃情報がありません。")
+        return
 
     # -------------------- 日付範囲フィルタ (サイドバー) --------------------
-    # 日付範囲の指定
-    min_date = df['date'].min().date()
+    # 日付範囲の指定 (ソート済みなので先頭が最古日)
+    min_date = df['date'].iloc[0].date()
     today = datetime.now().date()
 
     date_range = st.sidebar.date_input(
@@ -411,54 +659,149 @@ def main():
     )
 
     # 日付選択が適切かチェック
-    if isinstance(date_range, (list, tuple)) and len(date_range) == 2:
-        start_date, end_date = date_range
-    else:
+    if not (isinstance(date_range, (list, tuple)) and len(date_range) == 2):
         st.error("日付範囲を正しく指定してください（開始日と終了日の2つが必要です）。")
         return
 
+    # 統計グラフ用の事前集計 (期間で切り出す前の全データに対応)
+    with profiler.phase("集計読み込み"):
+        rollups = load_rollups(csv_path.stat().st_mtime, yaml_mtime, df, lines_data)
+    full_df = df
+
+    # 期間内の行だけを二分探索で切り出す (以降の集計はこの範囲だけを見る)
+    with profiler.phase("フィルタ"):
+        start_date, end_date = resolve_date_window(df, date_range)
+        df = slice_by_date(df, start_date, end_date)
+
     # -------------------- 路線フィルタ (サイドバー) --------------------
+    selected_line = "すべて"
     if lines_data:
         all_line_names = [line['name'] for line in lines_data['lines']]
         line_options = ["すべて"] + all_line_names
         selected_line = st.sidebar.selectbox("路線を選択", line_options)
         if selected_line != "すべて":
-            mask_line = df['lines_near'].apply(lambda lines: selected_line in lines)
-            df = df[mask_line]
+            with profiler.phase("フィルタ"):
+                mask_line = (df['lines_mask'].to_numpy() & line_bits(lines_data, selected_line)) != 0
+                df = df[mask_line]
+
+    # -------------------- 密度表示 (サイドバー) --------------------
+    show_density = st.sidebar.checkbox("密度表示", help="事前集計したセル別の目撃件数を重ねて表示します（路線フィルタは反映されません）")
+    if show_density:
+        density_label = st.sidebar.select_slider(
+            "セルの大きさ", options=list(DENSITY_RESOLUTIONS), value="約5km"
+        )
+
+    # -------------------- 再生モード (サイドバー) --------------------
+    playback_mode = st.sidebar.checkbox("再生モード", help="期間内の目撃を日付順にアニメーション表示します（地図左下のボタンとスライダーで操作）")
+    if playback_mode:
+        playback_window = st.sidebar.slider("表示する日数", min_value=1, max_value=30, value=7,
+                                            help="各日に、その日までの何日分の目撃を表示するか")
+
+    # -------------------- ホットスポット表示 (サイドバー) --------------------
+    show_hotspots = st.sidebar.checkbox("ホットスポット表示", help="半径3km・14日以内に目撃が集中した地点を表示します（路線フィルタは反映されません）")
+    with profiler.phase("ホットスポット"):
+        # クラスタ一覧は索引と一緒にキャッシュ済み。期間での絞り込みは表示する箇所で行う
+        hotspot_index = load_hotspots(csv_path.stat().st_mtime, full_df)
+
+    # -------------------- 背景地図 (サイドバー) --------------------
+    # タイルサーバーが設定されていれば、背景をローカルのタイルから表示する (オフライン対応)
+    tile_url = os.environ.get(TILE_URL_ENV) or None
+    if tile_url and not st.sidebar.checkbox("ローカルの背景地図", value=True,
+                                            help="tile_server.py で保存した背景タイルを使います（オフラインでも表示できます）"):
+        tile_url = None
 
     # -------------------- データ概要をサイドバーに表示 --------------------
     st.sidebar.markdown("### データ概要")
     st.sidebar.markdown(f"- **総データ件数**: {len(df):,} 件")
-    st.sidebar.markdown(f"- **期間**: {df['date'].min().date()} 〜 {df['date'].max().date()}")
+    if len(df):
+        # 日付順なので先頭と末尾が期間の両端
+        st.sidebar.markdown(f"- **期間**: {df['date'].iloc[0].date()} 〜 {df['date'].iloc[-1].date()}")
     st.sidebar.markdown(f"- **対象市町村数**: {df['city'].nunique()} 市町村")
 
+    # 計測結果の表示欄 (描画の最後に中身を入れる)
+    profile_panel = st.sidebar.empty() if profiler.enabled else None
+
     # -------------------- 2カラムレイアウト (地図 + 統計情報) --------------------
     col1, col2 = st.columns([2, 1])
 
     with col1:
         st.markdown("### 目撃情報マップ")
-        # 熊目撃マップ作成
-        my_map = create_folium_map(df, date_range)
-        # 路線 & 駅マーカーを追加 (YAMLがあれば)
-        if lines_data:
-            add_railway_lines_to_map(my_map, lines_data)
-            add_stations_to_map(my_map, lines_data)
-        else:
+        # 路線 & 駅マーカー付きの地図はキャッシュから取得 (YAMLがあれば)
+        with profiler.phase("地図の土台"):
+            base_map = get_static_base_map(yaml_mtime, lines_data, tile_url)
+        if not lines_data:
             st.info("路線データがないため、路線表示はありません。")
 
-        # 地図を表示
-        st_folium(my_map, width=800, height=600)
-
-    with col2:
+        # フィルタに応じて作り直すのは目撃情報のレイヤーだけ
+        with profiler.phase("レイヤー作成"):
+            if playback_mode and start_date <= end_date:
+                # 再生用の列形式データを1回だけ送り、日ごとの表示はブラウザ側で切り替える
+                layers = [create_playback_layer(df, start_date, end_date, playback_window)]
+            else:
+                layers = create_sighting_layers(df, date_range)
+            # 密度表示 (事前集計グリッドから描画)
+            if show_density:
+                grid = load_density_grid(CSV_FILE, csv_path.stat().st_mtime)
+                layers.append(create_density_layer(grid, DENSITY_RESOLUTIONS[density_label], date_range))
+            # ホットスポット表示
+            if show_hotspots:
+                layers.append(create_hotspot_layer(hotspot_index.cluster_table(start_date, end_date)))
+
+        # 地図を表示 (st_folium によるシリアライズを含む)
+        with profiler.phase("地図描画"):
+            render_map_with_layers(base_map, layers, width=800, height=600, profiler=profiler)
+
+    with col2, profiler.phase("統計グラフ"):
         st.markdown("### 統計情報")
         # 時系列グラフと地域分布グラフをタブ切り替えで表示
-        tab1, tab2 = st.tabs(["時系列推移", "地域分布"])
+        tab1, tab2, tab3, tab4 = st.tabs(["時系列推移", "地域分布", "ホットスポット", "路線区間"])
 
+        # 生データは集計し直さず、事前集計キューブから取り出す
         with tab1:
-            st.plotly_chart(create_time_series_plot(df), use_container_width=True)
+            freq = st.radio(
+                "集計単位", list(TIME_SERIES_FREQS),
+                format_func=TIME_SERIES_FREQS.get, horizontal=True
+            )
+            counts = rollups.time_series(freq, start_date, end_date, line=selected_line)
+            st.plotly_chart(create_time_series_plot(counts, freq), use_container_width=True)
 
         with tab2:
-            st.plotly_chart(create_city_bar_chart(df), use_container_width=True)
+            city_counts = rollups.city_counts(start_date, end_date, line=selected_line)
+            st.plotly_chart(create_city_bar_chart(city_counts), use_container_width=True)
+
+        with tab3:
+            hotspot_table = hotspot_index.cluster_table(start_date, end_date)
+            if hotspot_table.empty:
+                st.info("選択期間にホットスポットはありません。")
+            else:
+                st.dataframe(
+                    hotspot_table.assign(
+                        start=hotspot_table['start'].dt.date,
+                        end=hotspot_table['end'].dt.date,
+                    ).rename(columns={
+                        'count': '件数', 'start': '開始日', 'end': '終了日', 'radius_km': '半径(km)',
+                        'prefecture': '都道府県', 'city': '市町村'
+                    })[['都道府県', '市町村', '件数', '開始日', '終了日', '半径(km)']],
+                    hide_index=True, use_container_width=True
+                )
+
+        # 路線区間ごとの件数は事前集計ビューから取り出す (期間の終了日を基準にした直近の週)
+        with tab4:
+            if not lines_data:
+                st.info("路線データがないため、路線区間の集計はありません。")
+            else:
+                segments = load_segment_risk(csv_path.stat().st_mtime, yaml_mtime, full_df, lines_data)
+                st.caption(f"{end_date} までの直近{RECENT_WEEKS}週と、その前の{BASELINE_WEEKS}週の比較"
+                           "（傾向: 正なら増加、負なら減少）")
+                st.dataframe(
+                    segments.segment_table(end_date, line=selected_line).rename(columns={
+                        'line': '路線', 'segment': '区間', 'recent': f'直近{RECENT_WEEKS}週',
+                        'baseline': f'前{BASELINE_WEEKS}週', 'trend': '傾向'
+                    }),
+                    hide_index=True, use_container_width=True
+                )
+                weekly = segments.weekly_counts(end_date, line=selected_line)
+                st.plotly_chart(create_segment_heatmap(weekly), use_container_width=True)
 
     # -------------------- フッター --------------------
     st.markdown("---")
@@ -466,10 +809,14 @@ def main():
     ### 使い方
     1. サイドバーの「情報を更新」ボタンで最新データを取得できます
     2. サイドバーで期間と路線を選択してデータをフィルタリングできます（市町村フィルタは削除）
-    3. 地図は「通常表示」「クラスター表示」など、レイヤーコントロールで切り替え可能です
-    4. 統計情報タブでは、時系列推移と市町村別の目撃件数を確認できます
+    3. 地図は「通常表示」「クラスター表示」など、レイヤーコントロールで切り替え可能です（「再生モード」では日付順のアニメーション表示）
+    4. 統計情報タブでは、時系列推移と市町村別の目撃件数、目撃が集中したホットスポット、路線区間ごとの週別件数を確認できます
     """)
 
+    # -------------------- 計測結果 (デバッグ表示) --------------------
+    if profiler.enabled:
+        show_profile_panel(profile_panel, profiler.finish())
+
 
 # ----------------------------------------------
 # メイン起動
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+パイプラインが作った最終データを、版番号付きの Arrow IPC (Feather v2) ファイルとして公開し、
+アプリのプロセスが読み取り専用でメモリマップして使うためのモジュール。
+
+- ファイルは圧縮せずに書く (圧縮するとメモリマップのまま読めず、展開のコピーが必要になる)
+- 一度書いた版のファイルは書き換えない。新しい版は別ファイルに書き、
+  「現在の版」を指すポインタファイル (bear_sightings_current.json) を os.replace で差し替える
+- 同じホストで動く複数のアプリプロセスは、同じファイルのページキャッシュを共有する。
+  CSVの解析も不要になる
+
+pyarrow が無い環境では publish_snapshot は何もせず、load_snapshot は None を返す
+(アプリは従来どおりCSVを読む)。
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from sightings_data import compact_sightings
+from geo_utils import lines_near_mask
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+# 版ごとのファイルを置くディレクトリと、現在の版を指すポインタ
+SNAPSHOT_DIR = "snapshots"
+POINTER_FILE = "bear_sightings_current.json"
+
+# 残しておく過去の版の数 (差し替え直後にまだ古い版を読んでいるプロセスのため)
+KEEP_SNAPSHOTS = 3
+
+# スナップショットに入れる列 (is_recent は日付で変わるため読み込み時に計算する)
+SNAPSHOT_COLUMNS = ['prefecture', 'date', 'city', 'location', 'longitude', 'latitude', 'lines_mask']
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def read_pointer(pointer_path: str = POINTER_FILE) -> dict:
+    """
+    現在の版の情報 ({"version", "path", "rows", "lines_mtime", ...}) を返す。無ければ None。
+    """
+    if not os.path.exists(pointer_path):
+        return None
+    with open(pointer_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# ----------------------------------------------
+# 公開 (パイプライン側)
+# ----------------------------------------------
+def publish_snapshot(df: pd.DataFrame, version: int, lines_data: dict = None, lines_mtime: float = 0.0,
+                     snapshot_dir: str = SNAPSHOT_DIR, pointer_path: str = POINTER_FILE) -> str:
+    """
+    load_and_process_data の結果 df を、版 version のスナップショットとして書き出し、
+    ポインタを差し替える。書き出したファイルのパスを返す (pyarrow が無ければ None)。
+    lines_mtime には lines_mask の計算に使った路線YAMLの更新時刻を渡す。
+    """
+    if pa is None:
+        return None
+
+    compact = compact_sightings(df, lines_data, radius_km=5)[SNAPSHOT_COLUMNS]
+    table = pa.Table.from_pandas(compact, preserve_index=False)
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    path = os.path.join(snapshot_dir, f"bear_sightings_v{version}_{stamp}.arrow")
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+
+    pointer = {
+        "version": int(version),
+        "path": path,
+        "rows": table.num_rows,
+        "lines_mtime": float(lines_mtime),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    tmp_pointer = pointer_path + ".tmp"
+    with open(tmp_pointer, 'w', encoding='utf-8') as f:
+        json.dump(pointer, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_pointer, pointer_path)
+
+    _remove_old_snapshots(snapshot_dir, keep=path)
+    return path
+
+
+def _remove_old_snapshots(snapshot_dir: str, keep: str):
+    """
+    新しいものから KEEP_SNAPSHOTS 個を残して古い版を消す。
+    (Linux では、すでにメモリマップしているプロセスは消した後も読み続けられる)
+    """
+    files = sorted(Path(snapshot_dir).glob("bear_sightings_v*.arrow"),
+                   key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[KEEP_SNAPSHOTS:]:
+        if str(old) != keep:
+            old.unlink(missing_ok=True)
+
+
+# ----------------------------------------------
+# 読み込み (アプリ側)
+# ----------------------------------------------
+def load_snapshot(lines_data: dict = None, lines_mtime: float = 0.0,
+                  pointer_path: str = POINTER_FILE) -> pd.DataFrame:
+    """
+    現在の版をメモリマップで開き、compact_sightings と同じ列構成の DataFrame を返す。
+    数値・日付の列はマップした領域をそのまま参照する (コピーしない)。
+    スナップショットの路線判定が路線YAMLより古い場合は lines_mask だけ計算し直す。
+    pyarrow やスナップショットが無い場合は None を返す。
+    """
+    pointer = read_pointer(pointer_path)
+    if pa is None or pointer is None or not os.path.exists(pointer["path"]):
+        return None
+
+    source = pa.memory_map(pointer["path"], 'r')
+    table = pa.ipc.open_file(source).read_all()
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+
+    if lines_mtime > pointer.get("lines_mtime", 0.0):
+        df['lines_mask'] = lines_near_mask(df['latitude'], df['longitude'], lines_data, radius_km=5)
+
+    # 過去1週間のフラグ (load_and_process_data と同じ)
+    one_week_ago = datetime.now() - timedelta(days=7)
+    df['is_recent'] = df['date'] >= one_week_ago
+    return df
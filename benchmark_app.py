@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+アプリの処理経路が、データ量に対してどこで伸びなくなるかを調べるベンチマーク。
+
+実データ (約540件) は小さく、行数や「行数 × 駅数」に比例する処理の遅さが表に出ないため、
+3県の範囲内に収まる合成データ (bear_sightings_with_coords.csv と同じ列) と
+合成の路線ネットワーク (lines.yaml と同じ構造) を作り、次の段階の時間とメモリを計測する。
+  - load_and_process_data   (CSV読み込み・前処理)
+  - lines_near              (路線近接の判定。add_lines_near_column)
+  - compact_sightings       (アプリが共有する省メモリ表現)
+  - rollups                 (統計グラフ用の事前集計)
+  - create_folium_map       (マーカー付き地図の生成とHTML化。streamlit/folium がある場合のみ)
+  - create_time_series_plot / create_city_bar_chart (plotly がある場合のみ)
+
+時間は計測用のトレースなしで測り、メモリ (tracemalloc のピーク) は別にもう一度実行して測る。
+結果は行数ごとの曲線として JSON に書き出す。
+
+使い方:
+  python benchmark_app.py --sizes 10000 100000 1000000 --lines 20 --stations 15 --out bench_app.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from geo_utils import add_lines_near_column, load_lines_from_yaml
+from rollups import build_rollups
+from sightings_data import load_and_process_data, compact_sightings
+
+# 既定の行数 (1万〜100万)
+DEFAULT_SIZES = [10_000, 30_000, 100_000, 300_000, 1_000_000]
+
+# create_folium_map はマーカー1つずつの処理なので、この行数を超えたら計測しない
+MAP_MAX_ROWS = 50_000
+
+# 合成データの各県の範囲 (南, 西, 北, 東) と件数の比率 (実データのおおよその比率)
+PREFECTURE_BOUNDS = {
+    "山梨県": ((35.20, 138.20, 35.95, 139.10), 0.57),
+    "神奈川県": ((35.15, 139.00, 35.65, 139.40), 0.22),
+    "静岡県": ((34.70, 137.50, 35.60, 139.10), 0.21),
+}
+
+# 合成データの日付範囲と、月ごとの出没の多さ (4〜11月に多い)
+DATE_START = "2019-04-01"
+DATE_END = "2024-12-31"
+MONTH_WEIGHTS = [0.2, 0.2, 0.3, 1.0, 1.4, 1.8, 1.6, 1.4, 1.2, 1.5, 0.9, 0.3]
+
+# 1県あたりの市町村数と、市町村の中心からのばらつき (度。約3km)
+CITIES_PER_PREFECTURE = 40
+CITY_SPREAD_DEG = 0.03
+
+
+# ----------------------------------------------
+# 合成データの生成
+# ----------------------------------------------
+def generate_sightings(n: int, seed: int = 0) -> pd.DataFrame:
+    """
+    n 件の合成の目撃情報 (prefecture, date, city, location, longitude, latitude) を作る。
+    各県に市町村の中心点を置き、その周りにばらつかせることで、実データのような偏りを持たせる。
+    """
+    rng = np.random.default_rng(seed)
+    prefs = list(PREFECTURE_BOUNDS)
+    weights = np.array([PREFECTURE_BOUNDS[p][1] for p in prefs])
+    pref_idx = rng.choice(len(prefs), size=n, p=weights / weights.sum())
+    city_idx = rng.integers(0, CITIES_PER_PREFECTURE, size=n)
+
+    lat = np.empty(n)
+    lon = np.empty(n)
+    for i, pref in enumerate(prefs):
+        (south, west, north, east), _ = PREFECTURE_BOUNDS[pref]
+        centers = np.column_stack([
+            rng.uniform(south, north, CITIES_PER_PREFECTURE),
+            rng.uniform(west, east, CITIES_PER_PREFECTURE),
+        ])
+        rows = pref_idx == i
+        lat[rows] = centers[city_idx[rows], 0] + rng.normal(0, CITY_SPREAD_DEG, rows.sum())
+        lon[rows] = centers[city_idx[rows], 1] + rng.normal(0, CITY_SPREAD_DEG, rows.sum())
+
+    days = pd.date_range(DATE_START, DATE_END, freq="D")
+    day_weights = np.array([MONTH_WEIGHTS[d.month - 1] for d in days])
+    dates = days[rng.choice(len(days), size=n, p=day_weights / day_weights.sum())]
+
+    df = pd.DataFrame({
+        "prefecture": np.array(prefs)[pref_idx],
+        "date": dates.strftime("%Y-%m-%d"),
+        "city": [f"{prefs[p][:2]}{c:02d}市" for p, c in zip(pref_idx.tolist(), city_idx.tolist())],
+        "location": [f"地区{k}" for k in rng.integers(0, 500, size=n).tolist()],
+        "longitude": lon.round(6),
+        "latitude": lat.round(6),
+    })
+    return df.sort_values("date", kind="mergesort").reset_index(drop=True)
+
+
+def generate_lines(n_lines: int, stations_per_line: int, seed: int = 0) -> dict:
+    """
+    3県の範囲を走る合成の路線ネットワーク (lines.yaml と同じ構造の辞書) を作る。
+    各路線は、ランダムな始点から少しずつ向きを変えながら約2km間隔で駅を置く。
+    """
+    rng = np.random.default_rng(seed + 1)
+    lines = []
+    for i in range(n_lines):
+        lat, lon = rng.uniform(34.8, 35.9), rng.uniform(137.6, 139.6)
+        heading = rng.uniform(0, 2 * np.pi)
+        stations = []
+        for j in range(stations_per_line):
+            stations.append({"name": f"駅{i:02d}-{j:02d}", "lat": round(float(lat), 6), "lon": round(float(lon), 6)})
+            heading += rng.normal(0, 0.3)
+            lat += 0.018 * np.sin(heading)
+            lon += 0.022 * np.cos(heading)
+        lines.append({"name": f"合成線{i:02d}", "stations": stations})
+    return {"lines": lines}
+
+
+def write_dataset(out_dir: str, n: int, n_lines: int, stations_per_line: int, seed: int = 0) -> tuple:
+    """
+    合成CSVと合成路線YAMLを out_dir に書き出し、(CSVのパス, YAMLのパス) を返す。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    csv_path = os.path.join(out_dir, f"bear_sightings_{n}.csv")
+    yaml_path = os.path.join(out_dir, f"lines_{n_lines}x{stations_per_line}.yaml")
+    generate_sightings(n, seed).to_csv(csv_path, index=False, encoding="utf-8")
+    with open(yaml_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(generate_lines(n_lines, stations_per_line, seed), f, allow_unicode=True)
+    return csv_path, yaml_path
+
+
+# ----------------------------------------------
+# 計測
+# ----------------------------------------------
+def measure(func, *args) -> dict:
+    """
+    func(*args) を1回実行して時間を測り、tracemalloc を有効にしてもう1回実行してメモリのピークを測る。
+    戻り値は {"seconds", "peak_mb", "result"} (result は時間計測側の戻り値)。
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": round(seconds, 4), "peak_mb": round(peak / 2**20, 2), "result": result}
+
+
+def _load_app():
+    """
+    app.py の描画関数を読み込む。streamlit / folium / plotly が無ければ None。
+    """
+    try:
+        import app
+    except ImportError as e:
+        print(f"[bench] app.py を読み込めないため地図・グラフは計測しません: {e}", file=sys.stderr)
+        return None
+    return app
+
+
+def run_benchmark(sizes: list, n_lines: int, stations_per_line: int,
+                  data_dir: str, map_max_rows: int = MAP_MAX_ROWS, seed: int = 0) -> dict:
+    """
+    行数ごとに合成データを作り、各段階の時間とメモリを計測した結果を返す。
+    """
+    app = _load_app()
+    results = []
+    for n in sizes:
+        csv_path, yaml_path = write_dataset(data_dir, n, n_lines, stations_per_line, seed)
+        lines_data = load_lines_from_yaml(yaml_path)
+        row = {"rows": n, "csv_bytes": os.path.getsize(csv_path), "stages": {}}
+
+        def record(name, func, *args):
+            m = measure(func, *args)
+            row["stages"][name] = {"seconds": m["seconds"], "peak_mb": m["peak_mb"]}
+            print(f"[bench] {n:>9,} 行  {name:<24} {m['seconds']:8.3f} s  {m['peak_mb']:9.1f} MB")
+            return m["result"]
+
+        df = record("load_and_process_data", load_and_process_data, csv_path)
+        record("lines_near", lambda d: add_lines_near_column(d.copy(), lines_data), df)
+        compact = record("compact_sightings", compact_sightings, df, lines_data)
+        rollups = record("rollups", build_rollups, compact, lines_data)
+
+        if app is not None:
+            date_range = (df["date"].iloc[0].date(), df["date"].iloc[-1].date())
+            if n <= map_max_rows:
+                record("create_folium_map",
+                       lambda d: app.create_folium_map(d, date_range).get_root().render(), compact)
+            counts = rollups.time_series("D", *date_range)
+            record("create_time_series_plot", app.create_time_series_plot, counts, "D")
+            record("create_city_bar_chart", app.create_city_bar_chart, rollups.city_counts(*date_range))
+
+        results.append(row)
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "lines": n_lines,
+        "stations_per_line": stations_per_line,
+        "map_max_rows": map_max_rows,
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成データでアプリの処理経路の伸び方を計測する")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="計測する行数")
+    parser.add_argument("--lines", type=int, default=20, help="合成路線の数")
+    parser.add_argument("--stations", type=int, default=15, help="1路線あたりの駅数")
+    parser.add_argument("--map-max-rows", type=int, default=MAP_MAX_ROWS,
+                        help="create_folium_map を計測する最大行数")
+    parser.add_argument("--data-dir", help="合成データの保存先 (省略時は一時ディレクトリ)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_app.json", help="結果のJSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report = run_benchmark(args.sizes, args.lines, args.stations,
+                               args.data_dir or tmp_dir, args.map_max_rows, args.seed)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print("計測結果:", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+座標付与した目撃地点が、記載の市町村の境界内にあるかを一括で確認するモジュール。
+
+「以下に掲載がない場合」の代表点や、市町村名の分割の誤り (parse_kanagawa_location など) で
+別の市町村に点が置かれることがあるため、市町村界のポリゴンと照合して
+  - 一致 (ok) / 不一致 (mismatch) / 境界データに無い市町村 (unknown_city) / 座標なし (no_coords)
+を判定し、不一致の点が実際にある市町村も求める。repair_mismatches は、不一致の点を
+記載の市町村の内部の代表点に置き換える。
+
+境界データは国土数値情報「行政区域」(N03) の GeoJSON を想定する
+(属性 N03_001: 都道府県, N03_003: 郡・政令市, N03_004: 市区町村)。
+リポジトリには含めないので、対象の県のファイルを結合して BOUNDARY_FILE に置く。
+
+判定は点ごとのポリゴン判定のループではなく、次の索引を使って NumPy でまとめて行う。
+  - 全ポリゴンの辺を1つの配列にし、緯度方向の帯 (BAND_DEG 度ごと) と市町村の組で並べておく
+  - 点が市町村の内部にあるかは、点の緯度の帯にある、その市町村の辺だけで
+    交差数判定 (右向きの半直線と交わる辺の数が奇数なら内部) をする
+  - 政令市の区や飛び地は、同じ名前の複数の単位として持ち、どれかの内部なら一致とする
+"""
+
+import json
+import re
+
+import numpy as np
+import pandas as pd
+
+# 市町村界の GeoJSON と、不一致の一覧の保存先
+BOUNDARY_FILE = "municipal_boundaries.geojson"
+BOUNDARY_REPORT_FILE = "bear_boundary_mismatches.csv"
+
+# 辺の索引の帯の幅 (度。約1km)
+BAND_DEG = 0.01
+
+# 一度に判定する点の数 (点 × 候補の辺 の配列の大きさを抑える)
+CHUNK_POINTS = 100_000
+
+# 郡名を取り除く (例: "足柄下郡箱根町" → "箱根町")
+_GUN_PATTERN = re.compile(r"^.+?郡(?=.+[町村]$)")
+
+
+def normalize_city(city) -> str:
+    """
+    照合用の市町村名 (前後の空白と郡名を取り除いたもの)。
+    """
+    if city is None or (isinstance(city, float) and np.isnan(city)):
+        return ""
+    return _GUN_PATTERN.sub("", str(city).strip())
+
+
+def _feature_names(props: dict) -> tuple:
+    """
+    GeoJSON の属性から (都道府県, 単位の名前, 照合に使う名前のリスト) を返す。
+    政令市の区は "静岡市葵区" を単位の名前とし、"静岡市" でも照合できるようにする。
+    """
+    pref = props.get("N03_001") or props.get("prefecture") or ""
+    upper = props.get("N03_003") or ""
+    name = props.get("N03_004") or props.get("name") or props.get("city") or ""
+    if upper.endswith("市") and name.endswith("区"):
+        return pref, upper + name, [upper + name, upper]
+    return pref, name, [name]
+
+
+def _rings(geometry: dict) -> list:
+    """
+    Polygon / MultiPolygon の全リング (外周と穴) を (頂点数, 2) の配列のリストで返す。
+    """
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        return []
+    return [np.asarray(ring, dtype=np.float64)[:, :2] for polygon in polygons for ring in polygon if len(ring) >= 3]
+
+
+def _ring_area(ring: np.ndarray) -> float:
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _interior_point(rings: list) -> tuple:
+    """
+    単位の内部にある代表点 (経度, 緯度)。最大のリングの重心の緯度で水平に切り、
+    全リングとの交点で区切られた内部の区間のうち最も長いものの中点をとる (穴も避けられる)。
+    """
+    largest = max(rings, key=_ring_area)
+    y = float(largest[:, 1].mean())
+    xs = []
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        crossing = (y1 > y) != (y2 > y)
+        xs.append(x1[crossing] + (y - y1[crossing]) * (x2[crossing] - x1[crossing]) / (y2[crossing] - y1[crossing]))
+    xs = np.sort(np.concatenate(xs))
+    if len(xs) < 2:
+        return float(largest[:, 0].mean()), y
+    starts, ends = xs[0::2][:len(xs) // 2], xs[1::2]
+    widest = int(np.argmax(ends - starts))
+    return float((starts[widest] + ends[widest]) / 2), y
+
+
+# ----------------------------------------------
+# 境界の索引
+# ----------------------------------------------
+class BoundaryIndex:
+    """
+    市町村界の辺を、(単位, 緯度の帯) の順に並べた配列として持つ。
+      units:     [(都道府県, 単位の名前), ...]
+      names:     (都道府県, 照合に使う名前) -> 単位番号のリスト
+      edge_*:    辺の両端の座標 (経度 x, 緯度 y)
+      key_start: (単位 × 帯数 + 帯) ごとの辺の開始位置 (CSR 形式)
+    """
+
+    def __init__(self, features: list, band_deg: float = BAND_DEG):
+        self.band_deg = band_deg
+        self.units = []
+        self.names = {}
+        unit_index = {}
+        unit_rings = []
+        for feature in features:
+            pref, unit_name, match_names = _feature_names(feature.get("properties") or {})
+            rings = _rings(feature.get("geometry"))
+            if not unit_name or not rings:
+                continue
+            key = (pref, unit_name)
+            if key not in unit_index:
+                unit_index[key] = len(self.units)
+                self.units.append(key)
+                unit_rings.append([])
+                for name in match_names:
+                    self.names.setdefault((pref, name), []).append(unit_index[key])
+            unit_rings[unit_index[key]].extend(rings)
+
+        self.interior = np.array([_interior_point(rings) for rings in unit_rings], dtype=np.float64).reshape(-1, 2)
+        self.bbox = np.array([
+            [min(r[:, 0].min() for r in rings), min(r[:, 1].min() for r in rings),
+             max(r[:, 0].max() for r in rings), max(r[:, 1].max() for r in rings)]
+            for rings in unit_rings
+        ], dtype=np.float64).reshape(-1, 4)
+        self._build_edges(unit_rings)
+
+    def _build_edges(self, unit_rings: list):
+        """
+        全リングの辺を、通る帯ごとに複製して (単位, 帯) の順に並べる。
+        """
+        starts, ends, owners = [], [], []
+        for unit, rings in enumerate(unit_rings):
+            for ring in rings:
+                starts.append(ring)
+                ends.append(np.roll(ring, -1, axis=0))
+                owners.append(np.full(len(ring), unit, dtype=np.int64))
+        if not starts:
+            starts = ends = [np.empty((0, 2))]
+            owners = [np.empty(0, dtype=np.int64)]
+        p1, p2, owner = np.concatenate(starts), np.concatenate(ends), np.concatenate(owners)
+
+        self.y0 = float(min(p1[:, 1].min(), p2[:, 1].min())) if len(p1) else 0.0
+        band_lo = self._band(np.minimum(p1[:, 1], p2[:, 1]))
+        band_hi = self._band(np.maximum(p1[:, 1], p2[:, 1]))
+        self.n_bands = int(band_hi.max()) + 1 if len(p1) else 1
+
+        # 辺を、通る帯の数だけ複製する
+        spans = band_hi - band_lo + 1
+        edge = np.repeat(np.arange(len(p1)), spans)
+        band = np.repeat(band_lo, spans) + (np.arange(len(edge)) - np.repeat(np.cumsum(spans) - spans, spans))
+        keys = owner[edge] * self.n_bands + band
+        order = np.argsort(keys, kind="stable")
+        edge, keys = edge[order], keys[order]
+
+        self.edge_x1, self.edge_y1 = p1[edge, 0], p1[edge, 1]
+        self.edge_x2, self.edge_y2 = p2[edge, 0], p2[edge, 1]
+        n_keys = len(self.units) * self.n_bands
+        self.key_start = np.searchsorted(keys, np.arange(n_keys + 1))
+
+    def _band(self, y) -> np.ndarray:
+        return np.floor((np.asarray(y, dtype=np.float64) - self.y0) / self.band_deg).astype(np.int64)
+
+    # ---------- 判定 ----------
+    def contains(self, lon, lat, units) -> np.ndarray:
+        """
+        点 i (lon[i], lat[i]) が単位 units[i] の内部にあるかの真偽値の配列。
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        units = np.asarray(units, dtype=np.int64)
+        inside = np.zeros(len(lon), dtype=bool)
+        for lo in range(0, len(lon), CHUNK_POINTS):
+            hi = min(lo + CHUNK_POINTS, len(lon))
+            inside[lo:hi] = self._contains_chunk(lon[lo:hi], lat[lo:hi], units[lo:hi])
+        return inside
+
+    def _contains_chunk(self, px, py, units) -> np.ndarray:
+        band = self._band(py)
+        valid = (band >= 0) & (band < self.n_bands)
+        keys = units * self.n_bands + np.clip(band, 0, self.n_bands - 1)
+        first = np.where(valid, self.key_start[keys], 0)
+        count = np.where(valid, self.key_start[keys + 1] - first, 0)
+
+        # (点, 候補の辺) の組を作り、右向きの半直線と交わる辺を数える
+        point = np.repeat(np.arange(len(px)), count)
+        edge = np.repeat(first - (np.cumsum(count) - count), count) + np.arange(count.sum())
+        x1, y1 = self.edge_x1[edge], self.edge_y1[edge]
+        x2, y2 = self.edge_x2[edge], self.edge_y2[edge]
+        qx, qy = px[point], py[point]
+        straddle = (y1 > qy) != (y2 > qy)
+        dy = np.where(straddle, y2 - y1, 1.0)
+        crosses = straddle & (qx < x1 + (qy - y1) * (x2 - x1) / dy)
+        return np.bincount(point, weights=crosses, minlength=len(px)).astype(np.int64) % 2 == 1
+
+    def locate(self, lon, lat) -> np.ndarray:
+        """
+        各点を内部に含む単位の番号 (どれにも含まれなければ -1)。
+        外接矩形に点が入る単位だけを候補にして contains で判定する。
+        """
+        lon = np.asarray(lon, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        found = np.full(len(lon), -1, dtype=np.int64)
+        # 点 × 単位 の外接矩形判定の配列が CHUNK_POINTS 程度に収まるよう分ける
+        step = max(1, CHUNK_POINTS // max(len(self.units), 1))
+        for lo in range(0, len(lon), step):
+            hi = min(lo + step, len(lon))
+            x, y = lon[lo:hi, None], lat[lo:hi, None]
+            point, unit = np.nonzero((x >= self.bbox[:, 0]) & (x <= self.bbox[:, 2])
+                                     & (y >= self.bbox[:, 1]) & (y <= self.bbox[:, 3]))
+            inside = self.contains(lon[lo:hi][point], lat[lo:hi][point], unit)
+            found[lo + point[inside]] = unit[inside]
+        return found
+
+    def claim_units(self, prefectures, cities) -> list:
+        """
+        各行の (都道府県, 市町村名) に当たる単位番号のリスト (見つからなければ空リスト)。
+        名前の組み合わせごとに1回だけ引く。
+        """
+        pairs = pd.Series(list(zip(map(str, prefectures), cities)), dtype=object)
+        codes, uniques = pd.factorize(pairs)
+        units = [self.names.get((pref, normalize_city(city)), []) for pref, city in uniques]
+        return [units[c] for c in codes]
+
+
+def load_boundaries(path: str = BOUNDARY_FILE, band_deg: float = BAND_DEG) -> BoundaryIndex:
+    """
+    市町村界の GeoJSON (FeatureCollection) を読み込んで索引を作る。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return BoundaryIndex(data.get("features", []), band_deg)
+
+
+# ----------------------------------------------
+# 目撃情報の検査と修正
+# ----------------------------------------------
+def check_boundaries(df: pd.DataFrame, index: BoundaryIndex) -> pd.DataFrame:
+    """
+    df (prefecture, city, latitude, longitude 列) の各行について、
+    boundary_status (ok / mismatch / unknown_city / no_coords) と
+    actual_city (点を含む市町村。どこにも含まれなければ空文字) の2列を df と同じ index で返す。
+    """
+    lon = pd.to_numeric(df["longitude"], errors="coerce").to_numpy(np.float64)
+    lat = pd.to_numeric(df["latitude"], errors="coerce").to_numpy(np.float64)
+    claims = index.claim_units(df["prefecture"].tolist(), df["city"].tolist())
+    status = np.full(len(df), "ok", dtype=object)
+    has_coords = ~(np.isnan(lon) | np.isnan(lat))
+    status[~has_coords] = "no_coords"
+    known = np.array([len(c) > 0 for c in claims], dtype=bool)
+    status[has_coords & ~known] = "unknown_city"
+
+    # 記載の市町村の単位 (政令市なら各区) ごとに (行, 単位) の組を作って判定する
+    rows = np.nonzero(has_coords & known)[0]
+    pair_rows = np.repeat(rows, [len(claims[i]) for i in rows])
+    pair_units = np.array([u for i in rows for u in claims[i]], dtype=np.int64)
+    inside = index.contains(lon[pair_rows], lat[pair_rows], pair_units)
+    matched = np.zeros(len(df), dtype=bool)
+    matched[pair_rows[inside]] = True
+    mismatch = has_coords & known & ~matched
+    status[mismatch] = "mismatch"
+
+    actual = np.full(len(df), "", dtype=object)
+    mismatch_rows = np.nonzero(mismatch)[0]
+    if len(mismatch_rows):
+        found = index.locate(lon[mismatch_rows], lat[mismatch_rows])
+        actual[mismatch_rows] = [index.units[u][1] if u >= 0 else "" for u in found.tolist()]
+
+    return pd.DataFrame({"boundary_status": status, "actual_city": actual}, index=df.index)
+
+
+def repair_mismatches(df: pd.DataFrame, result: pd.DataFrame, index: BoundaryIndex) -> pd.DataFrame:
+    """
+    境界と一致しない行の座標を、記載の市町村の内部の代表点 (政令市なら最も大きい区) に置き換えた
+    コピーを返す。
+    """
+    df = df.copy()
+    rows = np.nonzero((result["boundary_status"] == "mismatch").to_numpy())[0]
+    if len(rows) == 0:
+        return df
+    claims = index.claim_units(df["prefecture"].iloc[rows].tolist(), df["city"].iloc[rows].tolist())
+    areas = (index.bbox[:, 2] - index.bbox[:, 0]) * (index.bbox[:, 3] - index.bbox[:, 1])
+    target = np.array([max(units, key=lambda u: areas[u]) for units in claims], dtype=np.int64)
+    lon_col, lat_col = df.columns.get_loc("longitude"), df.columns.get_loc("latitude")
+    df.iloc[rows, lon_col] = np.round(index.interior[target, 0], 6)
+    df.iloc[rows, lat_col] = np.round(index.interior[target, 1], 6)
+    return df
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+パイプラインの実行ごとに、前回の最終CSVとの差分 (追加・更新・削除) を求めて
+版番号付きの JSONL 変更ログとして書き出すモジュール。
+
+各行は「都道府県・日付・市町村・場所 + 同じ値の中での出現順」をハッシュしたキーで識別し、
+座標などを含む行全体のハッシュを比べて更新を検出する。
+行同士を総当たりで比べることはせず、キー → ハッシュの辞書の突き合わせだけで差分を出す。
+
+変更ログ (bear_sightings_changes.jsonl) の1行:
+  {"version": 3, "op": "insert", "key": "...", "row": {...}}
+  {"version": 3, "op": "update", "key": "...", "row": {...}, "old": {...}}
+  {"version": 3, "op": "retract", "key": "...", "old": {...}}
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+
+# 変更ログと、最新の版番号を記録するファイル
+CHANGE_LOG_FILE = "bear_sightings_changes.jsonl"
+VERSION_FILE = "bear_sightings_version.json"
+
+# 行を識別するキーに使う列と、変更検出の対象にする列
+KEY_COLUMNS = ['prefecture', 'date', 'city', 'location']
+VALUE_COLUMNS = KEY_COLUMNS + ['longitude', 'latitude']
+
+
+# ----------------------------------------------
+# キーとハッシュ
+# ----------------------------------------------
+def _records(df: pd.DataFrame) -> list:
+    """
+    df を VALUE_COLUMNS だけの辞書のリストにする (NaN は None)。
+    """
+    frame = df.reindex(columns=VALUE_COLUMNS).astype(object)
+    frame = frame.where(pd.notna(frame), None)
+    return frame.to_dict(orient='records')
+
+
+def _digest(value) -> str:
+    payload = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def keyed_rows(df: pd.DataFrame) -> dict:
+    """
+    行をキー → 行の辞書 にする。同じキー列の値を持つ行は、出現順の番号で区別する。
+    """
+    rows = {}
+    occurrences = {}
+    for record in _records(df):
+        natural = tuple(record[c] for c in KEY_COLUMNS)
+        n = occurrences.get(natural, 0)
+        occurrences[natural] = n + 1
+        rows[_digest(list(natural) + [n])] = record
+    return rows
+
+
+# ----------------------------------------------
+# 差分
+# ----------------------------------------------
+def diff_datasets(prev_df, df: pd.DataFrame) -> list:
+    """
+    前回のデータ prev_df (無ければ None) と今回の df を比べ、変更のリストを返す。
+    各要素は {"op": "insert"|"update"|"retract", "key": ..., "row": ..., "old": ...}。
+    """
+    old_rows = keyed_rows(prev_df) if prev_df is not None else {}
+    new_rows = keyed_rows(df)
+    old_hashes = {key: _digest(row) for key, row in old_rows.items()}
+
+    changes = []
+    for key, row in new_rows.items():
+        old_hash = old_hashes.get(key)
+        if old_hash is None:
+            changes.append({"op": "insert", "key": key, "row": row})
+        elif old_hash != _digest(row):
+            changes.append({"op": "update", "key": key, "row": row, "old": old_rows[key]})
+    for key, row in old_rows.items():
+        if key not in new_rows:
+            changes.append({"op": "retract", "key": key, "old": row})
+    return changes
+
+
+def changes_to_frames(changes: list) -> tuple:
+    """
+    変更のリストを (加算する行, 減算する行) の2つの DataFrame にする。
+    更新は「古い行を減算 + 新しい行を加算」として扱う。集計の差分更新に使う。
+    """
+    added = [c["row"] for c in changes if c["op"] in ("insert", "update")]
+    removed = [c["old"] for c in changes if c["op"] in ("update", "retract")]
+    return (pd.DataFrame(added, columns=VALUE_COLUMNS),
+            pd.DataFrame(removed, columns=VALUE_COLUMNS))
+
+
+def apply_changes(rows: dict, changes: list) -> dict:
+    """
+    keyed_rows() の辞書に変更を適用する (購読側が全件を読み直さずに最新化するため)。
+    """
+    for change in changes:
+        if change["op"] == "retract":
+            rows.pop(change["key"], None)
+        else:
+            rows[change["key"]] = change["row"]
+    return rows
+
+
+# ----------------------------------------------
+# 変更ログの読み書き
+# ----------------------------------------------
+def current_version(version_path: str = VERSION_FILE) -> int:
+    """
+    最後に書き出した変更ログの版番号を返す (まだ無ければ0)。
+    """
+    if not os.path.exists(version_path):
+        return 0
+    with open(version_path, 'r', encoding='utf-8') as f:
+        return int(json.load(f).get("version", 0))
+
+
+def write_change_log(changes: list, row_count: int,
+                     log_path: str = CHANGE_LOG_FILE, version_path: str = VERSION_FILE) -> int:
+    """
+    変更があれば版番号を1つ進めて変更ログに追記し、新しい版番号を返す。
+    変更が無ければ何も書かずに現在の版番号を返す。
+    """
+    version = current_version(version_path)
+    if not changes:
+        return version
+
+    version += 1
+    with open(log_path, 'a', encoding='utf-8') as f:
+        for change in changes:
+            f.write(json.dumps(dict(version=version, **change), ensure_ascii=False) + "\n")
+
+    summary = {
+        "version": version,
+        "rows": int(row_count),
+        "inserted": sum(c["op"] == "insert" for c in changes),
+        "updated": sum(c["op"] == "update" for c in changes),
+        "retracted": sum(c["op"] == "retract" for c in changes),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    tmp_path = version_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, version_path)
+    return version
+
+
+def read_changes(since_version: int = 0, log_path: str = CHANGE_LOG_FILE) -> list:
+    """
+    版番号が since_version より新しい変更を古い順に返す。
+    """
+    if not os.path.exists(log_path):
+        return []
+    changes = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            change = json.loads(line)
+            if change["version"] > since_version:
+                changes.append(change)
+    return changes
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+複数の情報源 (県) に重複して載っている目撃情報をまとめるモジュール。
+県境付近の出没を両県が報告している場合などを想定している。
+
+総当たり (O(n^2)) で比べる代わりに、次のブロッキングキーが一致する行どうしだけを候補にする。
+  1) 日付 × 空間格子 (約2km四方。前日・隣接格子も含める)
+  2) 日付 × 正規化した市町村名 (座標が無い行も拾うため)
+候補の組は、日付・距離・市町村名・地点名の類似度で採点し、
+しきい値以上の組を点数の高い順に Union-Find でまとめて1行に統合する。
+
+同じ県の資料の中では、時刻の列を持たないため同日同地点の別の出没と区別できない。
+そのため統合するのは異なる県 (情報源) の間の重複だけで、1つのグループには
+各県の行を高々1件しか入れない (A県の2件が同じB県の1件に近くても、両方は統合しない)。
+各県の資料は最新の版だけを読み込む (sources.py) ので、版の重なりによる重複は生じない。
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+# 統合した組の記録 (確認用)
+DUPLICATE_REPORT_FILE = "bear_sightings_duplicates.csv"
+
+# 空間格子の一辺 (度)。0.02度はおよそ2km
+BLOCK_CELL_DEG = 0.02
+
+# この点数以上の組を重複とみなす
+DUPLICATE_THRESHOLD = 0.75
+
+# 採点の重み (日付, 距離, 市町村名, 地点名)
+SCORE_WEIGHTS = (0.3, 0.35, 0.15, 0.2)
+
+# 統合の記録の列 (このあとに kept_/dropped_ 付きの prefecture, date, city, location が続く)
+REPORT_COLUMNS = ["kept", "dropped", "linked_to", "score"]
+
+
+def normalize_city(city) -> str:
+    """
+    市町村名を比較用に正規化する (全角半角の統一・空白除去・郡名の除去)。
+    例: "足柄上郡山北町" → "山北町"
+    """
+    if city is None or pd.isna(city):
+        return ""
+    city = unicodedata.normalize("NFKC", str(city)).replace(" ", "")
+    return re.sub(r"^.+?郡", "", city)
+
+
+def normalize_location(location) -> str:
+    """
+    地点名を比較用に正規化する (全角半角の統一・空白と括弧書きの除去)。
+    """
+    if location is None or pd.isna(location):
+        return ""
+    location = unicodedata.normalize("NFKC", str(location))
+    location = re.sub(r"\(.*?\)", "", location)
+    return re.sub(r"\s+", "", location)
+
+
+def _distance_km(lat1, lon1, lat2, lon2) -> float:
+    """
+    近い2点間の距離 (km) を平面近似で求める。
+    """
+    dy = (lat2 - lat1) * 111.0
+    dx = (lon2 - lon1) * 111.0 * np.cos(np.radians((lat1 + lat2) / 2))
+    return float(np.hypot(dx, dy))
+
+
+# ----------------------------------------------
+# 候補の生成 (ブロッキング)
+# ----------------------------------------------
+def candidate_pairs(days: np.ndarray, lat: np.ndarray, lon: np.ndarray, cities: list) -> set:
+    """
+    ブロッキングキーが一致 (日付は前日まで、格子は隣接まで) する行番号の組 (i < j) を返す。
+    """
+    has_coords = ~(np.isnan(lat) | np.isnan(lon))
+    cell_y = np.where(has_coords, np.floor(np.nan_to_num(lat) / BLOCK_CELL_DEG), 0).astype(np.int64)
+    cell_x = np.where(has_coords, np.floor(np.nan_to_num(lon) / BLOCK_CELL_DEG), 0).astype(np.int64)
+
+    space_blocks = defaultdict(list)
+    city_blocks = defaultdict(list)
+    for i in range(len(days)):
+        if has_coords[i]:
+            space_blocks[(days[i], cell_y[i], cell_x[i])].append(i)
+        if cities[i]:
+            city_blocks[(days[i], cities[i])].append(i)
+
+    pairs = set()
+    for i in range(len(days)):
+        neighbors = []
+        for d in (days[i] - 1, days[i]):
+            if has_coords[i]:
+                for dy in (-1, 0, 1):
+                    for dx in (-1, 0, 1):
+                        neighbors.extend(space_blocks.get((d, cell_y[i] + dy, cell_x[i] + dx), ()))
+            if cities[i]:
+                neighbors.extend(city_blocks.get((d, cities[i]), ()))
+        for j in neighbors:
+            if j != i:
+                pairs.add((min(i, j), max(i, j)))
+    return pairs
+
+
+# ----------------------------------------------
+# 採点
+# ----------------------------------------------
+def score_pair(a: dict, b: dict) -> float:
+    """
+    2件の目撃情報が同じ出没である可能性を 0〜1 で採点する。
+    """
+    w_date, w_dist, w_city, w_loc = SCORE_WEIGHTS
+
+    day_gap = abs(a["day"] - b["day"])
+    date_score = 1.0 if day_gap == 0 else (0.5 if day_gap == 1 else 0.0)
+
+    if np.isnan(a["lat"]) or np.isnan(b["lat"]):
+        dist_score = 0.5  # 座標が無い場合は中立
+    else:
+        dist = _distance_km(a["lat"], a["lon"], b["lat"], b["lon"])
+        dist_score = 1.0 if dist <= 0.5 else (0.6 if dist <= 2.0 else 0.0)
+
+    city_score = 1.0 if a["city"] and a["city"] == b["city"] else 0.0
+
+    if a["location"] and b["location"]:
+        loc_score = SequenceMatcher(None, a["location"], b["location"]).ratio()
+    else:
+        loc_score = 0.0
+
+    return w_date * date_score + w_dist * dist_score + w_city * city_score + w_loc * loc_score
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            # 先に出てきた行を代表にする
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+# ----------------------------------------------
+# 重複の統合
+# ----------------------------------------------
+def deduplicate_sightings(df: pd.DataFrame, threshold: float = DUPLICATE_THRESHOLD) -> tuple:
+    """
+    prefecture, date, city, location, latitude, longitude 列を持つ df から重複を除き、
+    (重複を除いた df, 統合した行の DataFrame) を返す。
+    統合したグループでは、市町村名・地点名・座標の欠けが少ない行を残す。
+    統合の記録には、除いた行ごとに結び付けた相手の行 (linked_to) とその組の点数を載せる。
+    """
+    df = df.reset_index(drop=True)
+    if df.empty:
+        return df, pd.DataFrame(columns=REPORT_COLUMNS)
+
+    dates = pd.to_datetime(df["date"], errors="coerce")
+    days = ((dates - pd.Timestamp("2000-01-01")) // pd.Timedelta(days=1)).fillna(-1).to_numpy(np.int64)
+    lat = pd.to_numeric(df["latitude"], errors="coerce").to_numpy(np.float64)
+    lon = pd.to_numeric(df["longitude"], errors="coerce").to_numpy(np.float64)
+    cities = [normalize_city(c) for c in df["city"]]
+    locations = [normalize_location(loc) for loc in df["location"]]
+    sources = df["prefecture"].fillna("").tolist()
+
+    def features(i):
+        return {"day": days[i], "lat": lat[i], "lon": lon[i],
+                "city": cities[i], "location": locations[i]}
+
+    edges = []
+    for i, j in candidate_pairs(days, lat, lon, cities):
+        if days[i] < 0 or days[j] < 0 or sources[i] == sources[j]:
+            continue
+        score = score_pair(features(i), features(j))
+        if score >= threshold:
+            edges.append((score, i, j))
+
+    # 点数の高い組から順に統合する。すでに同じ県の行を含むグループどうしはまとめない
+    # (各行は、まだ相手の県の行と組になっていない範囲で最も点数の高い相手と結び付く)
+    uf = _UnionFind(len(df))
+    group_sources = [{s} for s in sources]
+    links = defaultdict(list)
+    for score, i, j in sorted(edges, key=lambda e: (-e[0], e[1], e[2])):
+        ri, rj = uf.find(i), uf.find(j)
+        if ri == rj or group_sources[ri] & group_sources[rj]:
+            continue
+        uf.union(i, j)
+        group_sources[uf.find(i)] = group_sources[ri] | group_sources[rj]
+        links[i].append((score, j))
+        links[j].append((score, i))
+
+    groups = defaultdict(list)
+    for i in range(len(df)):
+        groups[uf.find(i)].append(i)
+
+    # 欠けている項目が少ない行 (同点なら先の行) をグループの代表にする
+    completeness = df[["city", "location", "latitude", "longitude"]].notna().sum(axis=1).to_numpy()
+    keep = []
+    report = []
+    for members in groups.values():
+        best = max(members, key=lambda i: (completeness[i], -i))
+        keep.append(best)
+        for i in members:
+            if i == best:
+                continue
+            # 残した行と直接組になっていればその組、そうでなければ最も点数の高い組を記録する
+            direct = [link for link in links[i] if link[1] == best]
+            score, partner = direct[0] if direct else max(links[i])
+            report.append({"kept": best, "dropped": i, "linked_to": partner, "score": round(score, 3)})
+
+    deduped = df.iloc[sorted(keep)].reset_index(drop=True)
+    report_df = pd.DataFrame(report, columns=REPORT_COLUMNS)
+    if len(report_df):
+        for col in ["prefecture", "date", "city", "location"]:
+            report_df[f"kept_{col}"] = df[col].to_numpy()[report_df["kept"]]
+            report_df[f"dropped_{col}"] = df[col].to_numpy()[report_df["dropped"]]
+    return deduped, report_df
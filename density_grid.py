@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+熊の目撃情報を「緯度経度グリッドのセル × 日付」で事前集計し、
+密度表示(ヒートマップ相当)を GeoJSON / PNG で高速に返すためのモジュール。
+
+ブラウザ側で生データからヒートマップを描くと重いため、
+複数の解像度(セルの大きさ)ごとに件数を NumPy 配列で保持しておき、
+日付範囲の指定に対しては二分探索 + bincount だけで集計結果を返す。
+"""
+
+import base64
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 事前集計結果の保存先
+GRID_FILE = "bear_density_grid.npz"
+
+# 集計対象の範囲 (静岡県・山梨県・神奈川県を含む矩形)
+# (南端の緯度, 西端の経度, 北端の緯度, 東端の経度)
+GRID_BOUNDS = (34.5, 137.4, 36.0, 139.9)
+
+# セルの一辺の大きさ(度)。0.01度はおよそ1km四方
+RESOLUTIONS = (0.2, 0.1, 0.05, 0.02, 0.01)
+
+# 日番号の起点 (この日を0日目とする)
+DAY_EPOCH = pd.Timestamp("2000-01-01")
+
+# 描画結果(GeoJSON/PNG)のキャッシュ件数の上限
+RENDER_CACHE_SIZE = 64
+
+
+# ----------------------------------------------
+# 日付 <-> 日番号の変換
+# ----------------------------------------------
+def to_day_numbers(dates) -> np.ndarray:
+    """
+    日付の列(Series / 配列)を DAY_EPOCH からの経過日数 (int32) に変換する。
+    """
+    dates = pd.to_datetime(pd.Series(dates)).dt.normalize()
+    return ((dates - DAY_EPOCH) // pd.Timedelta(days=1)).to_numpy(dtype=np.int32)
+
+
+def to_day_number(date) -> int:
+    """
+    1つの日付を DAY_EPOCH からの経過日数に変換する。
+    """
+    return int((pd.Timestamp(date).normalize() - DAY_EPOCH) // pd.Timedelta(days=1))
+
+
+# ----------------------------------------------
+# PNG書き出し (外部ライブラリなし)
+# ----------------------------------------------
+def _encode_png(rgba: np.ndarray) -> bytes:
+    """
+    (高さ, 幅, 4) の uint8 配列を PNG のバイト列にする。
+    """
+    height, width, _ = rgba.shape
+    # 各行の先頭にフィルタ種別(0=なし)を付ける
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, width * 4)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        body = tag + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + chunk(b"IEND", b""))
+
+
+# ----------------------------------------------
+# 多解像度グリッド
+# ----------------------------------------------
+class DensityGrid:
+    """
+    解像度ごとに (日番号, セル番号, 件数) の3配列を日番号・セル番号順で保持する。
+
+    - add(df) で新しく届いた行だけを加算できる(sign=-1 で取り消し)
+    - counts(resolution, start, end) で日付範囲内のセル別件数を2次元配列で返す
+    - to_geojson / to_png は (解像度, 日付範囲) ごとに結果をキャッシュする
+      (アプリでは全セッションで1つのグリッドを共有するため、キャッシュはロックで排他する)
+    """
+
+    def __init__(self, bounds=GRID_BOUNDS, resolutions=RESOLUTIONS):
+        self.bounds = tuple(float(v) for v in bounds)
+        self.resolutions = tuple(float(r) for r in resolutions)
+        self._days = {}
+        self._cells = {}
+        self._counts = {}
+        for res in self.resolutions:
+            self._days[res] = np.empty(0, dtype=np.int32)
+            self._cells[res] = np.empty(0, dtype=np.int32)
+            self._counts[res] = np.empty(0, dtype=np.int32)
+        self._render_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    # ---------- グリッドの形状 ----------
+    def shape(self, resolution: float) -> tuple:
+        """
+        解像度 resolution のグリッドの (行数, 列数) を返す。行0が南端。
+        """
+        lat_min, lon_min, lat_max, lon_max = self.bounds
+        n_rows = int(np.ceil(round((lat_max - lat_min) / resolution, 9)))
+        n_cols = int(np.ceil(round((lon_max - lon_min) / resolution, 9)))
+        return n_rows, n_cols
+
+    def _cell_index(self, lat: np.ndarray, lon: np.ndarray, resolution: float) -> np.ndarray:
+        """
+        緯度経度をセル番号(行 * 列数 + 列)に変換する。範囲外は -1。
+        """
+        lat_min, lon_min, _, _ = self.bounds
+        n_rows, n_cols = self.shape(resolution)
+        rows = np.floor((lat - lat_min) / resolution).astype(np.int64)
+        cols = np.floor((lon - lon_min) / resolution).astype(np.int64)
+        inside = (rows >= 0) & (rows < n_rows) & (cols >= 0) & (cols < n_cols)
+        return np.where(inside, rows * n_cols + cols, -1)
+
+    # ---------- 加算(差分更新) ----------
+    def add(self, df: pd.DataFrame, sign: int = 1) -> int:
+        """
+        date, latitude, longitude 列を持つ df の各行を件数に加算する。
+        sign=-1 を渡すと取り消された行を減算する。
+        範囲内に入った行数を返す。
+        """
+        df = df.dropna(subset=["date", "latitude", "longitude"])
+        if df.empty:
+            return 0
+
+        days = to_day_numbers(df["date"])
+        lat = df["latitude"].to_numpy(dtype=np.float64)
+        lon = df["longitude"].to_numpy(dtype=np.float64)
+
+        added = 0
+        for res in self.resolutions:
+            cells = self._cell_index(lat, lon, res)
+            inside = cells >= 0
+            added = int(inside.sum())
+            self._merge(res, days[inside], cells[inside],
+                        np.full(added, sign, dtype=np.int32))
+
+        with self._cache_lock:
+            self._render_cache.clear()
+        return added
+
+    def _merge(self, res: float, days: np.ndarray, cells: np.ndarray, counts: np.ndarray):
+        """
+        既存の集計と新しい (日, セル, 件数) をまとめ直し、件数0のセルは捨てる。
+        """
+        n_cells = np.int64(np.prod(self.shape(res)))
+        keys = np.concatenate([
+            self._days[res].astype(np.int64) * n_cells + self._cells[res],
+            days.astype(np.int64) * n_cells + cells,
+        ])
+        weights = np.concatenate([self._counts[res], counts])
+
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        summed = np.bincount(inverse, weights=weights, minlength=len(uniq)).astype(np.int32)
+        keep = summed > 0
+
+        self._days[res] = (uniq[keep] // n_cells).astype(np.int32)
+        self._cells[res] = (uniq[keep] % n_cells).astype(np.int32)
+        self._counts[res] = summed[keep]
+
+    # ---------- 集計結果の取得 ----------
+    def _nearest_resolution(self, resolution: float) -> float:
+        return min(self.resolutions, key=lambda r: abs(r - resolution))
+
+    def counts(self, resolution: float, start=None, end=None) -> np.ndarray:
+        """
+        日付範囲 [start, end] のセル別件数を (行数, 列数) の配列で返す。
+        日番号順に並んでいるので、範囲の特定は二分探索で済む。
+        """
+        res = self._nearest_resolution(resolution)
+        days = self._days[res]
+        lo = 0 if start is None else np.searchsorted(days, to_day_number(start), side="left")
+        hi = len(days) if end is None else np.searchsorted(days, to_day_number(end), side="right")
+
+        n_rows, n_cols = self.shape(res)
+        flat = np.bincount(self._cells[res][lo:hi],
+                           weights=self._counts[res][lo:hi],
+                           minlength=n_rows * n_cols)
+        return flat.astype(np.int32).reshape(n_rows, n_cols)
+
+    def _cached(self, key, build):
+        """
+        描画結果の LRU キャッシュ。
+        """
+        with self._cache_lock:
+            if key in self._render_cache:
+                self._render_cache.move_to_end(key)
+                return self._render_cache[key]
+        value = build()
+        with self._cache_lock:
+            self._render_cache[key] = value
+            if len(self._render_cache) > RENDER_CACHE_SIZE:
+                self._render_cache.popitem(last=False)
+        return value
+
+    @staticmethod
+    def _window_key(start, end) -> tuple:
+        return (None if start is None else to_day_number(start),
+                None if end is None else to_day_number(end))
+
+    def to_geojson(self, resolution: float, start=None, end=None) -> dict:
+        """
+        件数が1以上のセルだけを、count プロパティ付きの矩形ポリゴンとして返す。
+        """
+        res = self._nearest_resolution(resolution)
+        key = ("geojson", res) + self._window_key(start, end)
+        return self._cached(key, lambda: self._build_geojson(res, start, end))
+
+    def _build_geojson(self, res: float, start, end) -> dict:
+        grid = self.counts(res, start, end)
+        lat_min, lon_min, _, _ = self.bounds
+        rows, cols = np.nonzero(grid)
+
+        features = []
+        for r, c in zip(rows.tolist(), cols.tolist()):
+            south = round(lat_min + r * res, 6)
+            west = round(lon_min + c * res, 6)
+            north = round(south + res, 6)
+            east = round(west + res, 6)
+            features.append({
+                "type": "Feature",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[west, south], [east, south], [east, north],
+                                     [west, north], [west, south]]],
+                },
+                "properties": {"count": int(grid[r, c])},
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+    def to_png(self, resolution: float, start=None, end=None) -> bytes:
+        """
+        セル別件数を1セル=1ピクセルの半透明PNGにして返す(北が上)。
+        色の濃さは件数の対数で正規化する。
+        """
+        res = self._nearest_resolution(resolution)
+        key = ("png", res) + self._window_key(start, end)
+        return self._cached(key, lambda: self._build_png(res, start, end))
+
+    def _build_png(self, res: float, start, end) -> bytes:
+        grid = self.counts(res, start, end)[::-1]  # 行0を北端にする
+        intensity = np.log1p(grid.astype(np.float64))
+        peak = intensity.max()
+        if peak > 0:
+            intensity /= peak
+
+        rgba = np.zeros(grid.shape + (4,), dtype=np.uint8)
+        rgba[..., 0] = 220
+        rgba[..., 1] = (200 * (1.0 - intensity)).astype(np.uint8)
+        rgba[..., 2] = 40
+        rgba[..., 3] = np.where(grid > 0, 80 + 150 * intensity, 0).astype(np.uint8)
+        return _encode_png(rgba)
+
+    def png_data_url(self, resolution: float, start=None, end=None) -> str:
+        """
+        to_png の結果を Folium の ImageOverlay に渡せる data URL にする。
+        """
+        encoded = base64.b64encode(self.to_png(resolution, start, end)).decode("ascii")
+        return "data:image/png;base64," + encoded
+
+    def image_bounds(self, resolution: float) -> list:
+        """
+        PNG を地図に重ねるときの [[南, 西], [北, 東]] を返す。
+        """
+        res = self._nearest_resolution(resolution)
+        lat_min, lon_min, _, _ = self.bounds
+        n_rows, n_cols = self.shape(res)
+        return [[lat_min, lon_min], [lat_min + n_rows * res, lon_min + n_cols * res]]
+
+    # ---------- 保存・読み込み ----------
+    def save(self, file_path: str = GRID_FILE):
+        """
+        集計結果を npz 形式で保存する。
+        """
+        arrays = {
+            "bounds": np.array(self.bounds),
+            "resolutions": np.array(self.resolutions),
+        }
+        for i, res in enumerate(self.resolutions):
+            arrays[f"days_{i}"] = self._days[res]
+            arrays[f"cells_{i}"] = self._cells[res]
+            arrays[f"counts_{i}"] = self._counts[res]
+        np.savez_compressed(file_path, **arrays)
+
+    @classmethod
+    def load(cls, file_path: str = GRID_FILE) -> "DensityGrid":
+        """
+        save() で保存した集計結果を読み込む。
+        """
+        with np.load(file_path) as data:
+            grid = cls(bounds=data["bounds"].tolist(), resolutions=data["resolutions"].tolist())
+            for i, res in enumerate(grid.resolutions):
+                grid._days[res] = data[f"days_{i}"]
+                grid._cells[res] = data[f"cells_{i}"]
+                grid._counts[res] = data[f"counts_{i}"]
+        return grid
+
+
+def build_density_grid(df: pd.DataFrame) -> DensityGrid:
+    """
+    DataFrame 全体から DensityGrid を作る。
+    """
+    grid = DensityGrid()
+    grid.add(df)
+    return grid
+
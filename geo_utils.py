@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+目撃地点と路線（駅）の距離判定や、路線YAMLの読み込みなど、
+アプリ (app.py) とデータ処理 (scraping_and_processing.py) の両方で使う関数群。
+"""
+
+import numpy as np
+import yaml
+from math import sin, cos, sqrt, atan2, radians
+
+# 路線近接のビット集合 (uint64) で表せる路線数の上限
+MAX_LINES_IN_MASK = 64
+
+
+# ----------------------------------------------
+# 距離計算 (ハーバーサインの公式)
+# ----------------------------------------------
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    2点の緯度経度 (lat1, lon1) と (lat2, lon2) から
+    地球上の距離(km)を求める。
+    """
+    R = 6371.0
+    lat1_r = radians(lat1)
+    lon1_r = radians(lon1)
+    lat2_r = radians(lat2)
+    lon2_r = radians(lon2)
+    dlat = lat2_r - lat1_r
+    dlon = lon2_r - lon1_r
+
+    a = sin(dlat / 2)**2 + cos(lat1_r) * cos(lat2_r) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    distance = R * c
+    return distance
+
+
+def get_lines_near_sighting(sighting_lat, sighting_lon, lines_data, radius_km=5):
+    """
+    目撃地点 (sighting_lat, sighting_lon) が
+    半径 radius_km km以内にある路線名をリストで返す。
+    """
+    near_lines = []
+    for line in lines_data['lines']:
+        for st_data in line['stations']:
+            dist = haversine(sighting_lat, sighting_lon, st_data['lat'], st_data['lon'])
+            if dist <= radius_km:
+                near_lines.append(line['name'])
+                break  # 同じ路線で重複チェックしないため
+    return near_lines
+
+
+# ----------------------------------------------
+# 路線近接のビット集合 (lines_mask)
+# ----------------------------------------------
+def lines_near_mask(lat, lon, lines_data, radius_km=5) -> np.ndarray:
+    """
+    目撃地点の配列 (lat, lon) について、半径 radius_km km以内に駅がある路線を
+    ビット集合 (uint64。lines_data['lines'] の i 番目の路線がビット i) で返す。
+    1路線ずつ「全地点 × 全駅」の距離をまとめて計算する。
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))[:, None]
+    lon = np.radians(np.asarray(lon, dtype=np.float64))[:, None]
+    mask = np.zeros(lat.shape[0], dtype=np.uint64)
+    if not lines_data:
+        return mask
+    if len(lines_data['lines']) > MAX_LINES_IN_MASK:
+        raise ValueError(f"路線数が {MAX_LINES_IN_MASK} を超えるためビット集合で表せません")
+
+    for i, line in enumerate(lines_data['lines']):
+        if not line['stations']:
+            continue
+        st_lat = np.radians([float(st_data['lat']) for st_data in line['stations']])[None, :]
+        st_lon = np.radians([float(st_data['lon']) for st_data in line['stations']])[None, :]
+        a = (np.sin((st_lat - lat) / 2) ** 2
+             + np.cos(lat) * np.cos(st_lat) * np.sin((st_lon - lon) / 2) ** 2)
+        dist = 2 * 6371.0 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+        near = (dist <= radius_km).any(axis=1)
+        mask[near] |= np.uint64(1 << i)
+    return mask
+
+
+def line_bits(lines_data, line_name: str) -> np.uint64:
+    """
+    路線名に対応するビット (同名の路線が複数あればその和) を返す。
+    """
+    bits = 0
+    for i, line in enumerate(lines_data['lines'] if lines_data else []):
+        if line['name'] == line_name:
+            bits |= 1 << i
+    return np.uint64(bits)
+
+
+def lines_from_mask(mask, lines_data) -> list:
+    """
+    ビット集合1つを路線名のリストに戻す (get_lines_near_sighting と同じ形)。
+    """
+    mask = int(mask)
+    return [
+        line['name']
+        for i, line in enumerate(lines_data['lines'] if lines_data else [])
+        if mask >> i & 1
+    ]
+
+
+# ----------------------------------------------
+# YAMLファイルを読み込む関数
+# ----------------------------------------------
+def load_lines_from_yaml(file_path: str):
+    """
+    YAMLファイル (lines.yaml) を読み込み、辞書型を返す。
+    想定構造:
+    {
+      'lines': [
+        {
+          'name': 'Minobu',
+          'stations': [
+            {'name': '富士', 'lat': 35.xxx, 'lon': 138.xxx},
+            ...
+          ]
+        },
+        ...
+      ]
+    }
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    return data
+
+
+def add_lines_near_column(df, lines_data, radius_km=5):
+    """
+    df の各行 (latitude, longitude) について、半径 radius_km km以内にある
+    路線名のリストを「lines_near」列として追加して返す。
+    lines_data が無い場合は空リストを入れる。
+    """
+    if lines_data and len(df):
+        # 距離判定はビット集合でまとめて行い、同じ組み合わせのリストは使い回す
+        mask = lines_near_mask(df['latitude'], df['longitude'], lines_data, radius_km)
+        names = {m: lines_from_mask(m, lines_data) for m in np.unique(mask).tolist()}
+        df['lines_near'] = [list(names[m]) for m in mask.tolist()]
+    else:
+        df['lines_near'] = [[] for _ in range(len(df))]
+    return df
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+空間的にも時間的にも密集している目撃 (ホットスポット) を見つけるモジュール。
+
+DBSCAN を「東西(km) × 南北(km) × 日付(スケール後km)」の3次元で行う。
+日付は eps_days 日が eps_km と同じ距離になるように拡大縮小し、
+近傍探索は一辺 eps_km の3次元格子で周囲27セルだけを調べるため、
+総当たり (O(n^2)) にならない。
+
+新しい目撃は insert() で追加でき、既存のクラスタは作り直さずに
+「新しくコア点になった点」の周りだけを更新する (追加のみの差分更新)。
+削除を含む変更があった場合は作り直す。
+"""
+
+import threading
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from density_grid import to_day_numbers
+
+# 状態の保存先
+HOTSPOT_FILE = "bear_hotspots.npz"
+
+# 既定のパラメータ: 半径3km・14日以内に自身を含めて4件以上あればコア点
+EPS_KM = 3.0
+EPS_DAYS = 14.0
+MIN_SAMPLES = 4
+
+# km 換算に使う基準緯度 (静岡・山梨・神奈川の中央付近)
+REF_LAT = 35.5
+KM_PER_DEG_LAT = 111.195
+
+# 27近傍セルの相対位置
+_OFFSETS = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)]
+
+
+class HotspotIndex:
+    """
+    格子索引付きの時空間 DBSCAN。点を追加するたびにコア判定とクラスタの連結を更新する。
+    """
+
+    def __init__(self, eps_km: float = EPS_KM, eps_days: float = EPS_DAYS,
+                 min_samples: int = MIN_SAMPLES):
+        self.eps_km = float(eps_km)
+        self.eps_days = float(eps_days)
+        self.min_samples = int(min_samples)
+
+        self.xyz = np.empty((0, 3), dtype=np.float64)
+        self.meta = pd.DataFrame(columns=["date", "prefecture", "city", "latitude", "longitude"])
+        self.count = np.empty(0, dtype=np.int64)       # 近傍点の数 (自身を含む)
+        self.core = np.empty(0, dtype=bool)
+        self.parent = np.empty(0, dtype=np.int64)      # コア点どうしの Union-Find
+        self.border_of = np.empty(0, dtype=np.int64)   # 境界点が属するコア点 (-1 はノイズ)
+        self._cells = defaultdict(list)
+        # クラスタ一覧 (期間で絞る前) のキャッシュ。insert() で捨てる
+        self._summary = None
+        self._summary_lock = threading.Lock()
+
+    # ---------- 座標変換・格子 ----------
+    def _project(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        緯度経度と日付を (東西km, 南北km, 日付のスケール後km) に変換する。
+        """
+        km_per_deg_lon = KM_PER_DEG_LAT * np.cos(np.radians(REF_LAT))
+        x = df["longitude"].to_numpy(np.float64) * km_per_deg_lon
+        y = df["latitude"].to_numpy(np.float64) * KM_PER_DEG_LAT
+        z = to_day_numbers(df["date"]).astype(np.float64) * (self.eps_km / self.eps_days)
+        return np.column_stack([x, y, z])
+
+    def _cell_keys(self, xyz: np.ndarray) -> list:
+        return [tuple(c) for c in np.floor(xyz / self.eps_km).astype(np.int64).tolist()]
+
+    def _neighbors(self, points: np.ndarray) -> dict:
+        """
+        指定した点それぞれについて、距離 eps_km 以内の点 (自身を含む) の番号を返す。
+        同じセルにある点はまとめて距離計算する。
+        """
+        by_cell = defaultdict(list)
+        keys = self._cell_keys(self.xyz[points])
+        for p, key in zip(points.tolist(), keys):
+            by_cell[key].append(p)
+
+        result = {}
+        for (cx, cy, cz), members in by_cell.items():
+            candidates = [
+                self._cells[(cx + dx, cy + dy, cz + dz)]
+                for dx, dy, dz in _OFFSETS
+                if (cx + dx, cy + dy, cz + dz) in self._cells
+            ]
+            cand = np.fromiter((i for c in candidates for i in c), dtype=np.int64)
+            members = np.asarray(members, dtype=np.int64)
+            diff = self.xyz[members][:, None, :] - self.xyz[cand][None, :, :]
+            within = (diff ** 2).sum(axis=2) <= self.eps_km ** 2
+            for row, p in enumerate(members.tolist()):
+                result[p] = cand[within[row]]
+        return result
+
+    # ---------- Union-Find ----------
+    def _find(self, i: int) -> int:
+        parent = self.parent
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def _union(self, i: int, j: int):
+        ri, rj = self._find(i), self._find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+    # ---------- 追加 (差分更新) ----------
+    def insert(self, df: pd.DataFrame) -> int:
+        """
+        date, prefecture, city, latitude, longitude 列を持つ df の行を追加し、
+        コア判定とクラスタを更新する。追加した点の数を返す。
+        """
+        df = df.dropna(subset=["date", "latitude", "longitude"])
+        if df.empty:
+            return 0
+
+        self._summary = None
+        start = len(self.xyz)
+        new = np.arange(start, start + len(df), dtype=np.int64)
+        self.xyz = np.vstack([self.xyz, self._project(df)])
+        meta = df[["date", "prefecture", "city", "latitude", "longitude"]].copy()
+        meta["date"] = pd.to_datetime(meta["date"])
+        self.meta = pd.concat([self.meta, meta], ignore_index=True) if len(self.meta) else meta.reset_index(drop=True)
+        self.count = np.concatenate([self.count, np.zeros(len(new), dtype=np.int64)])
+        self.core = np.concatenate([self.core, np.zeros(len(new), dtype=bool)])
+        self.parent = np.concatenate([self.parent, new])
+        self.border_of = np.concatenate([self.border_of, np.full(len(new), -1, dtype=np.int64)])
+        for p, key in zip(new.tolist(), self._cell_keys(self.xyz[new])):
+            self._cells[key].append(p)
+
+        # 1) 近傍数を更新 (新しい点は数え直し、既存の点は新しい近傍の分だけ増やす)
+        neighbors = self._neighbors(new)
+        for p in new.tolist():
+            nb = neighbors[p]
+            self.count[p] = len(nb)
+            old = nb[nb < start]
+            np.add.at(self.count, old, 1)
+
+        # 2) 新しくコア点になった点
+        was_core = self.core.copy()
+        self.core = self.count >= self.min_samples
+        newly_core = np.nonzero(self.core & ~was_core)[0]
+        missing = newly_core[newly_core < start]
+        if len(missing):
+            neighbors.update(self._neighbors(missing))
+
+        # 3) 新しいコア点を近傍のコア点と連結し、近傍の非コア点を境界点にする
+        for c in newly_core.tolist():
+            nb = neighbors[c]
+            for q in nb[self.core[nb]].tolist():
+                self._union(c, q)
+            for q in nb[~self.core[nb]].tolist():
+                if self.border_of[q] < 0:
+                    self.border_of[q] = c
+
+        # 4) 新しい非コア点は、近傍に既存のコア点があればその境界点にする
+        for p in new.tolist():
+            if not self.core[p] and self.border_of[p] < 0:
+                nb = neighbors[p]
+                cores = nb[self.core[nb]]
+                if len(cores):
+                    self.border_of[p] = cores[0]
+        return len(new)
+
+    # ---------- 結果 ----------
+    def labels(self) -> np.ndarray:
+        """
+        各点のクラスタ番号 (0始まり、ノイズは -1) を返す。
+        """
+        roots = np.full(len(self.xyz), -1, dtype=np.int64)
+        for i in np.nonzero(self.core)[0].tolist():
+            roots[i] = self._find(i)
+        border = ~self.core & (self.border_of >= 0)
+        roots[border] = roots[self.border_of[border]]
+
+        labels = np.full(len(self.xyz), -1, dtype=np.int64)
+        assigned = roots >= 0
+        _, labels[assigned] = np.unique(roots[assigned], return_inverse=True)
+        return labels
+
+    def cluster_table(self, start=None, end=None) -> pd.DataFrame:
+        """
+        クラスタごとの件数・期間・中心・広がり・主な市町村を、件数の多い順に返す。
+        start / end を指定すると、期間がその範囲と重なるクラスタだけを返す。
+        クラスタ一覧は一度だけ作ってキャッシュし、期間の指定ごとには絞り込みだけを行う。
+        """
+        table = self._cluster_summary()
+        if start is not None:
+            table = table[table["end"] >= pd.Timestamp(start)]
+        if end is not None:
+            table = table[table["start"] <= pd.Timestamp(end)]
+        return table.reset_index(drop=True)
+
+    def _cluster_summary(self) -> pd.DataFrame:
+        """
+        全クラスタの一覧 (件数の多い順)。アプリでは1つの索引を全セッションで共有するため、
+        labels() の経路圧縮 (parent の書き換え) を含めてロックの中で1回だけ作る。
+        """
+        with self._summary_lock:
+            if self._summary is None:
+                self._summary = self._build_summary()
+            return self._summary
+
+    def _build_summary(self) -> pd.DataFrame:
+        columns = ["hotspot", "count", "start", "end", "latitude", "longitude",
+                   "radius_km", "prefecture", "city"]
+        labels = self.labels()
+        if len(labels) == 0 or labels.max() < 0:
+            return pd.DataFrame(columns=columns)
+
+        meta = self.meta.assign(hotspot=labels)
+        meta = meta[meta["hotspot"] >= 0]
+        rows = []
+        for hotspot, g in meta.groupby("hotspot"):
+            lat = g["latitude"].astype(float)
+            lon = g["longitude"].astype(float)
+            dy = (lat - lat.mean()) * KM_PER_DEG_LAT
+            dx = (lon - lon.mean()) * KM_PER_DEG_LAT * np.cos(np.radians(REF_LAT))
+            rows.append({
+                "hotspot": int(hotspot),
+                "count": len(g),
+                "start": g["date"].min(),
+                "end": g["date"].max(),
+                "latitude": lat.mean(),
+                "longitude": lon.mean(),
+                "radius_km": round(float(np.sqrt(dx ** 2 + dy ** 2).max()), 2),
+                "prefecture": g["prefecture"].mode().iloc[0],
+                "city": g["city"].mode().iloc[0] if g["city"].notna().any() else "",
+            })
+
+        table = pd.DataFrame(rows, columns=columns)
+        return table.sort_values(["count", "end"], ascending=False).reset_index(drop=True)
+
+    # ---------- 保存・読み込み ----------
+    def save(self, file_path: str = HOTSPOT_FILE):
+        """
+        点と DBSCAN の状態を npz 形式で保存する (格子索引は読み込み時に作り直す)。
+        """
+        np.savez_compressed(
+            file_path,
+            params=np.array([self.eps_km, self.eps_days, self.min_samples], dtype=np.float64),
+            xyz=self.xyz, count=self.count, core=self.core,
+            parent=self.parent, border_of=self.border_of,
+            dates=self.meta["date"].to_numpy(dtype="datetime64[ns]"),
+            prefectures=self.meta["prefecture"].astype(object).fillna("").to_numpy(dtype=str),
+            cities=self.meta["city"].astype(object).fillna("").to_numpy(dtype=str),
+            lat=self.meta["latitude"].to_numpy(np.float64),
+            lon=self.meta["longitude"].to_numpy(np.float64),
+        )
+
+    @classmethod
+    def load(cls, file_path: str = HOTSPOT_FILE) -> "HotspotIndex":
+        """
+        save() で保存した状態を読み込む。
+        """
+        with np.load(file_path) as data:
+            eps_km, eps_days, min_samples = data["params"].tolist()
+            index = cls(eps_km, eps_days, int(min_samples))
+            index.xyz = data["xyz"]
+            index.count = data["count"]
+            index.core = data["core"]
+            index.parent = data["parent"]
+            index.border_of = data["border_of"]
+            index.meta = pd.DataFrame({
+                "date": pd.to_datetime(data["dates"]),
+                "prefecture": data["prefectures"],
+                "city": data["cities"],
+                "latitude": data["lat"],
+                "longitude": data["lon"],
+            })
+        for p, key in enumerate(index._cell_keys(index.xyz)):
+            index._cells[key].append(p)
+        return index
+
+
+def build_hotspots(df: pd.DataFrame, **params) -> HotspotIndex:
+    """
+    DataFrame 全体から HotspotIndex を作る。
+    """
+    index = HotspotIndex(**params)
+    index.insert(df)
+    return index
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+登録済みの取得元 (sources.py) を並列に実行するスケジューラ。
+
+取得元ごとに discover → fetch → parse を別プロセスで順に実行する。
+  - 取得元どうしは並列に動くので、遅い・壊れた取得元が他を待たせない
+    (県が増えても、全体の時間は最も遅い取得元の時間程度に収まる)
+  - discover / fetch (ネットワーク) は失敗したら間隔を空けて再試行する
+  - 取得元ごとの制限時間 (timeout_s) を超えたら、その取得元を打ち切る
+    (段階の合間と再試行の前に確認する。HTTP のタイムアウトも残り時間に合わせる)
+  - それでも終わらない取得元 (Selenium や PDF解析が止まった場合など) は、
+    制限時間 + KILL_GRACE_S 秒でプロセスごと強制終了する。スレッドと違って
+    パイプライン全体の終了を待たせず、終了後に遅れて JSON を書くこともない
+  - 失敗・打ち切りになった取得元は、解析結果 (JSON) を書き換えない。
+    JSON 統合では前回の解析結果がそのまま使われる (JSON は一時ファイルに書いてから置き換える)
+  - 解析結果が0件の場合も、PDFのレイアウト変更などで壊れた可能性があるため書き換えない
+
+各取得元の段階は、計測に "fetch_<slug>" / "parse_<slug>" の段階として記録する
+(子プロセスで計測し、終了時に親の計測へ加える)。
+"""
+
+import multiprocessing
+import time
+from multiprocessing.connection import wait
+
+from pipeline_metrics import stage, record, record_error, start_run, add_stages
+from sources import get_sources, REQUEST_TIMEOUT_S
+
+# 同時に実行する取得元の数
+MAX_WORKERS = 8
+
+# 取得元1つあたりの制限時間 (秒) と、ネットワーク段階の再試行回数・間隔 (秒。回ごとに倍)
+SOURCE_TIMEOUT_S = 300
+RETRIES = 2
+RETRY_BACKOFF_S = 5
+
+# 制限時間を過ぎても終わらない取得元のプロセスを強制終了するまでの猶予 (秒)
+KILL_GRACE_S = 30
+
+# 実行する段階
+ALL_STEPS = ("fetch", "parse")
+
+
+class SourceTimeout(Exception):
+    """
+    取得元の制限時間を超えた。
+    """
+
+
+class _Deadline:
+    def __init__(self, seconds: float):
+        self.end = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.end - time.monotonic()
+
+    def check(self, what: str):
+        if self.remaining() <= 0:
+            raise SourceTimeout(f"{what} の前に制限時間を超えました")
+
+
+def with_retries(func, what: str, deadline: _Deadline, retries: int = RETRIES,
+                 backoff_s: float = RETRY_BACKOFF_S):
+    """
+    func(timeout) を最大 retries 回まで再試行する。timeout には残り時間に合わせた秒数を渡す。
+    """
+    for attempt in range(retries + 1):
+        deadline.check(what)
+        try:
+            return func(min(REQUEST_TIMEOUT_S, max(deadline.remaining(), 1)))
+        except SourceTimeout:
+            raise
+        except Exception as e:
+            if attempt == retries:
+                raise
+            record_error(e)
+            record("retries")
+            wait_s = backoff_s * 2 ** attempt
+            print(f"{what} 失敗 ({e})。{wait_s} 秒後に再試行します")
+            if deadline.remaining() <= wait_s:
+                raise SourceTimeout(f"{what} の再試行の前に制限時間を超えます") from e
+            time.sleep(wait_s)
+
+
+def run_source(source, steps=ALL_STEPS, timeout_s: float = SOURCE_TIMEOUT_S,
+               retries: int = RETRIES) -> dict:
+    """
+    1つの取得元の段階を順に実行し、結果 {"source", "status", "seconds", "rows", "error"} を返す。
+    例外は外に出さず、status ("ok" / "failed" / "timeout") と error に記録する。
+    """
+    started = time.monotonic()
+    deadline = _Deadline(timeout_s)
+    result = {"source": source.key, "status": "ok", "rows": None, "error": None}
+    current = None
+    try:
+        if "fetch" in steps:
+            current = f"fetch_{source.slug}"
+            with stage(current):
+                url = with_retries(source.discover, f"[{source.key}] PDFの検索", deadline, retries)
+                with_retries(lambda timeout: source.fetch(url, timeout),
+                             f"[{source.key}] PDFの取得", deadline, retries)
+
+        if "parse" in steps:
+            deadline.check(f"[{source.key}] PDF解析")
+            current = f"parse_{source.slug}"
+            with stage(current):
+                records = source.parse()
+                if not records:
+                    raise ValueError("解析結果が0件のため、前回の解析結果を残します")
+                deadline.check(f"[{source.key}] JSON保存")
+                source.save_records(records)
+                result["rows"] = len(records)
+    except SourceTimeout as e:
+        result.update(status="timeout", error=str(e))
+        print(result["error"])
+    except Exception as e:
+        result.update(status="failed", error=f"{current}: {type(e).__name__}: {e}")
+        print(f"[{source.key}] {result['error']}")
+    result["seconds"] = round(time.monotonic() - started, 2)
+    return result
+
+
+def _source_worker(key: str, steps, timeout_s: float, retries: int, conn):
+    """
+    子プロセスで1つの取得元を実行し、(結果, 計測した段階のリスト) を conn で親に送る。
+    """
+    run = start_run(f"source_{key}")
+    try:
+        result = run_source(get_sources([key])[0], steps, timeout_s, retries)
+    except BaseException as e:
+        result = {"source": key, "status": "failed", "rows": None,
+                  "error": f"{type(e).__name__}: {e}", "seconds": None}
+    conn.send((result, run.stages))
+    conn.close()
+
+
+def _stop_process(process):
+    """
+    プロセスを終了させる (terminate で終わらなければ kill)。
+    """
+    process.terminate()
+    process.join(5)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def run_sources(keys=None, steps=ALL_STEPS, max_workers: int = MAX_WORKERS,
+                timeout_s: float = SOURCE_TIMEOUT_S, retries: int = RETRIES) -> list:
+    """
+    keys (省略時は登録済みのすべて) の取得元を、同時に max_workers 個までのプロセスで実行し、
+    取得元ごとの結果のリストを返す。制限時間 + KILL_GRACE_S 秒を過ぎても終わらない取得元は
+    プロセスを強制終了して "timeout" とする。
+    """
+    sources = get_sources(keys)
+    if not sources:
+        return []
+
+    workers = max(1, min(max_workers, len(sources)))
+    context = multiprocessing.get_context()
+    pending = [source.key for source in sources]
+    running = {}  # 親側の接続 → (取得元, プロセス, 開始時刻)
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < workers:
+            key = pending.pop(0)
+            parent_conn, child_conn = context.Pipe(duplex=False)
+            process = context.Process(target=_source_worker, name=f"source-{key}", daemon=True,
+                                      args=(key, steps, timeout_s, retries, child_conn))
+            process.start()
+            # 子の送信側を閉じておくと、子が結果を送らずに終わったときに EOF で分かる
+            child_conn.close()
+            running[parent_conn] = (key, process, time.monotonic())
+
+        for conn in wait(list(running), timeout=1.0):
+            key, process, started = running.pop(conn)
+            try:
+                result, stages = conn.recv()
+                add_stages(stages)
+            except EOFError:
+                process.join(5)
+                result = {"source": key, "status": "failed", "rows": None,
+                          "error": f"プロセスが異常終了しました (終了コード {process.exitcode})"}
+                print(f"[{key}] {result['error']}")
+            conn.close()
+            process.join(5)
+            if process.is_alive():
+                _stop_process(process)
+            if result.get("seconds") is None:
+                result["seconds"] = round(time.monotonic() - started, 2)
+            results[key] = result
+
+        now = time.monotonic()
+        for conn, (key, process, started) in list(running.items()):
+            if now - started > timeout_s + KILL_GRACE_S:
+                _stop_process(process)
+                conn.close()
+                del running[conn]
+                print(f"[{key}] 制限時間内に終わらないため、プロセスを終了しました")
+                results[key] = {"source": key, "status": "timeout", "rows": None,
+                                "error": "制限時間内に終わりませんでした", "seconds": round(now - started, 2)}
+
+    results = [results[source.key] for source in sources]
+    for result in results:
+        record(f"sources_{result['status']}")
+        rows = "" if result["rows"] is None else f"  {result['rows']} 件"
+        print(f"[取得元] {result['source']:<6} {result['status']:<8} {result['seconds']:7.1f} s{rows}")
+    return results
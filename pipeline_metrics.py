@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+データ更新パイプライン (scraping_and_processing.py) の段階ごとの計測。
+
+段階 (stage) ごとに次の値を記録し、実行1回分を JSON (pipeline_metrics/run_YYYYmmdd_HHMMSS.json) に書き出す。
+  - 経過時間 (wall_s) と CPU時間 (cpu_s)
+  - その時点までのプロセスの最大常駐メモリ (peak_rss_mb)
+  - 各処理が record() で足し込む件数 (ダウンロードしたバイト数・入出力行数・捨てた行数・
+    ジオコーディングの完全一致/代替/失敗 など)
+  - 処理の中で握りつぶした例外 (record_error) と、段階から送出された例外
+
+使い方:
+  start_run("all", profile=True)        # profile=True なら cProfile の結果 (.prof) も保存
+  with stage("parse_yamanashi"):
+      record("rows_out", len(sightings))
+  finish_run()
+
+実行中でないとき (start_run を呼んでいないとき) の stage / record は何もしない。
+実行中の段階はスレッドごとに持つので、並列に動くスレッドがそれぞれ stage を開けば、
+件数が別の段階に混ざらない。別プロセスで計測した段階 (ingest.py の取得元) は
+add_stages() で実行中の計測に加える。
+標準ライブラリだけを使い、パイプラインの import を重くしない。
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 計測結果の保存先ディレクトリ
+METRICS_DIR = "pipeline_metrics"
+
+# 実行中の計測 (start_run 〜 finish_run の間だけ設定される)
+_current_run = None
+
+
+def peak_rss_mb() -> float:
+    """
+    プロセスの最大常駐メモリ (MB)。Linux の ru_maxrss は KB、macOS はバイト単位。
+    resource モジュールが無い環境では None。
+    """
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RunMetrics:
+    """
+    パイプライン1回分の計測結果。stages は段階名ごとの辞書のリスト。
+    """
+
+    def __init__(self, command: str, profile: bool = False, metrics_dir: str = METRICS_DIR):
+        self.command = command
+        self.metrics_dir = metrics_dir
+        self.started_at = datetime.now()
+        self.stages = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._profiler = None
+        if profile:
+            import cProfile
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _active(self) -> list:
+        """
+        このスレッドで実行中の段階のスタック。
+        """
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextmanager
+    def stage(self, name: str):
+        entry = {"name": name, "status": "ok", "counters": {}, "errors": []}
+        with self._lock:
+            self.stages.append(entry)
+        self._active().append(entry)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield entry
+        except BaseException as e:
+            entry["status"] = "failed"
+            entry["errors"].append(_error_info(e))
+            raise
+        finally:
+            entry["wall_s"] = round(time.perf_counter() - wall, 3)
+            entry["cpu_s"] = round(time.process_time() - cpu, 3)
+            entry["peak_rss_mb"] = peak_rss_mb()
+            self._active().pop()
+
+    def record(self, name: str, value=1):
+        active = self._active()
+        if active:
+            with self._lock:
+                counters = active[-1]["counters"]
+                counters[name] = counters.get(name, 0) + value
+
+    def record_error(self, error: BaseException):
+        active = self._active()
+        if active:
+            with self._lock:
+                entry = active[-1]
+                entry["errors"].append(_error_info(error))
+                if entry["status"] == "ok":
+                    entry["status"] = "error"
+
+    def add_stages(self, stages: list):
+        with self._lock:
+            self.stages.extend(stages)
+
+    def to_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_s": round(time.perf_counter() - self._wall_start, 3),
+            "cpu_s": round(time.process_time() - self._cpu_start, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": list(self.stages),
+        }
+
+    def write(self) -> str:
+        """
+        計測結果を JSON で保存し、そのパスを返す。cProfile を有効にしていれば .prof も保存する。
+        """
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        base = os.path.join(self.metrics_dir, f"run_{self.started_at:%Y%m%d_%H%M%S}")
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(base + ".prof")
+        tmp_path = base + ".json.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, base + ".json")
+        return base + ".json"
+
+
+def _error_info(error: BaseException) -> dict:
+    return {
+        "type": type(error).__name__,
+        "message": str(error),
+        "traceback": traceback.format_exception(type(error), error, error.__traceback__)[-3:],
+    }
+
+
+# ----------------------------------------------
+# パイプライン側から呼ぶ関数
+# ----------------------------------------------
+def start_run(command: str, profile: bool = False, metrics_dir: str = METRICS_DIR) -> RunMetrics:
+    global _current_run
+    _current_run = RunMetrics(command, profile=profile, metrics_dir=metrics_dir)
+    return _current_run
+
+
+def finish_run() -> str:
+    """
+    実行中の計測を保存して終了する。保存したパス (実行中でなければ None) を返す。
+    """
+    global _current_run
+    run, _current_run = _current_run, None
+    return run.write() if run is not None else None
+
+
+@contextmanager
+def stage(name: str):
+    if _current_run is None:
+        yield None
+    else:
+        with _current_run.stage(name) as entry:
+            yield entry
+
+
+def record(name: str, value=1):
+    """
+    実行中の段階の件数 name に value を足す。
+    """
+    if _current_run is not None:
+        _current_run.record(name, value)
+
+
+def record_error(error: BaseException):
+    """
+    処理の中で捕まえて続行した例外を、実行中の段階に記録する。
+    """
+    if _current_run is not None:
+        _current_run.record_error(error)
+
+
+def add_stages(stages: list):
+    """
+    別プロセスで計測した段階 (RunMetrics.stages) を、実行中の計測に加える。
+    """
+    if _current_run is not None:
+        _current_run.add_stages(stages)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+目撃情報を日付順に再生 (アニメーション表示) する地図レイヤー。
+
+日ごとに Folium 地図を作り直すのではなく、日付順にソート済みの目撃を一度だけ
+列形式のデータ (緯度・経度・日ごとの開始位置) としてブラウザに送り、
+再生・スライダー操作はすべてブラウザ側で行う (1コマごとのサーバー往復は無い)。
+
+d 日目に表示する点は「直近 window_days 日の目撃」= 位置の範囲
+[offsets[d - window_days + 1], offsets[d + 1]) なので、日を進めるときの差分 (増えた点・
+期間外になった点) も、この範囲どうしの差として求まる。ブラウザは差分の点だけを追加・削除する。
+"""
+
+import base64
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from density_grid import to_day_number, to_day_numbers
+
+# 座標を整数に丸めるときの倍率 (1e-5 度 ≒ 1m)
+COORD_SCALE = 100_000
+
+# 再生時の1コマの間隔 (ミリ秒)
+FRAME_INTERVAL_MS = 150
+
+
+def _b64_int32(values: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(values, dtype="<i4").tobytes()).decode("ascii")
+
+
+def build_playback_payload(df: pd.DataFrame, start_date, end_date, window_days: int = 7) -> dict:
+    """
+    日付順にソート済みの df から、start_date 〜 end_date を再生するための列形式データを作る。
+      lat / lon: 各点の座標 (COORD_SCALE 倍した int32 を base64 にしたもの)
+      offsets:   d 日目の最初の点の位置 (日数 + 1 個。int32 を base64 にしたもの)
+    """
+    first = to_day_number(start_date)
+    last = to_day_number(end_date)
+    days = to_day_numbers(df["date"]) if len(df) else np.empty(0, dtype=np.int32)
+    offsets = np.searchsorted(days, np.arange(first, last + 2), side="left")
+
+    # 期間より前の点は使わないので、先頭を offsets[0] に揃える
+    lo, hi = int(offsets[0]), int(offsets[-1])
+    lat = np.round(df["latitude"].to_numpy(np.float64)[lo:hi] * COORD_SCALE)
+    lon = np.round(df["longitude"].to_numpy(np.float64)[lo:hi] * COORD_SCALE)
+    return {
+        "start": pd.Timestamp(start_date).strftime("%Y-%m-%d"),
+        "days": last - first + 1,
+        "window": int(window_days),
+        "scale": COORD_SCALE,
+        "count": hi - lo,
+        "lat": _b64_int32(lat),
+        "lon": _b64_int32(lon),
+        "offsets": _b64_int32(offsets - lo),
+    }
+
+
+class PlaybackControl(MacroElement):
+    """
+    親の FeatureGroup に再生用の点を描き、地図に再生ボタンと日付スライダーを置く。
+    st_folium の feature_group_to_add でも動くよう、スクリプトだけで完結させている。
+    """
+
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var group = {{ this._parent.get_name() }};
+            var data = {{ this.payload_json }};
+
+            function decode(b64) {
+                var bin = atob(b64), bytes = new Uint8Array(bin.length);
+                for (var i = 0; i < bin.length; i++) { bytes[i] = bin.charCodeAt(i); }
+                return new Int32Array(bytes.buffer);
+            }
+            var lat = decode(data.lat), lon = decode(data.lon), offsets = decode(data.offsets);
+            var renderer = L.canvas({padding: 0.5});
+            var markers = new Array(data.count);
+            var OLD = '#1d4ed8', NEW = '#dc2626';
+            var current = -1, timer = null;
+
+            function marker(i) {
+                if (!markers[i]) {
+                    markers[i] = L.circleMarker([lat[i] / data.scale, lon[i] / data.scale],
+                        {renderer: renderer, radius: 5, weight: 1, color: OLD, fillColor: OLD, fillOpacity: 0.6});
+                }
+                return markers[i];
+            }
+            function visible(day) {
+                return day < 0 ? [0, 0] : [offsets[Math.max(0, day - data.window + 1)], offsets[day + 1]];
+            }
+            function each(a, b, fn) { for (var i = a; i < b; i++) { fn(i); } }
+            function recolor(day, color) {
+                if (day >= 0) {
+                    each(offsets[day], offsets[day + 1], function(i) {
+                        if (markers[i]) { markers[i].setStyle({color: color, fillColor: color}); }
+                    });
+                }
+            }
+
+            // 表示範囲の差分だけ点を追加・削除する
+            function show(day) {
+                var before = visible(current), after = visible(day);
+                each(before[0], Math.min(before[1], after[0]), function(i) { group.removeLayer(markers[i]); });
+                each(Math.max(before[0], after[1]), before[1], function(i) { group.removeLayer(markers[i]); });
+                recolor(current, OLD);
+                each(after[0], Math.min(after[1], before[0]), function(i) { group.addLayer(marker(i)); });
+                each(Math.max(after[0], before[1]), after[1], function(i) { group.addLayer(marker(i)); });
+                recolor(day, NEW);
+                current = day;
+                slider.value = day;
+                var date = new Date(Date.parse(data.start + 'T00:00:00Z') + day * 86400000);
+                label.textContent = date.toISOString().slice(0, 10) + '  (直近' + data.window + '日: '
+                    + (after[1] - after[0]) + '件)';
+            }
+
+            function stop() { if (timer) { clearInterval(timer); timer = null; button.textContent = '▶'; } }
+            function play() {
+                if (current >= data.days - 1) { show(0); }
+                button.textContent = '❚❚';
+                timer = setInterval(function() {
+                    if (current >= data.days - 1) { stop(); } else { show(current + 1); }
+                }, {{ this.interval }});
+            }
+
+            var control = L.control({position: 'bottomleft'});
+            var button, slider, label;
+            control.onAdd = function() {
+                var div = L.DomUtil.create('div', 'leaflet-bar');
+                div.style.cssText = 'background:#fff;padding:6px 8px;font:12px sans-serif;min-width:320px';
+                button = L.DomUtil.create('button', '', div);
+                button.textContent = '▶';
+                button.style.cssText = 'width:32px;margin-right:6px';
+                slider = L.DomUtil.create('input', '', div);
+                slider.type = 'range'; slider.min = 0; slider.max = data.days - 1; slider.value = 0;
+                slider.style.cssText = 'width:220px;vertical-align:middle';
+                label = L.DomUtil.create('div', '', div);
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+                L.DomEvent.on(button, 'click', function() { timer ? stop() : play(); });
+                L.DomEvent.on(slider, 'input', function() { stop(); show(parseInt(slider.value, 10)); });
+                return div;
+            };
+
+            // レイヤーの表示・非表示 (差し替え時を含む) に合わせてコントロールも出し入れする
+            group.on('add', function() { control.addTo(group._map); show(Math.max(current, 0)); });
+            group.on('remove', function() { stop(); control.remove(); });
+            if (group._map) { control.addTo(group._map); show(0); }
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, payload: dict, interval_ms: int = FRAME_INTERVAL_MS):
+        super().__init__()
+        self._name = "PlaybackControl"
+        self.payload_json = json.dumps(payload, separators=(",", ":"))
+        self.interval = int(interval_ms)
+
+
+def create_playback_layer(df: pd.DataFrame, start_date, end_date, window_days: int = 7) -> folium.FeatureGroup:
+    """
+    再生用の FeatureGroup を返す (点は空で、ブラウザ側で日ごとに追加・削除される)。
+    """
+    layer = folium.FeatureGroup(name="再生", show=True)
+    layer.add_child(PlaybackControl(build_playback_payload(df, start_date, end_date, window_days)))
+    return layer
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+データ更新 (scraping_and_processing.py) をバックグラウンドで実行するためのジョブ管理。
+
+- 同時に走るパイプラインは1つだけ (実行中に再度要求されても新しく起動しない)
+- パイプラインが標準出力に書く進捗行を読み取り、段階ごとの進捗と所要時間を記録する
+- 完了ごとに generation を1つ進め、各セッションがキャッシュの読み直しを判断できるようにする
+"""
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows では別プロセス間の排他は行わない
+    fcntl = None
+
+# パイプラインが進捗を知らせる行の接頭辞
+PROGRESS_PREFIX = "##progress "
+
+# 別プロセス (アプリを複数起動している場合) との排他に使うロックファイル
+LOCK_FILE = ".refresh.lock"
+
+# 画面に表示するログの最大行数
+LOG_TAIL_LINES = 50
+
+
+def report_progress(stage: str, step: int, total: int):
+    """
+    パイプライン側から呼び出し、段階 stage (全 total 段階中 step 段階目) の開始を知らせる。
+    RefreshJob がこの行を読み取って進捗に反映する。
+    """
+    payload = {"stage": stage, "step": step, "total": total}
+    print(PROGRESS_PREFIX + json.dumps(payload, ensure_ascii=False), flush=True)
+
+
+class RefreshJob:
+    """
+    パイプラインを1つだけバックグラウンドで実行し、その状態を保持する。
+    状態の読み書きはすべて self._lock の中で行う。
+    """
+
+    def __init__(self, command: list = None, cwd: str = None):
+        self.command = command or [sys.executable, "-u", "scraping_and_processing.py"]
+        self.cwd = cwd
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = "idle"          # idle / running / succeeded / failed
+        self.stage = None
+        self.progress = 0.0
+        self.stages = []             # [{"stage": ..., "seconds": ...}, ...]
+        self.log_tail = []
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.generation = 0          # 成功するたびに1つ増える
+
+    # ---------- 起動 ----------
+    def start(self) -> bool:
+        """
+        パイプラインを起動する。すでに実行中なら何もせず False を返す。
+        """
+        with self._lock:
+            if self.state == "running":
+                return False
+            self.state = "running"
+            self.stage = "起動中"
+            self.progress = 0.0
+            self.stages = []
+            self.log_tail = []
+            self.error = None
+            self.started_at = datetime.now()
+            self.finished_at = None
+            self._thread = threading.Thread(target=self._run, name="bear-refresh", daemon=True)
+            self._thread.start()
+        return True
+
+    def status(self) -> dict:
+        """
+        現在の状態のスナップショットを返す。
+        """
+        with self._lock:
+            return {
+                "state": self.state,
+                "stage": self.stage,
+                "progress": self.progress,
+                "stages": [dict(s) for s in self.stages],
+                "log_tail": list(self.log_tail),
+                "error": self.error,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "generation": self.generation,
+            }
+
+    # ---------- 実行スレッド ----------
+    def _run(self):
+        lock_fp = None
+        try:
+            lock_fp = self._acquire_process_lock()
+            if lock_fp is False:
+                self._finish(False, "別のプロセスでデータ更新が実行中です。")
+                return
+
+            proc = subprocess.Popen(
+                self.command,
+                cwd=self.cwd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                env=dict(os.environ, PYTHONUNBUFFERED="1"),
+            )
+            stage_started = time.perf_counter()
+            for line in proc.stdout:
+                line = line.rstrip("\n")
+                if line.startswith(PROGRESS_PREFIX):
+                    stage_started = self._on_progress(line[len(PROGRESS_PREFIX):], stage_started)
+                else:
+                    self._append_log(line)
+            returncode = proc.wait()
+            self._close_stage(stage_started)
+
+            if returncode == 0:
+                self._finish(True)
+            else:
+                self._finish(False, f"終了コード {returncode}")
+        except Exception as e:
+            self._finish(False, str(e))
+        finally:
+            if lock_fp:
+                lock_fp.close()
+
+    def _acquire_process_lock(self):
+        """
+        ロックファイルを排他ロックする。他プロセスが保持中なら False を返す。
+        """
+        if fcntl is None:
+            return None
+        lock_path = os.path.join(self.cwd or ".", LOCK_FILE)
+        fp = open(lock_path, "w")
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fp.close()
+            return False
+        return fp
+
+    def _on_progress(self, payload: str, stage_started: float) -> float:
+        """
+        進捗行を反映し、直前の段階の所要時間を記録する。新しい段階の開始時刻を返す。
+        """
+        try:
+            info = json.loads(payload)
+        except ValueError:
+            return stage_started
+        self._close_stage(stage_started)
+        with self._lock:
+            self.stage = info.get("stage")
+            total = max(int(info.get("total", 1)), 1)
+            self.progress = min(max(int(info.get("step", 0)) - 1, 0) / total, 1.0)
+        return time.perf_counter()
+
+    def _close_stage(self, stage_started: float):
+        with self._lock:
+            if self.stage and self.stage != "起動中" and not any(
+                    s["stage"] == self.stage for s in self.stages):
+                self.stages.append({
+                    "stage": self.stage,
+                    "seconds": round(time.perf_counter() - stage_started, 2),
+                })
+
+    def _append_log(self, line: str):
+        with self._lock:
+            self.log_tail.append(line)
+            del self.log_tail[:-LOG_TAIL_LINES]
+
+    def _finish(self, ok: bool, error: str = None):
+        with self._lock:
+            self.state = "succeeded" if ok else "failed"
+            self.error = error
+            self.finished_at = datetime.now()
+            if ok:
+                self.progress = 1.0
+                self.generation += 1
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Streamlit アプリ (app.py) の描画1回分を段階 (phase) ごとに計測するモジュール。
+
+URL に ?profile=1 を付けるか、環境変数 BEAR_APP_PROFILE=1 を設定したときだけ有効になる。
+有効なときは、段階ごとの時間 (ミリ秒) と地図HTMLのサイズをサイドバーのデバッグ欄に表示し、
+1回の描画を1行として app_render_profile.jsonl に追記する。
+summarize() はこのログから段階ごとの p50 / p95 を求める (リリース間の比較用)。
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# 計測を有効にする環境変数と、記録の保存先
+PROFILE_ENV = "BEAR_APP_PROFILE"
+PROFILE_LOG_FILE = "app_render_profile.jsonl"
+
+# summarize() で集計する直近の記録数
+SUMMARY_WINDOW = 500
+
+# ログの末尾から読むときの1回の読み込みサイズ (バイト)
+TAIL_CHUNK_BYTES = 64 * 1024
+
+# 複数セッションからの同時追記を防ぐ
+_LOG_LOCK = threading.Lock()
+
+
+def profiling_requested(query_params) -> bool:
+    """
+    クエリパラメータ (?profile=1) か環境変数で計測が要求されているかを返す。
+    """
+    if os.environ.get(PROFILE_ENV, "") not in ("", "0"):
+        return True
+    return str(query_params.get("profile", "")) in ("1", "true")
+
+
+class RenderProfiler:
+    """
+    phase() で囲んだ区間の時間と、set() で渡した値 (地図HTMLのバイト数など) を記録する。
+    enabled=False のときは何も計測しない。
+    """
+
+    def __init__(self, enabled: bool, log_path: str = PROFILE_LOG_FILE):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.phases = {}
+        self.values = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.phases[name] = round(self.phases.get(name, 0.0) + elapsed, 2)
+
+    def set(self, name: str, value):
+        if self.enabled:
+            self.values[name] = value
+
+    def finish(self) -> dict:
+        """
+        描画全体の時間を加えた記録を返し、ログファイルに1行追記する。
+        """
+        if not self.enabled:
+            return None
+        record = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "total_ms": round((time.perf_counter() - self._start) * 1000, 2),
+            "phases": self.phases,
+            **self.values,
+        }
+        with _LOG_LOCK:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+
+def _percentile(sorted_values: list, q: float) -> float:
+    """
+    昇順のリストの q 分位点 (最近傍順位法)。
+    """
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _tail_lines(log_path: str, count: int) -> list:
+    """
+    ファイルの末尾 count 行を返す。ログは描画のたびに伸びるため、全体は読まずに
+    末尾からブロック単位でさかのぼって読む。
+    """
+    with open(log_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # 途中で切れた先頭行を捨てられるよう、count + 1 行分の改行が見つかるまで読む
+        while pos > 0 and data.count(b"\n") <= count:
+            size = min(TAIL_CHUNK_BYTES, pos)
+            pos -= size
+            f.seek(pos)
+            data = f.read(size) + data
+    # 先頭の切れた行は捨てるので、途中で切れた文字も置き換えで済ませる
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    if pos > 0:
+        lines = lines[1:]
+    return [line for line in lines if line.strip()][-count:]
+
+
+def summarize(log_path: str = PROFILE_LOG_FILE, window: int = SUMMARY_WINDOW) -> dict:
+    """
+    直近 window 件の記録から、段階ごと (と total_ms・map_html_bytes) の
+    {"count", "p50", "p95"} を返す。記録が無ければ空の辞書。
+    """
+    if not os.path.exists(log_path):
+        return {}
+    records = [json.loads(line) for line in _tail_lines(log_path, window)]
+
+    series = {}
+    for record in records:
+        series.setdefault("total_ms", []).append(record["total_ms"])
+        for name, ms in record.get("phases", {}).items():
+            series.setdefault(name, []).append(ms)
+        if "map_html_bytes" in record:
+            series.setdefault("map_html_bytes", []).append(record["map_html_bytes"])
+
+    summary = {}
+    for name, values in series.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50": _percentile(values, 0.50),
+            "p95": _percentile(values, 0.95),
+        }
+    return summary
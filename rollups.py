@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+統計情報タブ用に、目撃件数を「都道府県 × 市町村 × 路線近接 × 期間(日/週/月)」の
+集計キューブとして事前に持っておくモジュール。
+
+パイプラインが新しく届いた行だけを add() で加算しておけば、
+アプリ側は生データを集計し直さずに、累積和 (prefix sum) の差分と
+グループ単位の足し算だけで時系列グラフ・市町村別グラフを作れる。
+"""
+
+import numpy as np
+import pandas as pd
+
+from density_grid import DAY_EPOCH, to_day_number, to_day_numbers
+from geo_utils import add_lines_near_column, lines_from_mask
+
+# 集計結果の保存先
+ROLLUP_FILE = "bear_rollups.npz"
+
+# 路線を問わない集計を表す路線キー
+ALL_LINES = "*"
+
+# 期間の種類 (日/週/月)
+FREQS = ("D", "W", "M")
+
+
+# ----------------------------------------------
+# 日番号 <-> 期間番号の変換
+# ----------------------------------------------
+def to_period_numbers(days: np.ndarray, freq: str) -> np.ndarray:
+    """
+    日番号 (DAY_EPOCH からの経過日数) を期間番号に変換する。
+    週は月曜始まり (DAY_EPOCH の 2000-01-01 は土曜日なので2日ずらす)、
+    月は 2000年1月を0とする通し番号。
+    """
+    days = np.asarray(days, dtype=np.int64)
+    if freq == "D":
+        return days
+    if freq == "W":
+        return (days + 5) // 7
+    if freq == "M":
+        dates = DAY_EPOCH + pd.to_timedelta(days, unit="D")
+        return ((dates.year - DAY_EPOCH.year) * 12 + dates.month - 1).to_numpy(dtype=np.int64)
+    raise ValueError(f"未対応の期間です: {freq}")
+
+
+def period_start_dates(periods: np.ndarray, freq: str) -> pd.DatetimeIndex:
+    """
+    期間番号を、その期間の初日の日付に変換する。
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    if freq == "D":
+        return DAY_EPOCH + pd.to_timedelta(periods, unit="D")
+    if freq == "W":
+        return DAY_EPOCH + pd.to_timedelta(periods * 7 - 5, unit="D")
+    if freq == "M":
+        years = DAY_EPOCH.year + periods // 12
+        months = periods % 12 + 1
+        return pd.to_datetime(pd.DataFrame({"year": years, "month": months, "day": 1}))
+    raise ValueError(f"未対応の期間です: {freq}")
+
+
+# ----------------------------------------------
+# 集計キューブ
+# ----------------------------------------------
+class SightingRollups:
+    """
+    グループ (都道府県, 市町村, 路線) ごと・期間ごとの件数を
+    期間の種類ごとに (グループ数, 期間数) の int32 行列で保持する。
+
+    路線キーには、路線を問わない集計用の ALL_LINES と、
+    目撃地点の近くにある各路線名が入る(1件が複数の路線に数えられる)。
+    """
+
+    def __init__(self):
+        self.groups = []          # [(prefecture, city, line), ...]
+        self._group_index = {}    # (prefecture, city, line) -> 行番号
+        self.first_period = {freq: 0 for freq in FREQS}
+        self.counts = {freq: np.zeros((0, 0), dtype=np.int32) for freq in FREQS}
+        self._prefix = {}
+
+    # ---------- グループ・期間の拡張 ----------
+    def _group_ids(self, keys: list) -> np.ndarray:
+        """
+        グループキーを行番号に変換する。未登録のグループは行を追加する。
+        """
+        ids = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            gid = self._group_index.get(key)
+            if gid is None:
+                gid = len(self.groups)
+                self._group_index[key] = gid
+                self.groups.append(key)
+            ids[i] = gid
+
+        n_groups = len(self.groups)
+        for freq in FREQS:
+            matrix = self.counts[freq]
+            if matrix.shape[0] < n_groups:
+                pad = np.zeros((n_groups - matrix.shape[0], matrix.shape[1]), dtype=np.int32)
+                self.counts[freq] = np.vstack([matrix, pad])
+        return ids
+
+    def _ensure_periods(self, freq: str, lo: int, hi: int):
+        """
+        期間番号 lo〜hi (両端含む) が行列の列に収まるよう左右を広げる。
+        """
+        matrix = self.counts[freq]
+        first = self.first_period[freq]
+        if matrix.shape[1] == 0:
+            self.first_period[freq] = lo
+            self.counts[freq] = np.zeros((matrix.shape[0], hi - lo + 1), dtype=np.int32)
+            return
+
+        last = first + matrix.shape[1] - 1
+        left = max(0, first - lo)
+        right = max(0, hi - last)
+        if left or right:
+            self.counts[freq] = np.pad(matrix, ((0, 0), (left, right)))
+            self.first_period[freq] = first - left
+
+    # ---------- 加算(差分更新) ----------
+    def add(self, df: pd.DataFrame, lines_data: dict = None, sign: int = 1) -> int:
+        """
+        prefecture, city, date, latitude, longitude 列を持つ df の各行を加算する。
+        lines_near 列が無ければ、lines_mask 列 (sightings_data.compact_sightings) か
+        座標から lines_data を使って求める。
+        sign=-1 を渡すと取り消された行を減算する。加算した行数を返す。
+        """
+        df = df.dropna(subset=["date", "latitude", "longitude"])
+        if df.empty:
+            return 0
+        if "lines_near" in df.columns:
+            lines_near = df["lines_near"]
+        elif "lines_mask" in df.columns:
+            names = {m: lines_from_mask(m, lines_data) for m in np.unique(df["lines_mask"]).tolist()}
+            lines_near = [names[m] for m in df["lines_mask"].tolist()]
+        else:
+            lines_near = add_lines_near_column(df.copy(), lines_data)["lines_near"]
+
+        days = to_day_numbers(df["date"])
+        prefs = df["prefecture"].astype(object).fillna("").astype(str).tolist()
+        cities = df["city"].astype(object).fillna("").astype(str).tolist()
+
+        # 1行を (全路線 + 近くの各路線) の複数グループに展開する
+        keys = []
+        rows = []
+        for i, (pref, city, lines) in enumerate(zip(prefs, cities, lines_near)):
+            keys.append((pref, city, ALL_LINES))
+            rows.append(i)
+            for line_name in lines:
+                keys.append((pref, city, line_name))
+                rows.append(i)
+
+        gids = self._group_ids(keys)
+        rows = np.asarray(rows, dtype=np.int64)
+        for freq in FREQS:
+            periods = to_period_numbers(days, freq)[rows]
+            self._ensure_periods(freq, int(periods.min()), int(periods.max()))
+            cols = periods - self.first_period[freq]
+            np.add.at(self.counts[freq], (gids, cols), sign)
+
+        self._prefix.clear()
+        return len(df)
+
+    # ---------- 集計結果の取得 ----------
+    def _prefix_sums(self, freq: str) -> np.ndarray:
+        """
+        期間方向の累積和。prefix[:, j] は先頭から j-1 列目までの合計。
+        """
+        if freq not in self._prefix:
+            matrix = self.counts[freq]
+            prefix = np.zeros((matrix.shape[0], matrix.shape[1] + 1), dtype=np.int64)
+            np.cumsum(matrix, axis=1, out=prefix[:, 1:])
+            self._prefix[freq] = prefix
+        return self._prefix[freq]
+
+    def _column_range(self, freq: str, start, end) -> tuple:
+        """
+        日付範囲 [start, end] を行列の列範囲 [lo, hi) に変換する。
+        """
+        n_cols = self.counts[freq].shape[1]
+        first = self.first_period[freq]
+        lo = 0
+        hi = n_cols
+        if start is not None:
+            lo = int(to_period_numbers([to_day_number(start)], freq)[0]) - first
+        if end is not None:
+            hi = int(to_period_numbers([to_day_number(end)], freq)[0]) - first + 1
+        return max(0, min(lo, n_cols)), max(0, min(hi, n_cols))
+
+    def _select_groups(self, prefecture=None, line=None) -> np.ndarray:
+        """
+        都道府県・路線の条件に合うグループの行番号を返す。
+        line が None / "すべて" の場合は ALL_LINES の行を使う(二重計上を避けるため)。
+        """
+        line_key = ALL_LINES if line in (None, "すべて") else line
+        return np.array([
+            gid for gid, (pref, _, line_name) in enumerate(self.groups)
+            if line_name == line_key and (prefecture is None or pref == prefecture)
+        ], dtype=np.int64)
+
+    def time_series(self, freq: str = "D", start=None, end=None,
+                    prefecture=None, line=None) -> pd.Series:
+        """
+        条件に合う目撃件数を期間ごとに合計し、期間の初日を index とする Series で返す。
+        件数0の期間は含めない。週・月単位でも範囲外の日は数えない
+        (範囲の端にかかる期間は日別の累積和の差分で、内側の期間は週・月の列で数える)。
+        """
+        gids = self._select_groups(prefecture, line)
+        lo, hi = self._column_range("D", start, end)
+        if hi <= lo or len(gids) == 0:
+            return pd.Series(dtype=np.int64, name="count")
+        if freq == "D":
+            totals = self.counts["D"][gids, lo:hi].sum(axis=0)
+            nonzero = np.nonzero(totals)[0]
+            periods = self.first_period["D"] + lo + nonzero
+            return pd.Series(totals[nonzero], index=period_start_dates(periods, "D"), name="count")
+
+        # 範囲内の最初と最後の日 (データのある範囲に切り詰めたもの) と、それを含む期間
+        first_day = self.first_period["D"] + lo
+        last_day = self.first_period["D"] + hi - 1
+        p0, p1 = to_period_numbers([first_day, last_day], freq).tolist()
+        totals = np.zeros(p1 - p0 + 1, dtype=np.int64)
+
+        # 内側の期間 (まるごと範囲内) は週・月の列から
+        if p1 - p0 >= 2:
+            first = self.first_period[freq]
+            c_lo = max(p0 + 1 - first, 0)
+            c_hi = min(p1 - first, self.counts[freq].shape[1])
+            if c_hi > c_lo:
+                totals[c_lo + first - p0:c_hi + first - p0] = self.counts[freq][gids, c_lo:c_hi].sum(axis=0)
+
+        # 端の期間は、範囲内の日だけを日別の累積和で数える
+        p1_first_day = to_day_number(period_start_dates([p1], freq)[0])
+        if p0 == p1:
+            totals[0] = self._day_total(gids, first_day, last_day)
+        else:
+            p0_last_day = to_day_number(period_start_dates([p0 + 1], freq)[0]) - 1
+            totals[0] = self._day_total(gids, first_day, p0_last_day)
+            totals[-1] = self._day_total(gids, p1_first_day, last_day)
+
+        nonzero = np.nonzero(totals)[0]
+        return pd.Series(totals[nonzero], index=period_start_dates(p0 + nonzero, freq), name="count")
+
+    def _day_total(self, gids: np.ndarray, first_day: int, last_day: int) -> int:
+        """
+        グループ gids の、日番号 first_day〜last_day (両端含む) の合計件数。
+        """
+        prefix = self._prefix_sums("D")
+        n_cols = self.counts["D"].shape[1]
+        lo = min(max(first_day - self.first_period["D"], 0), n_cols)
+        hi = min(max(last_day - self.first_period["D"] + 1, 0), n_cols)
+        if hi <= lo:
+            return 0
+        return int((prefix[gids, hi] - prefix[gids, lo]).sum())
+
+    def city_counts(self, start=None, end=None, prefecture=None, line=None) -> pd.Series:
+        """
+        条件に合う目撃件数を市町村ごとに合計し、件数の多い順の Series で返す。
+        期間内の合計は日別の累積和の差分で求める。
+        """
+        lo, hi = self._column_range("D", start, end)
+        gids = self._select_groups(prefecture, line)
+        if hi <= lo or len(gids) == 0:
+            return pd.Series(dtype=np.int64, name="count")
+
+        prefix = self._prefix_sums("D")
+        totals = prefix[gids, hi] - prefix[gids, lo]
+        cities = [self.groups[gid][1] for gid in gids]
+        counts = pd.Series(totals, index=cities, name="count").groupby(level=0).sum()
+        counts = counts[counts > 0]
+        return counts.sort_values(ascending=False, kind="mergesort")
+
+    # ---------- 保存・読み込み ----------
+    def save(self, file_path: str = ROLLUP_FILE):
+        """
+        集計結果を npz 形式で保存する。
+        """
+        arrays = {"groups": np.array(self.groups, dtype=str).reshape(-1, 3)}
+        for freq in FREQS:
+            arrays[f"first_{freq}"] = np.array(self.first_period[freq])
+            arrays[f"counts_{freq}"] = self.counts[freq]
+        np.savez_compressed(file_path, **arrays)
+
+    @classmethod
+    def load(cls, file_path: str = ROLLUP_FILE) -> "SightingRollups":
+        """
+        save() で保存した集計結果を読み込む。
+        """
+        rollups = cls()
+        with np.load(file_path) as data:
+            rollups.groups = [tuple(row) for row in data["groups"].tolist()]
+            rollups._group_index = {key: gid for gid, key in enumerate(rollups.groups)}
+            for freq in FREQS:
+                rollups.first_period[freq] = int(data[f"first_{freq}"])
+                rollups.counts[freq] = data[f"counts_{freq}"]
+        return rollups
+
+
+def build_rollups(df: pd.DataFrame, lines_data: dict = None) -> SightingRollups:
+    """
+    DataFrame 全体から SightingRollups を作る。
+    """
+    rollups = SightingRollups()
+    rollups.add(df, lines_data)
+    return rollups
@@ -3,367 +3,42 @@
 """
 熊目撃情報を自動でスクレイピング、PDF解析、データ整形し、
 最終的に住所→座標を付与したCSVを出力するメイン処理コード。
+
+段階ごとに実行できるサブコマンドを持つ:
+  python scraping_and_processing.py                      # 全段階 (all と同じ)
+  python scraping_and_processing.py ingest               # PDF取得・解析 (取得元ごとに並列)
+  python scraping_and_processing.py fetch                # PDF取得のみ
+  python scraping_and_processing.py parse --pref 山梨    # PDF解析のみ (--pref 省略時はすべての取得元)
+  python scraping_and_processing.py combine              # JSON統合
+  python scraping_and_processing.py geocode              # 座標付与〜集計更新
+  python scraping_and_processing.py bench-imports        # 依存ライブラリの import 時間を計測
+
+県ごとの取得・解析は sources.py の取得元プラグインに、並列実行は ingest.py にある。
+selenium・pdfplumber・pandas などの重い依存は、使う段階の関数の中で import する。
+そのため geocode だけを再実行する場合は selenium (Chrome) が無くても動き、起動も速い。
 """
 
+from __future__ import annotations
+
+import argparse
 import os
-import requests
-import json
 import re
-import pdfplumber
-import pandas as pd
-import yaml
-import numpy as np
-
-# ====== Selenium + ChromeDriverを使ったスクレイピング関連 ====== #
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-def scrape_pdfs():
-    """
-    静岡県・山梨県・神奈川県の各公式サイトにアクセスし、
-    クマ出没情報が書かれたPDFをダウンロードしてローカルに保存する処理。
-
-    1. WebDriver（ChromeDriver）を起動（ヘッドレスモード）
-    2. 各県のサイトにアクセス
-    3. PDFリンクを見つける(PARTIAL_LINK_TEXTなどで検索)
-    4. リンク先のPDFファイルを取得し、"kuma_r6_◯◯.pdf"という名前で保存
-    5. エラー時はログ出力
-    6. 最後にブラウザを閉じる
-    """
-
-    # Chromeのオプション設定（ヘッドレス：画面表示しないモード）
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-
-    # WebDriverのインスタンス生成
-    driver = webdriver.Chrome(options=options)
-
-    # ========== 山梨県のPDF ========== #
-    # 県公式サイトを開く
-    yamanashi_url = "https://www.pref.yamanashi.jp/shizen/kuma2.html"
-    driver.get(yamanashi_url)
-    try:
-        # ページが完全に読み込まれるまで最大10秒待機
-        wait = WebDriverWait(driver, 10)
-        # テキストの一部に「令和6年度（2024年度）ツキノワグマ出没・目撃情報」という文字列を含むリンクを探す
-        link = wait.until(
-            EC.presence_of_element_located((By.PARTIAL_LINK_TEXT, "令和6年度（2024年度）ツキノワグマ出没・目撃情報"))
-        )
-        # リンクのhref属性（実際のPDFファイルのURL）を取得
-        pdf_url = link.get_attribute("href")
-        # ダウンロード先ファイル名を指定
-        pdf_path = "kuma_r6_yamanashi.pdf"
-
-        # requestsでPDFをGETリクエストし、バイナリとして保存する
-        r = requests.get(pdf_url)
-        with open(pdf_path, 'wb') as f:
-            f.write(r.content)
-
-        print("[山梨県] PDF保存:", pdf_path)
-
-    except Exception as e:
-        print("山梨県のPDF取得エラー:", e)
-
-    # ========== 静岡県のPDF ========== #
-    shizuoka_url = "https://www.pref.shizuoka.jp/kurashikankyo/shizenkankyo/wild/1017680.html"
-    driver.get(shizuoka_url)
-    try:
-        wait = WebDriverWait(driver, 10)
-        # 「【NEW】クマ出没マップ」という文字を含むリンクを検索
-        link = wait.until(
-            EC.presence_of_element_located((By.PARTIAL_LINK_TEXT, "【NEW】クマ出没マップ"))
-        )
-        pdf_url = link.get_attribute("href")
-        pdf_path = "kuma_r6_shizuoka.pdf"
-
-        r = requests.get(pdf_url)
-        with open(pdf_path, 'wb') as f:
-            f.write(r.content)
-
-        print("[静岡県] PDF保存:", pdf_path)
-    except Exception as e:
-        print("静岡県のPDF取得エラー:", e)
-
-    # ========== 神奈川県のPDF ========== #
-    kanagawa_url = "https://www.pref.kanagawa.jp/docs/t4i/cnt/f3813/"
-    driver.get(kanagawa_url)
-    try:
-        wait = WebDriverWait(driver, 10)
-        # 「ツキノワグマの目撃等情報を更新しました」という文字を含むリンクを検索
-        link = wait.until(
-            EC.presence_of_element_located((By.PARTIAL_LINK_TEXT, "ツキノワグマの目撃等情報を更新しました"))
-        )
-        pdf_url = link.get_attribute("href")
-        pdf_path = "kuma_r6_kanagawa.pdf"
-
-        r = requests.get(pdf_url)
-        with open(pdf_path, 'wb') as f:
-            f.write(r.content)
+import subprocess
+import sys
 
-        print("[神奈川県] PDF保存:", pdf_path)
-    except Exception as e:
-        print("神奈川県のPDF取得エラー:", e)
+from refresh_job import report_progress
+from pipeline_metrics import start_run, finish_run, stage, record, record_error, METRICS_DIR
+from sources import SOURCES, get_sources
+from ingest import run_sources, ALL_STEPS, MAX_WORKERS, SOURCE_TIMEOUT_S, RETRIES
 
-    # 最後にドライバを終了させる
-    driver.quit()
+# 集計ファイル (密度グリッド・ロールアップ・ホットスポット・路線区間) が反映済みの変更ログの版
+AGGREGATES_VERSION_FILE = "bear_aggregates_version.json"
 
-
-def parse_kanagawa_pdf():
-    """
-    神奈川県のPDF (kuma_r6_kanagawa.pdf) を解析し、
-    「日付」「時間」「頭数」「状況」「場所等」などの情報を抽出して
-    JSONファイル (bear_sightings_kanagawa.json) として保存する。
-
-    ※ pdfplumberでPDFからテキスト抽出
-    ※ 正規表現を使って「○月○日」形式の日付などを拾う
-    ※ データの形式は適宜調整
-    """
-    pdf_path = "kuma_r6_kanagawa.pdf"
-    json_path = "bear_sightings_kanagawa.json"
-
-    try:
-        # pdfplumberでPDFを開く
-        with pdfplumber.open(pdf_path) as pdf:
-            all_lines = []
-            # 各ページを順番に処理
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    # 改行ごとに分割してリストにためる
-                    all_lines.extend(text.split('\n'))
-
-        # PDFの表に含まれていそうなカラムタイトル（神奈川の想定）
-        column_titles = ["月日", "時間", "頭数", "状況", "場所等", "区分", "目撃・痕跡", "その他"]
-        # 「○月○日」を検出するための正規表現 (1〜9月 or 10〜12月)
-        date_pattern = re.compile(r'(1[0-2]|[1-9])月(\d{1,2})日')
-
-        sightings = []
-        # テキスト行を順番に見て、必要情報を抽出
-        for line in all_lines:
-            # 不要な行やカラムタイトル行を除外する
-            if (not line.strip() or
-                '《目撃・痕跡・その他》' in line or
-                # column_titles内の全ての単語を含む場合、タイトル行とみなす
-                all(title in line for title in column_titles)):
-                continue
-
-            # 「○月○日」のパターンを探す
-            m = date_pattern.search(line)
-            if not m:
-                continue
-
-            # date_strには例えば「6月19日」のような文字列が入る
-            date_str = m.group(0)
-
-            # 日付の文字列の末尾までで一旦切り、その後の部分を解析する
-            after_date_part = line[m.end():].strip()
-            # スペース区切りで分割
-            parts = after_date_part.split()
-
-            # 最低限、分割結果が5要素以上あるかチェック
-            if len(parts) >= 5:
-                time = parts[0]               # 例: 14:00
-                number_of_bears = parts[1]    # 例: 1頭
-                status = parts[2]            # 例: 徘徊
-                area_type = parts[-2]        # 例: ○○区分
-                observation_type = parts[-1] # 例: 目撃 or 痕跡など
-
-                # 場所については3番目〜(末尾-2)までを結合
-                location_parts = parts[3:-2]
-                location = " ".join(location_parts) if location_parts else ""
-
-                # 辞書としてまとめる
-                sightings.append({
-                    "date": date_str,
-                    "time": time,
-                    "number_of_bears": number_of_bears,
-                    "status": status,
-                    "location": location,
-                    "area_type": area_type,
-                    "observation_type": observation_type
-                })
-
-        # JSONファイルに書き出す
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(sightings, f, ensure_ascii=False, indent=2)
-
-        print("[神奈川] JSON保存:", json_path)
-
-    except Exception as e:
-        print("[神奈川] PDF解析エラー:", e)
-
-
-def parse_yamanashi_pdf():
-    """
-    山梨県のPDF (kuma_r6_yamanashi.pdf) を解析し、
-    「日付（2024/6/4 など）」「時間」「市町村」「場所」「熊の頭数」を抽出して
-    JSONファイル (bear_sightings_yamanashi.json) として保存する。
-
-    PDF内の日付は「2024/7/12」のような文字列が含まれていると想定。
-    """
-    pdf_path = "kuma_r6_yamanashi.pdf"
-    json_path = "bear_sightings_yamanashi.json"
-
-    try:
-        sightings = []
-
-        # pdfplumberを用いて、PDF全ページからテキストを取得
-        with pdfplumber.open(pdf_path) as pdf:
-            all_lines = []
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    all_lines.extend(text.split('\n'))
-
-        # 日付パターン: 年4桁/1-2桁/月1-2桁/日の形式 (例: 2024/6/20)
-        date_pattern = re.compile(r'(\d{4}/\d{1,2}/\d{1,2})')
-
-        # 市町村を抽出するための例示的な正規表現
-        city_pattern = re.compile(r'(.+?[市町村])(.*)')
-        # 天候情報等を取り除く例示的なパターン
-        location_pattern = re.compile(r'([^晴雨曇]{2,}?)((?:晴|雨|曇|霧|雪|地内).*)')
-
-        for line in all_lines:
-            # 空行や不要行はスキップ
-            if not line.strip() or '《目撃・痕跡・その他》' in line:
-                continue
-
-            # 行に日付パターンがあるか確認
-            m = date_pattern.search(line)
-            if not m:
-                continue
-
-            # 例: "2024/6/4"
-            date_str = m.group(1)
-
-            # 日付の後ろの部分を抽出
-            after_date_part = line[m.end():].strip()
-
-            # "頃"の後ろにスペースが無い場合、ある程度整形する（例: "14:00頃近く" → "14:00頃 近く"）
-            after_date_part = re.sub(r'頃(?!\s)', '頃 ', after_date_part)
-
-            # スペース区切り
-            parts = after_date_part.split()
-            if len(parts) < 3:
-                continue
-
-            # parts[0]に時間が入る想定 (例: "14:00頃")
-            time = parts[0]
-
-            # 残りの文字列は市町村＋地名を含むと想定
-            remaining_text = ' '.join(parts[1:])
-            city_match = city_pattern.match(remaining_text)
-
-            if city_match:
-                # 例: city="甲府市", location_full="○○地区..."
-                city = city_match.group(1)
-                location_full = city_match.group(2).strip()
-
-                # さらに location_full から天候などの文字を分割
-                loc_match = location_pattern.match(location_full)
-                if loc_match:
-                    location = loc_match.group(1).strip()
-                else:
-                    # 該当がなければ先頭単語だけを場所とする暫定ロジック
-                    location = location_full.split()[0] if location_full.split() else location_full
-            else:
-                # city_patternに合致しない場合の暫定処理
-                city = parts[1]
-                location = parts[2]
-
-            # 熊の頭数を探す。parts[3:] の中に数字があれば最後のものを利用する想定
-            remaining = parts[3:]
-            nums = [re.sub(r'\D', '', x) for x in remaining if re.search(r'\d+', x)]
-            bear_count = nums[-1] if nums else "不明"
-
-            # 取得情報をリストに格納
-            sightings.append({
-                "date": date_str,
-                "time": time,
-                "city": city,
-                "location": location,
-                "bear_count": bear_count
-            })
-
-        # JSON出力
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(sightings, f, ensure_ascii=False, indent=2)
-
-        print("[山梨] JSON保存:", json_path)
-
-    except Exception as e:
-        print("[山梨] PDF解析エラー:", e)
-
-
-def parse_shizuoka_pdf():
-    """
-    静岡県のPDF (kuma_r6_shizuoka.pdf) を解析し、
-    目撃情報を JSONファイル (bear_sightings_shizuoka.json) として保存する。
-
-    ここではPDFから必要なエリアを crop()（切り出し）してテキストを抽出する例を示しているが、
-    実際のPDFレイアウトに合わせて変更が必要。
-    """
-    pdf_path = "kuma_r6_shizuoka.pdf"
-    json_path = "bear_sightings_shizuoka.json"
-
-    def extract_text_from_regions(pdf_path, regions):
-        """
-        pdfplumberの crop() を用いて、指定した領域だけを抽出してテキスト化する関数。
-        regions は (x0, top, x1, bottom) のタプルを要素としたリスト。
-        """
-        extracted_texts = []
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                for region in regions:
-                    # 領域を切り出し
-                    crop = page.crop(region)
-                    text = crop.extract_text()
-                    if text:
-                        extracted_texts.append(text)
-        return extracted_texts
-
-    def parse_bear_sightings(texts):
-        """
-        切り出したテキスト群から、日付や地点を正規表現などで解析し、
-        熊目撃情報をリストで返す。
-        """
-        sightings = []
-        for text in texts:
-            lines = text.split('\n')
-            for line in lines:
-                # 例： "1  6月19日  静岡市  ○○地区" のような行を想定
-                match = re.match(r'^(\d+(?:-\d+)?)\s+(\d+月\d+日)\s+(\S+)\s+(.+)$', line.strip())
-                if match:
-                    sightings.append({
-                        "number": match.group(1),
-                        "date": match.group(2),
-                        "municipality": match.group(3),
-                        "location": match.group(4).strip()
-                    })
-        return sightings
-
-    try:
-        # 解析したいページ領域の例 (左上x, 上からの距離, 右下x, 下からの距離)
-        # 実際のPDFレイアウトによって数値調整が必要
-        regions = [
-            (30, 40, 120, 540),   # 仮の領域1
-            (125, 100, 200, 470)  # 仮の領域2
-        ]
-        texts = extract_text_from_regions(pdf_path, regions)
-        sightings = parse_bear_sightings(texts)
-
-        # JSON出力
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(sightings, f, ensure_ascii=False, indent=2)
-
-        print("[静岡] JSON保存:", json_path)
-
-    except Exception as e:
-        print("[静岡] PDF解析エラー:", e)
+# bench-imports で計測するモジュール (重い依存と、このファイル自身)
+BENCH_MODULES = [
+    "requests", "yaml", "numpy", "pandas", "pdfplumber",
+    "selenium.webdriver", "scraping_and_processing",
+]
 
 
 # ========== 日付文字列の変換用 関数 ========== #
@@ -374,6 +49,8 @@ def convert_date(date_str: str) -> pd.Timestamp:
         "6月19日" → (2024年と仮定して) 2024-06-19
     変換できない場合は pd.NaT（Not a Time）を返す。
     """
+    import pandas as pd
+
     if not date_str:
         return pd.NaT
 
@@ -393,102 +70,25 @@ def convert_date(date_str: str) -> pd.Timestamp:
     return pd.NaT
 
 
-def parse_kanagawa_location(loc_str: str):
-    """
-    神奈川データの「location」文字列から市区町村名と残りの住所を分割するための例。
-    「市」「町」「村」のいずれかが出てくる位置を探し、
-    そこまでを市区町村、それ以降を残りの場所とする単純ロジック。
-    """
-    if not loc_str:
-        return pd.NA, pd.NA
-
-    boundary_words = ["市", "町", "村"]
-    idx = None
-    boundary_char = None
-
-    for bw in boundary_words:
-        i = loc_str.find(bw)
-        if i != -1:
-            # 最初に見つかった位置を優先
-            if idx is None or i < idx:
-                idx = i
-                boundary_char = bw
-
-    if idx is not None:
-        # loc_str[: idx + len(boundary_char)] -> ex) "横浜市"
-        city_str = loc_str[: idx + len(boundary_char)]
-        # 残り部分 -> ex) "緑区...XXX"
-        loc_str_remain = loc_str[idx + len(boundary_char) :].strip()
-        return city_str, loc_str_remain
-    else:
-        # "市"などの文字が見つからない場合は全てlocationに入れる
-        return pd.NA, loc_str
-
-
 def combine_json_data():
     """
-    3県（神奈川・静岡・山梨）のJSONファイルを読み込み、
+    登録済みの取得元 (sources.py) ごとの解析結果JSONを読み込み、
     共通フォーマットのDataFrameに整形して
     bear_sightings_combined.csv を出力する。
 
     1. JSONロード（ファイルが無い場合は空リスト）
-    2. 各県ごとに必要項目をピックアップ
+    2. 各取得元の normalize() で必要項目をピックアップ
     3. date カラムを convert_date() でTimestamp化
     4. ソートしてCSVに保存
     """
-    # --- 神奈川 JSONロード --- #
-    try:
-        with open('bear_sightings_kanagawa.json', 'r', encoding='utf-8') as f:
-            kanagawa_data = json.load(f)
-    except:
-        kanagawa_data = []
-
-    # --- 静岡 JSONロード --- #
-    try:
-        with open('bear_sightings_shizuoka.json', 'r', encoding='utf-8') as f:
-            shizuoka_data = json.load(f)
-    except:
-        shizuoka_data = []
-
-    # --- 山梨 JSONロード --- #
-    try:
-        with open('bear_sightings_yamanashi.json', 'r', encoding='utf-8') as f:
-            yamanashi_data = json.load(f)
-    except:
-        yamanashi_data = []
+    import pandas as pd
 
     normalized_data = []
-
-    # ==== 神奈川データを整形 ====
-    for rec in kanagawa_data:
-        raw_location = rec.get('location')
-        # 神奈川特有の「市町村名・残りの住所」の分割関数を適用
-        city_kanagawa, loc_kanagawa = parse_kanagawa_location(raw_location)
-
-        normalized_data.append({
-            'prefecture': '神奈川県',    # 固定
-            'date': rec.get('date'),    # "6月19日"など
-            'city': city_kanagawa,
-            'location': loc_kanagawa
-        })
-
-    # ==== 静岡データを整形 ====
-    for rec in shizuoka_data:
-        normalized_data.append({
-            'prefecture': '静岡県',
-            'date': rec.get('date'),             # "6月19日"など
-            'city': rec.get('municipality'),     # PDFの取り方に準拠
-            'location': rec.get('location')
-        })
-
-    # ==== 山梨データを整形 ====
-    for rec in yamanashi_data:
-        normalized_data.append({
-            'prefecture': '山梨県',
-            'date': rec.get('date'),             # "2024/6/19"など
-            'city': rec.get('city'),
-            'location': rec.get('location')
-        })
+    for source in get_sources():
+        records = source.load_records()
+        normalized_data.extend(source.normalize(records))
+        # 取得元ごとの入力件数を記録
+        record(f"rows_in_{source.slug}", len(records))
 
     # DataFrame化
     df = pd.DataFrame(normalized_data, columns=['prefecture', 'date', 'city', 'location'])
@@ -500,12 +100,14 @@ def combine_json_data():
     df.sort_values('date', inplace=True)
     df.reset_index(drop=True, inplace=True)
 
+    # 件数を記録 (出力件数・日付を変換できなかった件数)
+    record("rows_out", len(df))
+    record("date_unparsed", int(df['date'].isna().sum()))
+
     # CSV書き出し
     output_csv = 'bear_sightings_combined.csv'
     df.to_csv(output_csv, index=False, encoding='utf-8')
-    print("== combine_json_data ==")
-    print(df.head())
-    print(df.tail())
+    print(f"== combine_json_data == {len(df)} 件 (日付変換不可 {int(df['date'].isna().sum())} 件)")
     print("CSV出力:", output_csv)
 
 
@@ -565,6 +167,8 @@ def fix_city_name(pref: str, city: str) -> str:
     市町村名が郡に属している場合など、
     CITY_GUN_MAPで定義されていれば置き換える。
     """
+    import pandas as pd
+
     if pd.isna(city):
         return ""
     return CITY_GUN_MAP.get((pref, city), city)
@@ -580,6 +184,8 @@ def clean_address(city: str, location: str) -> tuple[str, str]:
       - 括弧内（全角＆半角）を除去
       - 不要単語（付近、峠、地区、地内...など）を除去
     """
+    import pandas as pd
+
     # NaNなら空文字に置き換え
     city = '' if pd.isna(city) else str(city)
     location = '' if pd.isna(location) else str(location)
@@ -614,6 +220,8 @@ def load_geo_cache(yaml_path='areas_with_coords.yml') -> dict:
     areas_with_coords.yml をロードして辞書型にする関数。
     例: geo_dict["静岡県"]["静岡市"]["葵区"] = { "longitude": ..., "latitude": ... }
     """
+    import yaml
+
     with open(yaml_path, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
 
@@ -626,13 +234,21 @@ def lookup_coords(pref: str, city: str, area: str, geo_dict: dict) -> dict:
     - 完全一致で見つからなければ "以下に掲載がない場合" を探す
     - それでもなければ None を返す
     """
+    return lookup_coords_with_status(pref, city, area, geo_dict)[0]
+
+
+def lookup_coords_with_status(pref: str, city: str, area: str, geo_dict: dict) -> tuple:
+    """
+    lookup_coords と同じ検索を行い、(座標, 結果の種類) を返す。
+    結果の種類は "exact" (完全一致)・"fallback" ("以下に掲載がない場合")・"miss" (見つからない)。
+    """
     try:
-        return geo_dict[pref][city][area]
+        return geo_dict[pref][city][area], "exact"
     except KeyError:
         try:
-            return geo_dict[pref][city]["以下に掲載がない場合"]
+            return geo_dict[pref][city]["以下に掲載がない場合"], "fallback"
         except KeyError:
-            return {"longitude": None, "latitude": None}
+            return {"longitude": None, "latitude": None}, "miss"
 
 
 def add_coords_from_cache(df: pd.DataFrame, geo_dict: dict) -> pd.DataFrame:
@@ -645,6 +261,7 @@ def add_coords_from_cache(df: pd.DataFrame, geo_dict: dict) -> pd.DataFrame:
     """
     longitudes = []
     latitudes = []
+    statuses = {"exact": 0, "fallback": 0, "miss": 0}
 
     for _, row in df.iterrows():
         pref = row['prefecture']
@@ -658,52 +275,391 @@ def add_coords_from_cache(df: pd.DataFrame, geo_dict: dict) -> pd.DataFrame:
         city_fixed = fix_city_name(pref, city_cleaned)
 
         # 3) YAML辞書から座標を引く
-        coords = lookup_coords(pref, city_fixed, loc_cleaned, geo_dict)
+        coords, status = lookup_coords_with_status(pref, city_fixed, loc_cleaned, geo_dict)
+        statuses[status] += 1
         longitudes.append(coords['longitude'])
         latitudes.append(coords['latitude'])
 
     df['longitude'] = longitudes
     df['latitude'] = latitudes
+
+    # ジオコーディングの結果の内訳を記録
+    record("rows_in", len(df))
+    for status, count in statuses.items():
+        record(f"geocode_{status}", count)
+    print("座標付与: 完全一致 {exact} 件 / 代替 {fallback} 件 / 失敗 {miss} 件".format(**statuses))
     return df
 
 
-def main():
+def update_aggregates(changes: list, df: pd.DataFrame, incremental: bool):
+    """
+    密度グリッド・統計用ロールアップ・ホットスポット・路線区間ビューを更新して保存する。
+    incremental が True で既存の集計ファイルがあれば、変更フィードの差分だけを加減算する。
+    集計ファイルが無い場合や、路線YAMLが集計より新しい場合は df 全体から作り直す。
+    """
+    import pandas as pd
+    from density_grid import DensityGrid, build_density_grid, GRID_FILE
+    from rollups import SightingRollups, build_rollups, ROLLUP_FILE
+    from hotspots import HotspotIndex, build_hotspots, HOTSPOT_FILE
+    from segment_risk import (SegmentRiskView, build_segment_risk, write_segment_risk_json,
+                              SEGMENT_RISK_FILE, SEGMENT_RISK_JSON)
+    from geo_utils import load_lines_from_yaml
+    from change_feed import changes_to_frames
+
+    lines_data = load_lines_from_yaml('lines.yaml') if os.path.exists('lines.yaml') else None
+
+    def to_dates(frame):
+        return frame.assign(date=pd.to_datetime(frame['date'], errors='coerce'))
+
+    added, removed = changes_to_frames(changes)
+    added, removed = to_dates(added), to_dates(removed)
+
+    # --- 密度グリッド ---
+    if incremental and os.path.exists(GRID_FILE):
+        grid = DensityGrid.load(GRID_FILE)
+        grid.add(added)
+        grid.add(removed, sign=-1)
+    else:
+        grid = build_density_grid(to_dates(df))
+    grid.save(GRID_FILE)
+    print("密度グリッド保存:", GRID_FILE)
+
+    # --- 統計用ロールアップ ---
+    rollups_fresh = (
+        incremental and os.path.exists(ROLLUP_FILE)
+        and not (lines_data and os.path.getmtime('lines.yaml') > os.path.getmtime(ROLLUP_FILE))
+    )
+    if rollups_fresh:
+        rollups = SightingRollups.load(ROLLUP_FILE)
+        rollups.add(added, lines_data)
+        rollups.add(removed, lines_data, sign=-1)
+    else:
+        rollups = build_rollups(to_dates(df), lines_data)
+    rollups.save(ROLLUP_FILE)
+    print("統計ロールアップ保存:", ROLLUP_FILE)
+
+    # --- ホットスポット (追加のみなら差分更新、削除・更新を含めば作り直す) ---
+    if incremental and removed.empty and os.path.exists(HOTSPOT_FILE):
+        hotspots = HotspotIndex.load(HOTSPOT_FILE)
+        hotspots.insert(added)
+    else:
+        hotspots = build_hotspots(to_dates(df))
+    hotspots.save(HOTSPOT_FILE)
+    print("ホットスポット保存:", HOTSPOT_FILE)
+
+    # --- 路線区間ごと・週ごとの件数 (路線YAMLが変わったら作り直す) ---
+    if lines_data:
+        segments = None
+        if (incremental and os.path.exists(SEGMENT_RISK_FILE)
+                and os.path.getmtime('lines.yaml') <= os.path.getmtime(SEGMENT_RISK_FILE)):
+            segments = SegmentRiskView.load(lines_data, SEGMENT_RISK_FILE)
+        if segments is not None and segments.matches(lines_data):
+            segments.add(added)
+            segments.add(removed, sign=-1)
+        else:
+            segments = build_segment_risk(to_dates(df), lines_data)
+        segments.save(SEGMENT_RISK_FILE)
+        write_segment_risk_json(segments, pd.Timestamp.now().normalize(), SEGMENT_RISK_JSON)
+        print("路線区間ビュー保存:", SEGMENT_RISK_FILE, SEGMENT_RISK_JSON)
+
+
+def read_aggregates_version(path: str = AGGREGATES_VERSION_FILE):
+    """
+    集計ファイルが反映済みの変更ログの版を返す (記録が無ければ None)。
+    """
+    import json
+
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("version")
+
+
+def write_aggregates_version(version: int, path: str = AGGREGATES_VERSION_FILE):
     """
-    メイン処理:
-      1) PDFを3県ぶんスクレイピングして取得
-      2) 取得したPDFから各県ごとのJSONを作成
-      3) JSONを統合して CSV (bear_sightings_combined.csv) を生成
-      4) CSVに対して YAML (areas_with_coords.yml) を使い座標付与 → 最終CSV (bear_sightings_with_coords.csv)
+    集計ファイルの更新がすべて終わったあとに、反映済みの版を記録する。
     """
+    import json
 
-    # 1) PDFをダウンロード
-    scrape_pdfs()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": int(version)}, f)
+    os.replace(tmp_path, path)
 
-    # 2) 各県のPDFを解析してJSON作成
-    parse_kanagawa_pdf()
-    parse_yamanashi_pdf()
-    parse_shizuoka_pdf()
 
-    # 3) JSONを統合し、CSV出力
-    combine_json_data()
+# ----------------------------------------------
+# 段階ごとの処理 (サブコマンド)
+# ----------------------------------------------
+# 進捗表示用の段階数 (アプリのバックグラウンド更新で使う)
+TOTAL_STEPS = 6
+
+
+def run_ingest(prefs=None, steps=ALL_STEPS, workers: int = MAX_WORKERS,
+               timeout_s: float = SOURCE_TIMEOUT_S, retries: int = RETRIES):
+    """
+    1) 各取得元 (prefs を省略するとすべて) の PDF取得・解析を並列に実行し、県ごとのJSONを作る。
+       失敗した取得元は前回のJSONを残す。
+    """
+    report_progress('PDF取得・解析', 1, TOTAL_STEPS)
+    with stage('ingest'):
+        results = run_sources(prefs, steps, workers, timeout_s, retries)
+    return results
 
-    # 4) CSVに座標付与 → bear_sightings_with_coords.csv
-    df = pd.read_csv('bear_sightings_combined.csv', encoding='utf-8')
-    try:
-        # 事前に用意したYAMLファイルをロード
-        geo_cache = load_geo_cache('areas_with_coords.yml')
-        # DataFrameに座標情報を追加
-        df = add_coords_from_cache(df, geo_cache)
-    except Exception as e:
-        print("YAMLロード or 座標付与エラー:", e)
-        # 座標付与に失敗しても処理を続行する場合
-        df['longitude'] = np.nan
-        df['latitude'] = np.nan
+
+def run_combine():
+    """
+    2) JSONを統合し、CSV出力
+    """
+    report_progress('JSON統合', 2, TOTAL_STEPS)
+    with stage('combine'):
+        combine_json_data()
+
+
+def run_geocode(repair_boundaries: bool = False):
+    """
+    3) bear_sightings_combined.csv に座標を付与し、県をまたいだ重複を統合して
+       最終CSV (bear_sightings_with_coords.csv) を出力する。
+       市町村界のデータ (municipal_boundaries.geojson) があれば、座標が記載の市町村の
+       境界内にあるかを確認し、不一致を bear_boundary_mismatches.csv に書き出す
+       (repair_boundaries=True なら、不一致の座標を記載の市町村の代表点に置き換える)。
+    4) 前回CSVとの差分を変更ログ (bear_sightings_changes.jsonl) に追記し、
+       アプリ用の Arrow スナップショット (snapshots/*.arrow) を公開、
+       監視地点の警報を判定して新しい通知を bear_alerts.jsonl に追記
+    5) その差分だけを (集計が前回の版まで反映済みなら)、密度グリッド (bear_density_grid.npz) と
+       統計用ロールアップ (bear_rollups.npz)・ホットスポット (bear_hotspots.npz)・
+       路線区間ビュー (bear_segment_risk.npz) に反映
+    """
+    import numpy as np
+    import pandas as pd
+    from geo_utils import load_lines_from_yaml
+    from dedup import deduplicate_sightings, DUPLICATE_REPORT_FILE
+    from change_feed import diff_datasets, write_change_log, CHANGE_LOG_FILE
+    from arrow_snapshot import publish_snapshot, read_pointer
+    from sightings_data import load_and_process_data
+
+    # 3) CSVに座標付与 → bear_sightings_with_coords.csv
+    report_progress('座標付与', 3, TOTAL_STEPS)
+    with stage('geocode'):
+        df = pd.read_csv('bear_sightings_combined.csv', encoding='utf-8')
+        try:
+            # 事前に用意したYAMLファイルをロード
+            geo_cache = load_geo_cache('areas_with_coords.yml')
+            # DataFrameに座標情報を追加
+            df = add_coords_from_cache(df, geo_cache)
+        except Exception as e:
+            record_error(e)
+            print("YAMLロード or 座標付与エラー:", e)
+            # 座標付与に失敗しても処理を続行する場合
+            df['longitude'] = np.nan
+            df['latitude'] = np.nan
+
+    # 複数の県に載っている同じ出没をまとめる
+    report_progress('重複統合', 4, TOTAL_STEPS)
+    with stage('dedup'):
+        record("rows_in", len(df))
+        df, duplicates = deduplicate_sightings(df)
+        duplicates.to_csv(DUPLICATE_REPORT_FILE, index=False, encoding='utf-8')
+        record("rows_out", len(df))
+        print(f"重複統合: {len(duplicates)} 件を統合 ({DUPLICATE_REPORT_FILE})")
+
+    # 座標が記載の市町村の境界内にあるかを確認 (境界データがある場合のみ)
+    with stage('boundary_check'):
+        try:
+            df = check_sighting_boundaries(df, repair_boundaries)
+        except Exception as e:
+            record_error(e)
+            print("境界確認エラー:", e)
 
     out_csv = 'bear_sightings_with_coords.csv'
+    # 差分計算のため、上書き前に前回の最終CSVを読んでおく
+    prev_df = pd.read_csv(out_csv, encoding='utf-8') if os.path.exists(out_csv) else None
+
     df.to_csv(out_csv, index=False, encoding='utf-8')
     print("最終CSV保存:", out_csv)
 
+    # 4) 前回との差分を変更ログに追記
+    report_progress('変更フィード', 5, TOTAL_STEPS)
+    with stage('change_feed'):
+        new_df = pd.read_csv(out_csv, encoding='utf-8')
+        changes = diff_datasets(prev_df, new_df)
+        version = write_change_log(changes, len(new_df))
+        for op, name in (("insert", "inserted"), ("update", "updated"), ("retract", "retracted")):
+            record(name, sum(c["op"] == op for c in changes))
+        print(f"変更ログ: 版 {version}, 変更 {len(changes)} 件 ({CHANGE_LOG_FILE})")
+
+    # アプリがメモリマップで読む Arrow スナップショットを公開 (版が変わったときだけ)
+    pointer = read_pointer()
+    if changes or pointer is None or pointer["version"] != version or not os.path.exists(pointer["path"]):
+        with stage('snapshot'):
+            try:
+                lines_data = load_lines_from_yaml('lines.yaml') if os.path.exists('lines.yaml') else None
+                lines_mtime = os.path.getmtime('lines.yaml') if lines_data else 0.0
+                snapshot = publish_snapshot(load_and_process_data(out_csv), version, lines_data, lines_mtime)
+                print("スナップショット公開:", snapshot or "pyarrow が無いためスキップ")
+            except Exception as e:
+                record_error(e)
+                print("スナップショット公開エラー:", e)
+
+    # 監視地点の周辺で新しく条件を満たした目撃を通知ログに追記 (更新のたびに判定する)
+    with stage('alerts'):
+        try:
+            from alerts import evaluate_alerts, ALERT_LOG_FILE
+            alerts = evaluate_alerts(out_csv)
+            record("alerts_new", len(alerts))
+            print(f"警報: 新しい通知 {len(alerts)} 件 ({ALERT_LOG_FILE})")
+        except Exception as e:
+            record_error(e)
+            print("警報判定エラー:", e)
+
+    # 5) 集計ファイルを差分更新
+    # 差分を足せるのは、集計が今回の変更の直前の版まで反映済みのときだけ。
+    # 前回の集計更新が失敗していれば (反映済みの版が古ければ) 全体から作り直す
+    report_progress('集計更新', 6, TOTAL_STEPS)
+    with stage('aggregates'):
+        base_version = version - 1 if changes else version
+        incremental = prev_df is not None and read_aggregates_version() == base_version
+        if prev_df is not None and not incremental:
+            record("aggregates_rebuilt")
+            print("集計ファイルが変更ログの版と一致しないため、全体から作り直します")
+        try:
+            update_aggregates(changes, new_df, incremental=incremental)
+            write_aggregates_version(version)
+        except Exception as e:
+            record_error(e)
+            print("集計更新エラー:", e)
+
+
+def check_sighting_boundaries(df: pd.DataFrame, repair: bool = False) -> pd.DataFrame:
+    """
+    df の座標を市町村界と照合し、不一致の行を BOUNDARY_REPORT_FILE に書き出す。
+    repair=True なら不一致の座標を記載の市町村の代表点に置き換えた df を返す。
+    市町村界の GeoJSON (BOUNDARY_FILE) が無ければ何もせずに df を返す。
+    """
+    from boundary_check import (load_boundaries, check_boundaries, repair_mismatches,
+                                BOUNDARY_FILE, BOUNDARY_REPORT_FILE)
+
+    if not os.path.exists(BOUNDARY_FILE):
+        record("boundary_skipped")
+        return df
+
+    index = load_boundaries(BOUNDARY_FILE)
+    result = check_boundaries(df, index)
+    counts = result["boundary_status"].value_counts()
+    for status in ("ok", "mismatch", "unknown_city", "no_coords"):
+        record(f"boundary_{status}", int(counts.get(status, 0)))
+
+    report = df.join(result)
+    report[report["boundary_status"] != "ok"].to_csv(BOUNDARY_REPORT_FILE, index=False, encoding='utf-8')
+    print(f"境界確認: 一致 {counts.get('ok', 0)} 件 / 不一致 {counts.get('mismatch', 0)} 件 / "
+          f"境界データに無い市町村 {counts.get('unknown_city', 0)} 件 ({BOUNDARY_REPORT_FILE})")
+    if repair:
+        df = repair_mismatches(df, result, index)
+        record("boundary_repaired", int(counts.get("mismatch", 0)))
+    return df
+
+
+def run_all():
+    """
+    全段階を順に実行する (取得・解析は取得元ごとに並列)。
+    """
+    run_ingest()
+    run_combine()
+    run_geocode()
+
+
+def run_export(out_dir=None, force: bool = False):
+    """
+    最終CSVから、県 × 月ごとの静的ページ (static_site/) を書き出す。
+    データが変わった区画だけを書き直す。
+    """
+    from geo_utils import load_lines_from_yaml
+    from sightings_data import load_and_process_data
+    from static_export import export_site, EXPORT_DIR
+
+    with stage('export'):
+        lines_data = load_lines_from_yaml('lines.yaml') if os.path.exists('lines.yaml') else None
+        stats = export_site(load_and_process_data('bear_sightings_with_coords.csv'), lines_data,
+                            out_dir or EXPORT_DIR, force=force)
+        for name, count in stats.items():
+            record(f"partitions_{name}", count)
+
+
+def bench_imports(modules=None, repeat: int = 3) -> dict:
+    """
+    各モジュールを新しい Python プロセスで import し、かかった時間 (ミリ秒、repeat 回の最小値) を返す。
+    """
+    code = (
+        "import importlib, sys, time; t = time.perf_counter(); "
+        "importlib.import_module(sys.argv[1]); print(time.perf_counter() - t)"
+    )
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for module in modules or BENCH_MODULES:
+        times = []
+        for _ in range(repeat):
+            proc = subprocess.run([sys.executable, "-c", code, module],
+                                  cwd=here, capture_output=True, text=True)
+            if proc.returncode != 0:
+                break
+            times.append(float(proc.stdout.strip()) * 1000)
+        results[module] = round(min(times), 1) if times else None
+    return results
+
+
+def main(argv=None):
+    """
+    サブコマンドに応じて段階を実行する。省略時は全段階 (all)。
+    """
+    parser = argparse.ArgumentParser(description="熊目撃情報の取得・解析・座標付与")
+    parser.add_argument("--profile", action="store_true",
+                        help="cProfile の結果 (.prof) も計測結果と一緒に保存する")
+    parser.add_argument("--metrics-dir", default=METRICS_DIR, help="段階ごとの計測結果 (JSON) の保存先")
+    sub = parser.add_subparsers(dest="command")
+    ingest_cmds = {
+        "ingest": sub.add_parser("ingest", help="各県サイトからPDFを取得・解析する (取得元ごとに並列)"),
+        "fetch": sub.add_parser("fetch", help="各県サイトからPDFを取得する"),
+        "parse": sub.add_parser("parse", help="PDFを解析してJSONを作る"),
+    }
+    for cmd in ingest_cmds.values():
+        cmd.add_argument("--pref", action="append", choices=list(SOURCES),
+                         help="対象の県 (複数指定可。省略時はすべての取得元)")
+        cmd.add_argument("--workers", type=int, default=MAX_WORKERS, help="同時に実行する取得元の数")
+        cmd.add_argument("--timeout", type=float, default=SOURCE_TIMEOUT_S, help="取得元1つあたりの制限時間 (秒)")
+        cmd.add_argument("--retries", type=int, default=RETRIES, help="PDFの検索・取得の再試行回数")
+    sub.add_parser("combine", help="各県のJSONを統合してCSVを作る")
+    geocode_cmd = sub.add_parser("geocode", help="座標付与・重複統合・境界確認・変更ログ・集計更新を行う")
+    geocode_cmd.add_argument("--repair-boundaries", action="store_true",
+                             help="市町村の境界と合わない座標を、記載の市町村の代表点に置き換える")
+    sub.add_parser("all", help="全段階を実行する")
+    export_cmd = sub.add_parser("export", help="県 × 月ごとの静的ページを書き出す (変更のあった区画のみ)")
+    export_cmd.add_argument("--out", help="出力先ディレクトリ (省略時は static_site)")
+    export_cmd.add_argument("--force", action="store_true", help="変更の無い区画も書き直す")
+    bench_cmd = sub.add_parser("bench-imports", help="依存ライブラリの import 時間を計測する")
+    bench_cmd.add_argument("modules", nargs="*", help="計測するモジュール (省略時は主な依存)")
+    args = parser.parse_args(argv)
+
+    if args.command == "bench-imports":
+        for module, ms in bench_imports(args.modules).items():
+            print(f"{module:<28} {'import失敗' if ms is None else f'{ms:8.1f} ms'}")
+        return
+
+    # 段階ごとの時間・メモリ・件数を計測し、終了時 (失敗時も) に JSON で保存する
+    start_run(args.command or "all", profile=args.profile, metrics_dir=args.metrics_dir)
+    try:
+        if args.command in ingest_cmds:
+            steps = ALL_STEPS if args.command == "ingest" else (args.command,)
+            run_ingest(args.pref, steps, args.workers, args.timeout, args.retries)
+        elif args.command == "combine":
+            run_combine()
+        elif args.command == "geocode":
+            run_geocode(args.repair_boundaries)
+        elif args.command == "export":
+            run_export(args.out, args.force)
+        else:
+            run_all()
+    finally:
+        print("計測結果:", finish_run())
+
 
 if __name__ == "__main__":
     # このファイルが直接実行された場合、メイン処理を呼び出す
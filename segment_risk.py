@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+路線の駅間区間 (隣り合う2駅を結ぶ線分) ごと・週ごとの目撃件数を持つ集計ビュー。
+
+- 目撃地点から区間 (線分) までの距離が radius_km 以内なら、その区間の近くの目撃とする。
+  1つの路線では最も近い1区間だけに数える (同じ路線の隣の区間と二重に数えない)
+- パイプラインが変更フィードの追加行・取り消し行だけを add() で加減算して保存し、
+  アプリは保存済みの行列から表・ヒートストリップを作る (生データを路線ごとに集計し直さない)
+- 傾向スコア (trend) は、直近 RECENT_WEEKS 週の件数と、その前の BASELINE_WEEKS 週の
+  件数から見込んだ件数の比の log2 (正なら増加、負なら減少)。件数が少ない区間で
+  大きく振れないよう、両方に1を足してから比をとる
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from density_grid import to_day_number, to_day_numbers
+from rollups import to_period_numbers, period_start_dates
+
+# 集計結果の保存先と、アプリ以外から使うための JSON
+SEGMENT_RISK_FILE = "bear_segment_risk.npz"
+SEGMENT_RISK_JSON = "bear_segment_risk.json"
+
+# 区間の近くとみなす距離 (km。路線フィルタの判定と同じ)
+SEGMENT_RADIUS_KM = 5
+
+# 傾向スコアの直近期間と比較期間 (週)
+RECENT_WEEKS = 4
+BASELINE_WEEKS = 12
+
+# ヒートストリップ・JSON に含める週数
+HEAT_WEEKS = 26
+
+# 距離計算を分割する行数 (行数 × 区間数 の配列を作るため)
+CHUNK_ROWS = 50_000
+
+# 地球の半径 (km。geo_utils.haversine と同じ)
+EARTH_RADIUS_KM = 6371.0
+
+
+def line_segments(lines_data: dict) -> list:
+    """
+    路線YAMLの各路線を、隣り合う駅の組 (路線名, 駅A, 駅B) のリストにする。
+    駅が1つしか無い路線は (路線名, 駅, 駅) の1区間とし、駅が無い路線は区間を作らない。
+    """
+    segments = []
+    for line in (lines_data or {}).get("lines", []):
+        if not line["stations"]:
+            continue
+        names = [s["name"] for s in line["stations"]]
+        if len(names) == 1:
+            segments.append((line["name"], names[0], names[0]))
+        for a, b in zip(names, names[1:]):
+            segments.append((line["name"], a, b))
+    return segments
+
+
+def assign_segments(lat, lon, lines_data: dict, radius_km: float = SEGMENT_RADIUS_KM) -> tuple:
+    """
+    各目撃地点を、路線ごとに最も近い区間 (距離 radius_km 以内のもの) に割り当てる。
+    (行番号の配列, line_segments の区間番号の配列) を返す。
+    距離は路線の中心緯度で正距円筒図法に投影した平面上で、点と線分の距離として求める。
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    rows_out, segs_out = [], []
+    seg_offset = 0
+    for line in (lines_data or {}).get("lines", []):
+        # 駅が無い路線は区間を持たない (line_segments と同じ扱い)
+        if not line["stations"]:
+            continue
+        stations = np.array([[s["lat"], s["lon"]] for s in line["stations"]], dtype=np.float64)
+        if len(stations) == 1:
+            stations = np.vstack([stations, stations])
+        n_segs = len(stations) - 1
+
+        # 度 → km の平面座標 (x: 東向き, y: 北向き)
+        kx = np.radians(1) * EARTH_RADIUS_KM * np.cos(np.radians(stations[:, 0].mean()))
+        ky = np.radians(1) * EARTH_RADIUS_KM
+        ax, ay = stations[:-1, 1] * kx, stations[:-1, 0] * ky
+        dx, dy = stations[1:, 1] * kx - ax, stations[1:, 0] * ky - ay
+        length2 = np.where(dx * dx + dy * dy > 0, dx * dx + dy * dy, 1.0)
+
+        for lo in range(0, len(lat), CHUNK_ROWS):
+            px = lon[lo:lo + CHUNK_ROWS, None] * kx - ax
+            py = lat[lo:lo + CHUNK_ROWS, None] * ky - ay
+            t = np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+            dist2 = (px - t * dx) ** 2 + (py - t * dy) ** 2
+            nearest = dist2.argmin(axis=1)
+            within = np.nonzero(dist2[np.arange(len(nearest)), nearest] <= radius_km ** 2)[0]
+            rows_out.append(within + lo)
+            segs_out.append(nearest[within] + seg_offset)
+        seg_offset += n_segs
+
+    if not rows_out:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(rows_out).astype(np.int64), np.concatenate(segs_out).astype(np.int64)
+
+
+# ----------------------------------------------
+# 集計ビュー
+# ----------------------------------------------
+class SegmentRiskView:
+    """
+    区間ごと・週ごとの件数を (区間数, 週数) の int32 行列で保持する。
+    週は rollups と同じ月曜始まりの週番号で、first_week が行列の先頭列の週番号。
+    """
+
+    def __init__(self, lines_data: dict = None, radius_km: float = SEGMENT_RADIUS_KM):
+        self.lines_data = lines_data
+        self.radius_km = radius_km
+        self.segments = line_segments(lines_data)
+        self.first_week = 0
+        self.counts = np.zeros((len(self.segments), 0), dtype=np.int32)
+
+    def matches(self, lines_data: dict) -> bool:
+        """
+        保存済みの区間が、現在の路線YAMLの区間と同じかどうか。
+        """
+        return self.segments == line_segments(lines_data)
+
+    def _ensure_weeks(self, lo: int, hi: int):
+        """
+        週番号 lo〜hi (両端含む) が行列の列に収まるよう左右を広げる。
+        """
+        if self.counts.shape[1] == 0:
+            self.first_week = lo
+            self.counts = np.zeros((len(self.segments), hi - lo + 1), dtype=np.int32)
+            return
+        last = self.first_week + self.counts.shape[1] - 1
+        left = max(0, self.first_week - lo)
+        right = max(0, hi - last)
+        if left or right:
+            self.counts = np.pad(self.counts, ((0, 0), (left, right)))
+            self.first_week -= left
+
+    # ---------- 加算(差分更新) ----------
+    def add(self, df: pd.DataFrame, sign: int = 1) -> int:
+        """
+        date, latitude, longitude 列を持つ df の各行を、近くの区間の週ごとの件数に加算する。
+        sign=-1 を渡すと取り消された行を減算する。区間に割り当てた件数を返す。
+        """
+        df = df.dropna(subset=["date", "latitude", "longitude"])
+        if df.empty or not self.segments:
+            return 0
+        rows, segs = assign_segments(df["latitude"], df["longitude"], self.lines_data, self.radius_km)
+        if len(rows) == 0:
+            return 0
+
+        weeks = to_period_numbers(to_day_numbers(df["date"]), "W")[rows]
+        self._ensure_weeks(int(weeks.min()), int(weeks.max()))
+        np.add.at(self.counts, (segs, weeks - self.first_week), sign)
+        return len(rows)
+
+    # ---------- 集計結果の取得 ----------
+    def _week_window(self, as_of, n_weeks: int) -> np.ndarray:
+        """
+        as_of を含む週までの直近 n_weeks 週分の件数 (区間数, n_weeks)。範囲外の週は0。
+        """
+        end = int(to_period_numbers([to_day_number(as_of)], "W")[0]) - self.first_week + 1
+        start = end - n_weeks
+        window = np.zeros((len(self.segments), n_weeks), dtype=np.int32)
+        lo, hi = max(start, 0), min(end, self.counts.shape[1])
+        if hi > lo:
+            window[:, lo - start:hi - start] = self.counts[:, lo:hi]
+        return window
+
+    def _line_rows(self, line=None) -> np.ndarray:
+        return np.array([i for i, seg in enumerate(self.segments)
+                         if line in (None, "すべて") or seg[0] == line], dtype=np.int64)
+
+    def _trend(self, as_of) -> tuple:
+        """
+        全区間の (直近 RECENT_WEEKS 週の件数, その前の BASELINE_WEEKS 週の件数, 傾向スコア)。
+        """
+        window = self._week_window(as_of, RECENT_WEEKS + BASELINE_WEEKS)
+        recent = window[:, BASELINE_WEEKS:].sum(axis=1)
+        baseline = window[:, :BASELINE_WEEKS].sum(axis=1)
+        expected = baseline * RECENT_WEEKS / BASELINE_WEEKS
+        return recent, baseline, np.log2((recent + 1) / (expected + 1))
+
+    def segment_table(self, as_of, line=None) -> pd.DataFrame:
+        """
+        区間ごとの直近 RECENT_WEEKS 週・その前の BASELINE_WEEKS 週の件数と傾向スコアを、
+        傾向スコアの大きい順に返す。
+        """
+        recent, baseline, trend = self._trend(as_of)
+        rows = self._line_rows(line)
+        table = pd.DataFrame({
+            "line": [self.segments[i][0] for i in rows],
+            "segment": [f"{self.segments[i][1]}〜{self.segments[i][2]}" for i in rows],
+            "recent": recent[rows],
+            "baseline": baseline[rows],
+            "trend": np.round(trend[rows], 2),
+        })
+        return table.sort_values(["trend", "recent"], ascending=False, kind="mergesort").reset_index(drop=True)
+
+    def weekly_counts(self, as_of, n_weeks: int = HEAT_WEEKS, line=None) -> pd.DataFrame:
+        """
+        直近 n_weeks 週の区間 × 週の件数 (index: "路線 駅A〜駅B", columns: 週の初日)。
+        """
+        window = self._week_window(as_of, n_weeks)
+        last_week = int(to_period_numbers([to_day_number(as_of)], "W")[0])
+        weeks = period_start_dates(np.arange(last_week - n_weeks + 1, last_week + 1), "W")
+        rows = self._line_rows(line)
+        labels = [f"{self.segments[i][0]} {self.segments[i][1]}〜{self.segments[i][2]}" for i in rows]
+        return pd.DataFrame(window[rows], index=labels, columns=weeks)
+
+    def to_json_dict(self, as_of, n_weeks: int = HEAT_WEEKS) -> dict:
+        """
+        JSON 出力用の辞書 (区間ごとの直近 n_weeks 週の件数と傾向スコア)。
+        """
+        recent, baseline, trend = self._trend(as_of)
+        weekly = self._week_window(as_of, n_weeks)
+        last_week = int(to_period_numbers([to_day_number(as_of)], "W")[0])
+        weeks = period_start_dates(np.arange(last_week - n_weeks + 1, last_week + 1), "W")
+        segments = []
+        for i, (line, a, b) in enumerate(self.segments):
+            segments.append({
+                "line": line, "from": a, "to": b,
+                "weekly": weekly[i].tolist(),
+                "recent": int(recent[i]), "baseline": int(baseline[i]), "trend": round(float(trend[i]), 2),
+            })
+        return {
+            "as_of": pd.Timestamp(as_of).strftime("%Y-%m-%d"),
+            "radius_km": self.radius_km,
+            "recent_weeks": RECENT_WEEKS,
+            "baseline_weeks": BASELINE_WEEKS,
+            "weeks": [d.strftime("%Y-%m-%d") for d in weeks],
+            "segments": segments,
+        }
+
+    # ---------- 保存・読み込み ----------
+    def save(self, file_path: str = SEGMENT_RISK_FILE):
+        """
+        集計結果を npz 形式で保存する。
+        """
+        np.savez_compressed(
+            file_path,
+            segments=np.array(self.segments, dtype=str).reshape(-1, 3),
+            radius_km=np.array(self.radius_km),
+            first_week=np.array(self.first_week),
+            counts=self.counts,
+        )
+
+    @classmethod
+    def load(cls, lines_data: dict, file_path: str = SEGMENT_RISK_FILE) -> "SegmentRiskView":
+        """
+        save() で保存した集計結果を読み込む。lines_data は以降の add() での区間の割り当てに使う。
+        """
+        with np.load(file_path) as data:
+            view = cls(lines_data, float(data["radius_km"]))
+            view.segments = [tuple(row) for row in data["segments"].tolist()]
+            view.first_week = int(data["first_week"])
+            view.counts = data["counts"]
+        return view
+
+
+def build_segment_risk(df: pd.DataFrame, lines_data: dict, radius_km: float = SEGMENT_RADIUS_KM) -> SegmentRiskView:
+    """
+    DataFrame 全体から SegmentRiskView を作る。
+    """
+    view = SegmentRiskView(lines_data, radius_km)
+    view.add(df)
+    return view
+
+
+def write_segment_risk_json(view: SegmentRiskView, as_of, file_path: str = SEGMENT_RISK_JSON):
+    """
+    to_json_dict() の結果を JSON ファイルに書き出す。
+    """
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(view.to_json_dict(as_of), f, ensure_ascii=False, indent=2)
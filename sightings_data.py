@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+座標付きの熊目撃情報CSVを読み込み、日付順に整えたうえで期間を切り出す関数群。
+Streamlitアプリ (app.py) と HTTP API (api_server.py) の両方から使う。
+"""
+
+import pandas as pd
+from datetime import datetime, timedelta
+
+from geo_utils import lines_near_mask
+
+# カテゴリ型にする文字列列 (値の種類が行数よりずっと少ない)
+CATEGORY_COLUMNS = ['prefecture', 'city', 'location']
+
+
+# ----------------------------------------------
+# CSV読み込み & 前処理
+# ----------------------------------------------
+def load_and_process_data(file_path: str) -> pd.DataFrame:
+    """
+    CSVからデータを読み込み、緯度経度や日付が欠損の行を除外して返す。
+    日付期間での切り出しを二分探索で行えるよう、日付順にソートしておく。
+    過去1週間の目撃かどうか (is_recent) もここで一度だけ計算する。
+    """
+    df = pd.read_csv(file_path)
+
+    # 緯度、経度がNaNの行を除去
+    df = df.dropna(subset=['latitude', 'longitude'])
+
+    # 日付をdatetimeに変換し、変換不可の行を除去
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df = df.dropna(subset=['date'])
+
+    # 日付順に並べ、位置 (0, 1, 2, ...) をインデックスにする
+    df = df.sort_values('date', kind='mergesort').reset_index(drop=True)
+
+    # 過去1週間のフラグ
+    one_week_ago = datetime.now() - timedelta(days=7)
+    df['is_recent'] = df['date'] >= one_week_ago
+
+    return df
+
+
+# ----------------------------------------------
+# 省メモリ表現 (アプリで全セッションが共有する DataFrame 用)
+# ----------------------------------------------
+def compact_sightings(df: pd.DataFrame, lines_data: dict = None, radius_km=5) -> pd.DataFrame:
+    """
+    load_and_process_data の結果を、メモリの少ない列型に置き換えて返す。
+      - prefecture / city / location: カテゴリ型 (文字列は種類ごとに1つだけ持つ)
+      - latitude / longitude: float32 (誤差は約1m で、地図表示には十分)
+      - lines_mask: 半径 radius_km km以内に駅がある路線のビット集合 (uint64)
+        (行ごとの路線名リスト lines_near の代わり。geo_utils.line_bits で絞り込む)
+    date は datetime64 (8バイト/行、オブジェクト型ではない) のまま残す。
+    """
+    df = df.copy()
+    # 距離判定は float32 に丸める前の座標で行う
+    df['lines_mask'] = lines_near_mask(df['latitude'], df['longitude'], lines_data, radius_km)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    df['latitude'] = df['latitude'].astype('float32')
+    df['longitude'] = df['longitude'].astype('float32')
+    return df.drop(columns=['lines_near'], errors='ignore')
+
+
+def memory_report(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    列ごとの型とメモリ使用量 (文字列の中身も含めたバイト数) を、合計行付きで返す。
+    """
+    usage = df.memory_usage(index=True, deep=True)
+    report = pd.DataFrame({
+        'dtype': [str(df.index.dtype)] + [str(df[c].dtype) for c in df.columns],
+        'bytes': usage.to_numpy(),
+    }, index=usage.index)
+    report.loc['合計'] = ['', int(usage.sum())]
+    return report
+
+
+def slice_by_date(df: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
+    """
+    日付順にソート済みの df から、start_date 〜 end_date (両端を含む) の行を
+    二分探索で求めた位置のスライスとして返す。全行を走査するマスクは作らない。
+    """
+    lo = df['date'].searchsorted(pd.Timestamp(start_date), side='left')
+    hi = df['date'].searchsorted(pd.Timestamp(end_date), side='right')
+    return df.iloc[lo:hi]
+
+
+def resolve_date_window(df: pd.DataFrame, date_range: tuple) -> tuple:
+    """
+    指定された期間 (開始日, 終了日) を、データの最古日〜今日の範囲に収めて返す。
+    """
+    start_date = pd.Timestamp(date_range[0])
+    end_date = pd.Timestamp(date_range[1])
+    now_date = pd.Timestamp(datetime.now().date())
+
+    if len(df) and start_date < df['date'].iloc[0]:
+        start_date = df['date'].iloc[0]
+    if end_date > now_date:
+        end_date = now_date
+    return start_date, end_date
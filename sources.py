@@ -0,0 +1,520 @@
+# -*- coding: utf-8 -*-
+"""
+熊出没情報の取得元 (県ごとのPDF) をプラグインとして登録するモジュール。
+
+取得元ごとに SourcePlugin を継承したクラスを作り、@register_source で登録する。
+各取得元は次の4段階を持つ:
+  discover()  公開ページから最新PDFのURLを探す
+  fetch()     PDFをダウンロードして保存する
+  parse()     PDFを解析して、県ごとの形式のレコード (辞書のリスト) を返す
+  normalize() 県ごとのレコードを共通形式 {prefecture, date, city, location} にする
+
+discover / fetch / parse は ingest.py が取得元ごとに並列に実行し、
+normalize は JSON 統合 (scraping_and_processing.combine_json_data) で使う。
+
+県を追加するときは、このファイルにクラスを1つ追加する (ページURL・リンク文字列・ファイル名と、
+PDFのレイアウトに合わせた parse / normalize を書く)。
+requests・pdfplumber・selenium は使う関数の中で import する。
+"""
+
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+from pipeline_metrics import record
+
+# 登録済みの取得元 (--pref で指定する名前 -> プラグイン)
+SOURCES = {}
+
+# HTTP リクエスト1回のタイムアウト (秒)
+REQUEST_TIMEOUT_S = 30
+
+# ブラウザでの表示が必要なページで、リンクが現れるまで待つ秒数
+BROWSER_WAIT_S = 10
+
+
+def register_source(cls):
+    """
+    取得元のクラスを登録するデコレータ。
+    """
+    SOURCES[cls.key] = cls()
+    return cls
+
+
+def get_sources(keys=None) -> list:
+    """
+    登録済みの取得元のうち keys (省略時はすべて) を登録順に返す。
+    """
+    return [source for key, source in SOURCES.items() if not keys or key in keys]
+
+
+def record_line_counts(lines: list, sightings: list):
+    """
+    PDFから取り出したテキスト行数 (空行を除く)・出力した件数・捨てた行数を計測に記録する。
+    """
+    lines_in = sum(1 for line in lines if line.strip())
+    record("lines_in", lines_in)
+    record("rows_out", len(sightings))
+    record("lines_dropped", lines_in - len(sightings))
+
+
+class _LinkCollector(HTMLParser):
+    """
+    HTML 中のリンク (href と表示文字列) を集める。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            self._href = dict(attrs).get("href")
+            self._text = []
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._href is not None:
+            self.links.append((self._href, "".join(self._text).strip()))
+            self._href = None
+
+
+def read_pdf_lines(pdf_path: str) -> list:
+    """
+    pdfplumber で PDF 全ページのテキストを取り出し、行のリストで返す。
+    """
+    import pdfplumber
+
+    all_lines = []
+    with pdfplumber.open(pdf_path) as pdf:
+        # 各ページを順番に処理
+        for page in pdf.pages:
+            text = page.extract_text()
+            if text:
+                # 改行ごとに分割してリストにためる
+                all_lines.extend(text.split('\n'))
+    return all_lines
+
+
+# ----------------------------------------------
+# 取得元の基底クラス
+# ----------------------------------------------
+class SourcePlugin(ABC):
+    """
+    1つの取得元 (県の公開ページ + PDF)。サブクラスでクラス属性と parse / normalize を定義する。
+    parse / normalize を定義し忘れたクラスは、@register_source でのインスタンス化の時点で TypeError になる。
+    """
+
+    key = ""            # --pref で指定する名前 (例: "山梨")
+    slug = ""           # 計測の段階名に使う英字の名前 (例: "yamanashi")
+    prefecture = ""     # 正式な県名 (例: "山梨県")
+    page_url = ""       # PDFへのリンクがある公開ページ
+    link_text = ""      # PDFへのリンクの文字列 (部分一致)
+    pdf_path = ""       # PDFの保存先
+    json_path = ""      # 解析結果 (県ごとの形式) の保存先
+
+    # ---------- discover ----------
+    def discover(self, timeout: float = REQUEST_TIMEOUT_S) -> str:
+        """
+        公開ページから link_text を含むリンクを探し、PDFのURLを返す。
+        ページのHTMLにリンクが無い (スクリプトで描画される) 場合はブラウザ (Chrome) で開き直す。
+        """
+        import requests
+
+        r = requests.get(self.page_url, timeout=timeout)
+        r.raise_for_status()
+        r.encoding = r.apparent_encoding
+        collector = _LinkCollector()
+        collector.feed(r.text)
+        for href, text in collector.links:
+            if href and self.link_text in text:
+                return urljoin(self.page_url, href)
+        return self.discover_with_browser(timeout)
+
+    def discover_with_browser(self, timeout: float = BROWSER_WAIT_S) -> str:
+        """
+        ヘッドレスの Chrome で公開ページを開き、link_text を含むリンクの URL を返す。
+        """
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+
+        # Chromeのオプション設定（ヘッドレス：画面表示しないモード）
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+
+        driver = webdriver.Chrome(options=options)
+        try:
+            driver.get(self.page_url)
+            # リンクが現れるまで待機
+            link = WebDriverWait(driver, min(timeout, BROWSER_WAIT_S)).until(
+                EC.presence_of_element_located((By.PARTIAL_LINK_TEXT, self.link_text))
+            )
+            return link.get_attribute("href")
+        finally:
+            driver.quit()
+
+    # ---------- fetch ----------
+    def fetch(self, pdf_url: str, timeout: float = REQUEST_TIMEOUT_S) -> int:
+        """
+        PDFをダウンロードして pdf_path に保存し、バイト数を返す。
+        途中で失敗しても前回のPDFが壊れないよう、一時ファイルに書いてから置き換える。
+        """
+        import requests
+
+        r = requests.get(pdf_url, timeout=timeout)
+        r.raise_for_status()
+        tmp_path = self.pdf_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(r.content)
+        os.replace(tmp_path, self.pdf_path)
+        record("bytes_downloaded", len(r.content))
+        record("pdfs_downloaded")
+        print(f"[{self.prefecture}] PDF保存:", self.pdf_path)
+        return len(r.content)
+
+    # ---------- parse ----------
+    @abstractmethod
+    def parse(self) -> list:
+        """
+        pdf_path を解析して県ごとの形式のレコードのリストを返す (サブクラスで実装)。
+        """
+
+    def save_records(self, records: list):
+        """
+        解析結果を json_path に保存する (一時ファイルに書いてから置き換える)。
+        """
+        tmp_path = self.json_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.json_path)
+        print(f"[{self.key}] JSON保存:", self.json_path)
+
+    def load_records(self) -> list:
+        """
+        保存済みの解析結果を読み込む。ファイルが無い・壊れている場合は空リスト。
+        """
+        try:
+            with open(self.json_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    # ---------- normalize ----------
+    @abstractmethod
+    def normalize(self, records: list) -> list:
+        """
+        県ごとの形式のレコードを {prefecture, date, city, location} のリストにする (サブクラスで実装)。
+        """
+
+
+# ----------------------------------------------
+# 神奈川県
+# ----------------------------------------------
+def parse_kanagawa_location(loc_str: str):
+    """
+    神奈川データの「location」文字列から市区町村名と残りの住所を分割するための例。
+    「市」「町」「村」のいずれかが出てくる位置を探し、
+    そこまでを市区町村、それ以降を残りの場所とする単純ロジック。
+    """
+    import pandas as pd
+
+    if not loc_str:
+        return pd.NA, pd.NA
+
+    boundary_words = ["市", "町", "村"]
+    idx = None
+    boundary_char = None
+
+    for bw in boundary_words:
+        i = loc_str.find(bw)
+        if i != -1:
+            # 最初に見つかった位置を優先
+            if idx is None or i < idx:
+                idx = i
+                boundary_char = bw
+
+    if idx is not None:
+        # loc_str[: idx + len(boundary_char)] -> ex) "横浜市"
+        city_str = loc_str[: idx + len(boundary_char)]
+        # 残り部分 -> ex) "緑区...XXX"
+        loc_str_remain = loc_str[idx + len(boundary_char) :].strip()
+        return city_str, loc_str_remain
+    else:
+        # "市"などの文字が見つからない場合は全てlocationに入れる
+        return pd.NA, loc_str
+
+
+@register_source
+class KanagawaSource(SourcePlugin):
+    key = "神奈川"
+    slug = "kanagawa"
+    prefecture = "神奈川県"
+    page_url = "https://www.pref.kanagawa.jp/docs/t4i/cnt/f3813/"
+    # 「ツキノワグマの目撃等情報を更新しました」という文字を含むリンク
+    link_text = "ツキノワグマの目撃等情報を更新しました"
+    pdf_path = "kuma_r6_kanagawa.pdf"
+    json_path = "bear_sightings_kanagawa.json"
+
+    def parse(self) -> list:
+        """
+        「日付」「時間」「頭数」「状況」「場所等」などの情報を抽出する。
+
+        ※ 正規表現を使って「○月○日」形式の日付などを拾う
+        ※ データの形式は適宜調整
+        """
+        all_lines = read_pdf_lines(self.pdf_path)
+
+        # PDFの表に含まれていそうなカラムタイトル（神奈川の想定）
+        column_titles = ["月日", "時間", "頭数", "状況", "場所等", "区分", "目撃・痕跡", "その他"]
+        # 「○月○日」を検出するための正規表現 (1〜9月 or 10〜12月)
+        date_pattern = re.compile(r'(1[0-2]|[1-9])月(\d{1,2})日')
+
+        sightings = []
+        # テキスト行を順番に見て、必要情報を抽出
+        for line in all_lines:
+            # 不要な行やカラムタイトル行を除外する
+            if (not line.strip() or
+                '《目撃・痕跡・その他》' in line or
+                # column_titles内の全ての単語を含む場合、タイトル行とみなす
+                all(title in line for title in column_titles)):
+                continue
+
+            # 「○月○日」のパターンを探す
+            m = date_pattern.search(line)
+            if not m:
+                continue
+
+            # date_strには例えば「6月19日」のような文字列が入る
+            date_str = m.group(0)
+
+            # 日付の文字列の末尾までで一旦切り、その後の部分を解析する
+            after_date_part = line[m.end():].strip()
+            # スペース区切りで分割
+            parts = after_date_part.split()
+
+            # 最低限、分割結果が5要素以上あるかチェック
+            if len(parts) >= 5:
+                time = parts[0]               # 例: 14:00
+                number_of_bears = parts[1]    # 例: 1頭
+                status = parts[2]            # 例: 徘徊
+                area_type = parts[-2]        # 例: ○○区分
+                observation_type = parts[-1] # 例: 目撃 or 痕跡など
+
+                # 場所については3番目〜(末尾-2)までを結合
+                location_parts = parts[3:-2]
+                location = " ".join(location_parts) if location_parts else ""
+
+                # 辞書としてまとめる
+                sightings.append({
+                    "date": date_str,
+                    "time": time,
+                    "number_of_bears": number_of_bears,
+                    "status": status,
+                    "location": location,
+                    "area_type": area_type,
+                    "observation_type": observation_type
+                })
+
+        # 行数を記録 (解析できなかった行数の増加はパーサの劣化の目安になる)
+        record_line_counts(all_lines, sightings)
+        return sightings
+
+    def normalize(self, records: list) -> list:
+        normalized = []
+        for rec in records:
+            # 神奈川特有の「市町村名・残りの住所」の分割関数を適用
+            city, location = parse_kanagawa_location(rec.get('location'))
+            normalized.append({
+                'prefecture': self.prefecture,
+                'date': rec.get('date'),    # "6月19日"など
+                'city': city,
+                'location': location
+            })
+        return normalized
+
+
+# ----------------------------------------------
+# 山梨県
+# ----------------------------------------------
+@register_source
+class YamanashiSource(SourcePlugin):
+    key = "山梨"
+    slug = "yamanashi"
+    prefecture = "山梨県"
+    page_url = "https://www.pref.yamanashi.jp/shizen/kuma2.html"
+    link_text = "令和6年度（2024年度）ツキノワグマ出没・目撃情報"
+    pdf_path = "kuma_r6_yamanashi.pdf"
+    json_path = "bear_sightings_yamanashi.json"
+
+    def parse(self) -> list:
+        """
+        「日付（2024/6/4 など）」「時間」「市町村」「場所」「熊の頭数」を抽出する。
+        PDF内の日付は「2024/7/12」のような文字列が含まれていると想定。
+        """
+        all_lines = read_pdf_lines(self.pdf_path)
+        sightings = []
+
+        # 日付パターン: 年4桁/1-2桁/月1-2桁/日の形式 (例: 2024/6/20)
+        date_pattern = re.compile(r'(\d{4}/\d{1,2}/\d{1,2})')
+
+        # 市町村を抽出するための例示的な正規表現
+        city_pattern = re.compile(r'(.+?[市町村])(.*)')
+        # 天候情報等を取り除く例示的なパターン
+        location_pattern = re.compile(r'([^晴雨曇]{2,}?)((?:晴|雨|曇|霧|雪|地内).*)')
+
+        for line in all_lines:
+            # 空行や不要行はスキップ
+            if not line.strip() or '《目撃・痕跡・その他》' in line:
+                continue
+
+            # 行に日付パターンがあるか確認
+            m = date_pattern.search(line)
+            if not m:
+                continue
+
+            # 例: "2024/6/4"
+            date_str = m.group(1)
+
+            # 日付の後ろの部分を抽出
+            after_date_part = line[m.end():].strip()
+
+            # "頃"の後ろにスペースが無い場合、ある程度整形する（例: "14:00頃近く" → "14:00頃 近く"）
+            after_date_part = re.sub(r'頃(?!\s)', '頃 ', after_date_part)
+
+            # スペース区切り
+            parts = after_date_part.split()
+            if len(parts) < 3:
+                continue
+
+            # parts[0]に時間が入る想定 (例: "14:00頃")
+            time = parts[0]
+
+            # 残りの文字列は市町村＋地名を含むと想定
+            remaining_text = ' '.join(parts[1:])
+            city_match = city_pattern.match(remaining_text)
+
+            if city_match:
+                # 例: city="甲府市", location_full="○○地区..."
+                city = city_match.group(1)
+                location_full = city_match.group(2).strip()
+
+                # さらに location_full から天候などの文字を分割
+                loc_match = location_pattern.match(location_full)
+                if loc_match:
+                    location = loc_match.group(1).strip()
+                else:
+                    # 該当がなければ先頭単語だけを場所とする暫定ロジック
+                    location = location_full.split()[0] if location_full.split() else location_full
+            else:
+                # city_patternに合致しない場合の暫定処理
+                city = parts[1]
+                location = parts[2]
+
+            # 熊の頭数を探す。parts[3:] の中に数字があれば最後のものを利用する想定
+            remaining = parts[3:]
+            nums = [re.sub(r'\D', '', x) for x in remaining if re.search(r'\d+', x)]
+            bear_count = nums[-1] if nums else "不明"
+
+            # 取得情報をリストに格納
+            sightings.append({
+                "date": date_str,
+                "time": time,
+                "city": city,
+                "location": location,
+                "bear_count": bear_count
+            })
+
+        # 行数を記録
+        record_line_counts(all_lines, sightings)
+        return sightings
+
+    def normalize(self, records: list) -> list:
+        return [{
+            'prefecture': self.prefecture,
+            'date': rec.get('date'),             # "2024/6/19"など
+            'city': rec.get('city'),
+            'location': rec.get('location')
+        } for rec in records]
+
+
+# ----------------------------------------------
+# 静岡県
+# ----------------------------------------------
+@register_source
+class ShizuokaSource(SourcePlugin):
+    key = "静岡"
+    slug = "shizuoka"
+    prefecture = "静岡県"
+    page_url = "https://www.pref.shizuoka.jp/kurashikankyo/shizenkankyo/wild/1017680.html"
+    # 「【NEW】クマ出没マップ」という文字を含むリンク
+    link_text = "【NEW】クマ出没マップ"
+    pdf_path = "kuma_r6_shizuoka.pdf"
+    json_path = "bear_sightings_shizuoka.json"
+
+    # 解析したいページ領域の例 (左上x, 上からの距離, 右下x, 下からの距離)
+    # 実際のPDFレイアウトによって数値調整が必要
+    regions = [
+        (30, 40, 120, 540),   # 仮の領域1
+        (125, 100, 200, 470)  # 仮の領域2
+    ]
+
+    def extract_text_from_regions(self) -> list:
+        """
+        pdfplumberの crop() を用いて、指定した領域だけを抽出してテキスト化する。
+        """
+        import pdfplumber
+
+        extracted_texts = []
+        with pdfplumber.open(self.pdf_path) as pdf:
+            for page in pdf.pages:
+                for region in self.regions:
+                    # 領域を切り出し
+                    crop = page.crop(region)
+                    text = crop.extract_text()
+                    if text:
+                        extracted_texts.append(text)
+        return extracted_texts
+
+    def parse(self) -> list:
+        """
+        PDFから必要なエリアを crop()（切り出し）してテキストを抽出し、
+        日付や地点を正規表現などで解析する。
+        """
+        texts = self.extract_text_from_regions()
+        sightings = []
+        for text in texts:
+            lines = text.split('\n')
+            for line in lines:
+                # 例： "1  6月19日  静岡市  ○○地区" のような行を想定
+                match = re.match(r'^(\d+(?:-\d+)?)\s+(\d+月\d+日)\s+(\S+)\s+(.+)$', line.strip())
+                if match:
+                    sightings.append({
+                        "number": match.group(1),
+                        "date": match.group(2),
+                        "municipality": match.group(3),
+                        "location": match.group(4).strip()
+                    })
+
+        # 行数を記録
+        record_line_counts([line for text in texts for line in text.split('\n')], sightings)
+        return sightings
+
+    def normalize(self, records: list) -> list:
+        return [{
+            'prefecture': self.prefecture,
+            'date': rec.get('date'),             # "6月19日"など
+            'city': rec.get('municipality'),     # PDFの取り方に準拠
+            'location': rec.get('location')
+        } for rec in records]
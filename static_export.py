@@ -0,0 +1,493 @@
+# -*- coding: utf-8 -*-
+"""
+目撃情報の地図と統計グラフを、県 × 月ごとの静的ページとして書き出すモジュール。
+書き出したディレクトリは、CDN や通常のファイルサーバーからそのまま配信できる
+(リクエストの処理に Python は要らない)。
+
+出力 (既定は static_site/):
+  index.html                     県 × 月の一覧 (件数とページへのリンク)
+  <県>/<YYYY-MM>.html            地図 + 日別件数・市町村別件数のグラフ (SVG)
+  assets/viewer.<hash>.js        全ページ共通の地図描画スクリプト
+  assets/style.<hash>.css        全ページ共通のスタイル
+  assets/lines.<hash>.json       路線・駅 (全ページ共通)
+  manifest.json                  区画ごとの内容ハッシュと出力ファイル
+
+- ページごとに Folium の HTML を作るのではなく、目撃は列形式の小さな JSON として
+  ページに埋め込み、マーカーとポップアップは共通スクリプトがブラウザで作る
+- 共通ファイルは内容のハッシュをファイル名に含める (内容が同じなら同じファイルを共有し、
+  長期間キャッシュできる)
+- 各ファイルの gzip 圧縮版 (.gz) を並べて置く。brotli がインストールされていれば .br も置く
+- 区画 (県 × 月) の内容ハッシュが前回の manifest.json と同じなら、その区画は書き直さない。
+  過去1週間の強調表示はブラウザ側で日付から判定するので、日付が変わっただけでは書き直さない
+
+使い方:
+  python static_export.py --out static_site
+  python static_export.py --force          # すべての区画を書き直す
+"""
+
+import argparse
+import gzip
+import hashlib
+import html
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from string import Template
+
+import numpy as np
+import pandas as pd
+
+from geo_utils import load_lines_from_yaml
+from sightings_data import load_and_process_data
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 入力 (app.py と同じ) と出力先
+CSV_FILE = "bear_sightings_with_coords.csv"
+YAML_FILE = "lines.yaml"
+EXPORT_DIR = "static_site"
+MANIFEST_FILE = "manifest.json"
+
+# ページの構成を変えたら上げる (すべての区画が書き直される)
+EXPORT_FORMAT = 1
+
+# 座標を整数に丸めるときの倍率 (1e-5 度 ≒ 1m)
+COORD_SCALE = 100_000
+
+# 県名とディレクトリ名の対応 (一覧に無い県は県名のハッシュを使う)
+PREFECTURE_SLUGS = {
+    "神奈川県": "kanagawa",
+    "山梨県": "yamanashi",
+    "静岡県": "shizuoka",
+}
+
+# 地図ライブラリとタイル (Folium の既定と同じもの)
+LEAFLET_JS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"
+LEAFLET_CSS = "https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"
+TILE_URL = "https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png"
+TILE_ATTRIBUTION = '&copy; OpenStreetMap contributors &copy; CARTO'
+
+# 圧縮版を作るファイルの拡張子と、圧縮しない最小サイズ (バイト)
+COMPRESS_SUFFIXES = (".html", ".js", ".css", ".json")
+COMPRESS_MIN_BYTES = 256
+
+
+# ----------------------------------------------
+# 共通ファイル (スクリプト・スタイル)
+# ----------------------------------------------
+VIEWER_JS = """(function () {
+  var page = JSON.parse(document.getElementById('page-data').textContent);
+  var data = page.sightings, scale = page.scale;
+  var map = L.map('map', {preferCanvas: true}).setView(page.center, page.zoom);
+  L.tileLayer(page.tiles, {attribution: page.attribution, maxZoom: 18}).addTo(map);
+
+  var weekAgo = Date.now() - 7 * 86400000;
+  var monthStart = Date.parse(page.month + '-01T00:00:00');
+  var recent = L.featureGroup(), old = L.featureGroup();
+  for (var i = 0; i < data.lat.length; i++) {
+    var day = monthStart + (data.day[i] - 1) * 86400000;
+    var isRecent = day >= weekAgo, color = isRecent ? '#dc2626' : '#1d4ed8';
+    var date = page.month + '-' + (data.day[i] < 10 ? '0' : '') + data.day[i];
+    var city = data.cities[data.city[i]], loc = data.locations[data.location[i]];
+    L.circleMarker([data.lat[i] / scale, data.lon[i] / scale], {
+      radius: isRecent ? 8 : 6, color: color, fillColor: color, fillOpacity: 0.7, weight: 1
+    }).bindTooltip(escape(city) + ' (' + date + ')')
+      .bindPopup(popup(date, city, loc, data.lat[i] / scale, data.lon[i] / scale, color))
+      .addTo(isRecent ? recent : old);
+  }
+  recent.addTo(map);
+  old.addTo(map);
+  var overlays = {'過去1週間の目撃情報': recent, '過去の目撃情報': old};
+  var control = L.control.layers(null, overlays, {collapsed: false}).addTo(map);
+  if (data.lat.length) { map.fitBounds(L.featureGroup([recent, old]).getBounds(), {maxZoom: 12, padding: [20, 20]}); }
+
+  fetch(page.lines).then(function (r) { return r.json(); }).then(function (lines) {
+    var railway = L.featureGroup(), stations = L.featureGroup();
+    lines.forEach(function (line) {
+      var coords = line.stations.map(function (s) { return [s[1] / scale, s[2] / scale]; });
+      L.polyline(coords, {color: 'orange', weight: 3}).bindPopup(escape(line.name)).addTo(railway);
+      line.stations.forEach(function (s) {
+        L.circleMarker([s[1] / scale, s[2] / scale], {radius: 3, color: 'green', fillColor: 'green', fillOpacity: 0.7})
+          .bindPopup(escape(s[0]) + '駅').addTo(stations);
+      });
+    });
+    railway.addTo(map);
+    stations.addTo(map);
+    control.addOverlay(railway, '路線');
+    control.addOverlay(stations, '駅');
+    recent.bringToFront();
+  });
+
+  function escape(s) {
+    return String(s).replace(/[&<>"']/g, function (c) {
+      return {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'}[c];
+    });
+  }
+  function popup(date, city, loc, lat, lon, color) {
+    return '<div class="popup"><h4 style="color:' + color + '">熊の目撃情報</h4><table>'
+      + '<tr><th>日付:</th><td>' + date + '</td></tr>'
+      + '<tr><th>市町村:</th><td>' + escape(city) + '</td></tr>'
+      + '<tr><th>地点:</th><td>' + escape(loc) + '</td></tr>'
+      + '<tr><th>緯度:</th><td>' + lat.toFixed(6) + '</td></tr>'
+      + '<tr><th>経度:</th><td>' + lon.toFixed(6) + '</td></tr></table></div>';
+  }
+})();
+"""
+
+STYLE_CSS = """body{margin:0;font-family:sans-serif;color:#1f2937}
+header{padding:8px 16px;background:#f3f4f6}
+header h1{font-size:20px;margin:4px 0}
+nav a{margin-right:12px}
+main{padding:8px 16px}
+#map{height:560px;border:1px solid #d1d5db}
+.charts{display:flex;flex-wrap:wrap;gap:16px;margin-top:12px}
+.charts svg{background:#fff;border:1px solid #e5e7eb}
+.popup{min-width:200px}.popup h4{margin:0 0 8px}.popup th{text-align:left;padding-right:6px}
+table.index{border-collapse:collapse}table.index td,table.index th{border:1px solid #d1d5db;padding:4px 8px;text-align:right}
+footer{padding:8px 16px;font-size:12px;color:#6b7280}
+"""
+
+PAGE_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
+<title>$title</title>
+<link rel="stylesheet" href="$leaflet_css"><link rel="stylesheet" href="$style">
+</head><body>
+<header><h1>$title</h1><nav><a href="../index.html">一覧</a>$nav</nav></header>
+<main><p>目撃件数: $count 件</p><div id="map"></div>
+<div class="charts">$daily_chart$city_chart</div></main>
+<footer>赤: 過去1週間の目撃 / 青: それ以前の目撃。データ更新: $updated</footer>
+<script id="page-data" type="application/json">$page_data</script>
+<script src="$leaflet_js"></script><script src="$viewer"></script>
+</body></html>
+""")
+
+INDEX_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="ja"><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1">
+<title>熊出没情報 (月別)</title><link rel="stylesheet" href="$style">
+</head><body>
+<header><h1>熊出没情報 (県別・月別)</h1></header>
+<main><table class="index"><tr><th>月</th>$header</tr>
+$rows
+</table></main>
+<footer>データ更新: $updated</footer>
+</body></html>
+""")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def prefecture_slug(prefecture: str) -> str:
+    return PREFECTURE_SLUGS.get(prefecture) or "pref-" + content_hash(prefecture.encode("utf-8"))[:8]
+
+
+# ----------------------------------------------
+# 区画 (県 × 月) のデータ
+# ----------------------------------------------
+def partition_payload(part: pd.DataFrame) -> dict:
+    """
+    1区画の目撃を、ページに埋め込む列形式のデータにする。
+    市町村・地点は重複の無い一覧と番号、座標は COORD_SCALE 倍した整数、日付は月の中の日。
+    行の順序は日付・市町村・地点・座標で決め、同じ内容なら同じデータになるようにする。
+    """
+    part = part.sort_values(["date", "city", "location", "latitude", "longitude"], kind="mergesort")
+    cities, city_codes = np.unique(part["city"].astype(str).to_numpy(), return_inverse=True)
+    locations, location_codes = np.unique(part["location"].fillna("").astype(str).to_numpy(),
+                                          return_inverse=True)
+    return {
+        "day": part["date"].dt.day.tolist(),
+        "city": city_codes.tolist(),
+        "location": location_codes.tolist(),
+        "cities": cities.tolist(),
+        "locations": locations.tolist(),
+        "lat": np.round(part["latitude"].to_numpy(np.float64) * COORD_SCALE).astype(int).tolist(),
+        "lon": np.round(part["longitude"].to_numpy(np.float64) * COORD_SCALE).astype(int).tolist(),
+    }
+
+
+def iter_partitions(df: pd.DataFrame):
+    """
+    (県, "YYYY-MM", 区画の DataFrame) を県名・月の順に返す。
+    """
+    months = df["date"].dt.strftime("%Y-%m")
+    for (prefecture, month), part in df.groupby([df["prefecture"].astype(str), months], sort=True):
+        yield prefecture, month, part
+
+
+# ----------------------------------------------
+# グラフ (SVG を事前に描く)
+# ----------------------------------------------
+def svg_daily_chart(days: list, month: str, width: int = 520, height: int = 200) -> str:
+    """
+    月の日別件数の棒グラフ (SVG)。
+    """
+    n_days = pd.Period(month, freq="M").days_in_month
+    counts = np.bincount(np.asarray(days, dtype=int), minlength=n_days + 1)[1:]
+    left, bottom, top = 28, 24, 28
+    plot_h = height - bottom - top
+    bar_w = (width - left - 8) / n_days
+    peak = max(int(counts.max()) if len(counts) else 0, 1)
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-size="11">',
+             f'<text x="{width / 2}" y="16" text-anchor="middle" font-size="13">{month} 日別熊目撃件数</text>',
+             f'<text x="{left - 4}" y="{top + 4}" text-anchor="end">{peak}</text>',
+             f'<text x="{left - 4}" y="{top + plot_h}" text-anchor="end">0</text>']
+    for i, count in enumerate(counts.tolist()):
+        x = left + i * bar_w
+        if count:
+            h = plot_h * count / peak
+            parts.append(f'<rect x="{x + 1:.1f}" y="{top + plot_h - h:.1f}" width="{bar_w - 2:.1f}" '
+                         f'height="{h:.1f}" fill="#1d4ed8"><title>{i + 1}日: {count}件</title></rect>')
+        if i % 5 == 0:
+            parts.append(f'<text x="{x + bar_w / 2:.1f}" y="{height - 8}" text-anchor="middle">{i + 1}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def svg_city_chart(cities: list, width: int = 420, row_h: int = 20) -> str:
+    """
+    市町村別件数の上位10件の横棒グラフ (SVG)。
+    """
+    counts = pd.Series(cities).value_counts().head(10)
+    label_w, top = 110, 28
+    height = top + row_h * max(len(counts), 1) + 8
+    peak = max(int(counts.max()) if len(counts) else 0, 1)
+    bar_space = width - label_w - 40
+
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-size="11">',
+             f'<text x="{width / 2}" y="16" text-anchor="middle" font-size="13">市町村別熊目撃件数（上位10件）</text>']
+    for i, (city, count) in enumerate(counts.items()):
+        y = top + i * row_h
+        w = bar_space * count / peak
+        parts.append(f'<text x="{label_w - 6}" y="{y + 14}" text-anchor="end">{html.escape(str(city))}</text>'
+                     f'<rect x="{label_w}" y="{y + 3}" width="{w:.1f}" height="{row_h - 6}" fill="#1d4ed8"/>'
+                     f'<text x="{label_w + w + 4:.1f}" y="{y + 14}">{count}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+# ----------------------------------------------
+# 書き出し
+# ----------------------------------------------
+def compressed_variants(path: Path) -> list:
+    return [path.with_name(path.name + ".gz"), path.with_name(path.name + ".br")]
+
+
+def write_file(path: Path, data: bytes) -> list:
+    """
+    data を path に書き (一時ファイル → os.replace)、gzip/brotli の圧縮版も並べて置く。
+    書いたファイルのパスのリストを返す。
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    outputs = [(path, data)]
+    if path.suffix in COMPRESS_SUFFIXES and len(data) >= COMPRESS_MIN_BYTES:
+        # mtime=0 にして、同じ内容なら同じ .gz になるようにする
+        outputs.append((path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0)))
+        if brotli is not None:
+            outputs.append((path.with_name(path.name + ".br"), brotli.compress(data, quality=11)))
+
+    for out_path, out_data in outputs:
+        tmp_path = out_path.with_name(out_path.name + ".tmp")
+        tmp_path.write_bytes(out_data)
+        os.replace(tmp_path, out_path)
+    return [out_path for out_path, _ in outputs]
+
+
+def remove_file(path: Path):
+    for p in [path] + compressed_variants(path):
+        p.unlink(missing_ok=True)
+
+
+def lines_asset(lines_data: dict) -> bytes:
+    """
+    路線と駅 ([駅名, 緯度, 経度] の整数座標) を、全ページ共通の JSON にする。
+    """
+    lines = []
+    for line in (lines_data or {}).get("lines", []):
+        stations = [[s["name"], round(s["lat"] * COORD_SCALE), round(s["lon"] * COORD_SCALE)]
+                    for s in line["stations"]]
+        lines.append({"name": line["name"], "stations": stations})
+    return json.dumps(lines, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def write_assets(out_dir: Path, lines_data: dict) -> dict:
+    """
+    共通ファイルを内容ハッシュ付きの名前で書き、{"viewer", "style", "lines"} → 相対パス を返す。
+    同じ名前のファイルがすでにあれば書き直さない。
+    """
+    sources = {
+        "viewer": ("viewer", ".js", VIEWER_JS.encode("utf-8")),
+        "style": ("style", ".css", STYLE_CSS.encode("utf-8")),
+        "lines": ("lines", ".json", lines_asset(lines_data)),
+    }
+    assets = {}
+    for key, (stem, suffix, data) in sources.items():
+        rel = f"assets/{stem}.{content_hash(data)}{suffix}"
+        if not (out_dir / rel).exists():
+            write_file(out_dir / rel, data)
+        assets[key] = rel
+    return assets
+
+
+def render_page(prefecture: str, month: str, payload: dict, assets: dict,
+                neighbors: tuple, updated: str) -> bytes:
+    """
+    1区画のページ (県 × 月) の HTML を作る。neighbors は (前月, 翌月) のページ名 (無ければ None)。
+    """
+    prev_month, next_month = neighbors
+    nav = ""
+    if prev_month:
+        nav += f'<a href="{prev_month}.html">← {prev_month}</a>'
+    if next_month:
+        nav += f'<a href="{next_month}.html">{next_month} →</a>'
+
+    page_data = {
+        "month": month,
+        "scale": COORD_SCALE,
+        "center": [35.5, 138.5],
+        "zoom": 8,
+        "tiles": TILE_URL,
+        "attribution": TILE_ATTRIBUTION,
+        "lines": "../" + assets["lines"],
+        "sightings": payload,
+    }
+    # </script> で埋め込みが途切れないよう "<" をエスケープする
+    page_json = json.dumps(page_data, ensure_ascii=False, separators=(",", ":")).replace("<", "\\u003c")
+    cities = [payload["cities"][c] for c in payload["city"]]
+    return PAGE_TEMPLATE.substitute(
+        title=html.escape(f"{prefecture} {month} の熊出没情報"),
+        leaflet_css=LEAFLET_CSS,
+        leaflet_js=LEAFLET_JS,
+        style="../" + assets["style"],
+        viewer="../" + assets["viewer"],
+        nav=nav,
+        count=len(payload["day"]),
+        daily_chart=svg_daily_chart(payload["day"], month),
+        city_chart=svg_city_chart(cities),
+        updated=updated,
+        page_data=page_json,
+    ).encode("utf-8")
+
+
+def render_index(partitions: dict, assets: dict, updated: str) -> bytes:
+    """
+    県 × 月の一覧ページ。partitions は manifest の区画 (キー "<県>/<YYYY-MM>")。
+    """
+    prefectures = sorted({p["prefecture"] for p in partitions.values()})
+    months = sorted({p["month"] for p in partitions.values()}, reverse=True)
+    by_key = {(p["prefecture"], p["month"]): (key, p) for key, p in partitions.items()}
+
+    rows = []
+    for month in months:
+        cells = []
+        for prefecture in prefectures:
+            entry = by_key.get((prefecture, month))
+            cells.append(f'<td><a href="{entry[0]}.html">{entry[1]["rows"]}</a></td>' if entry else "<td></td>")
+        rows.append(f"<tr><th>{month}</th>{''.join(cells)}</tr>")
+    return INDEX_TEMPLATE.substitute(
+        style=assets["style"],
+        header="".join(f"<th>{html.escape(p)}</th>" for p in prefectures),
+        rows="\n".join(rows),
+        updated=updated,
+    ).encode("utf-8")
+
+
+def load_manifest(out_dir: Path) -> dict:
+    path = out_dir / MANIFEST_FILE
+    if not path.exists():
+        return {"partitions": {}, "assets": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def export_site(df: pd.DataFrame, lines_data: dict, out_dir: str = EXPORT_DIR, force: bool = False) -> dict:
+    """
+    df (load_and_process_data の結果) を県 × 月の静的ページとして out_dir に書き出す。
+    前回の manifest.json と内容ハッシュが同じ区画は書き直さず、無くなった区画のページは消す。
+    戻り値は {"written", "unchanged", "removed"} の件数。
+    """
+    out = Path(out_dir)
+    manifest = load_manifest(out)
+    old_partitions = {} if force or manifest.get("format") != EXPORT_FORMAT else manifest["partitions"]
+    assets = write_assets(out, lines_data)
+    updated = datetime.now().strftime("%Y-%m-%d %H:%M")
+
+    partitions = list(iter_partitions(df))
+    months_by_pref = {}
+    for prefecture, month, _ in partitions:
+        months_by_pref.setdefault(prefecture, []).append(month)
+
+    new_partitions = {}
+    stats = {"written": 0, "unchanged": 0, "removed": 0}
+    for prefecture, month, part in partitions:
+        key = f"{prefecture_slug(prefecture)}/{month}"
+        payload = partition_payload(part)
+        months = months_by_pref[prefecture]
+        i = months.index(month)
+        neighbors = (months[i - 1] if i > 0 else None, months[i + 1] if i + 1 < len(months) else None)
+
+        # ページの内容を決めるもの (データ・前後の月・共通ファイル名・形式) のハッシュ
+        digest = content_hash(json.dumps([EXPORT_FORMAT, assets, neighbors, payload],
+                                         ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        page_path = out / f"{key}.html"
+        old = old_partitions.get(key)
+        if old is not None and old["hash"] == digest and page_path.exists():
+            new_partitions[key] = old
+            stats["unchanged"] += 1
+            continue
+
+        write_file(page_path, render_page(prefecture, month, payload, assets, neighbors, updated))
+        new_partitions[key] = {"prefecture": prefecture, "month": month, "rows": len(part), "hash": digest}
+        stats["written"] += 1
+
+    # 無くなった区画のページを消す
+    for key in set(manifest["partitions"]) - set(new_partitions):
+        remove_file(out / f"{key}.html")
+        stats["removed"] += 1
+
+    # 一覧と manifest は区画が変わったときだけ書き直す
+    if stats["written"] or stats["removed"] or manifest.get("assets") != assets \
+            or not (out / "index.html").exists():
+        write_file(out / "index.html", render_index(new_partitions, assets, updated))
+        _remove_unused_assets(out, assets)
+        manifest = {"format": EXPORT_FORMAT, "updated": updated, "assets": assets, "partitions": new_partitions}
+        tmp_path = out / (MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, out / MANIFEST_FILE)
+
+    print(f"静的ページ書き出し: 更新 {stats['written']} / 変更なし {stats['unchanged']} / "
+          f"削除 {stats['removed']} 区画 ({out})")
+    return stats
+
+
+def _remove_unused_assets(out: Path, assets: dict):
+    """
+    現在のページから参照されていない共通ファイル (以前の版) を消す。
+    """
+    used = {out / rel for rel in assets.values()}
+    for path in (out / "assets").glob("*"):
+        if path.suffix in (".gz", ".br") or path in used:
+            continue
+        remove_file(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="県 × 月ごとの静的な地図・グラフのページを書き出す")
+    parser.add_argument("--csv", default=CSV_FILE, help="座標付きの目撃情報CSV")
+    parser.add_argument("--lines", default=YAML_FILE, help="路線YAML")
+    parser.add_argument("--out", default=EXPORT_DIR, help="出力先ディレクトリ")
+    parser.add_argument("--force", action="store_true", help="変更の無い区画も書き直す")
+    args = parser.parse_args(argv)
+
+    lines_data = load_lines_from_yaml(args.lines) if os.path.exists(args.lines) else None
+    return export_site(load_and_process_data(args.csv), lines_data, args.out, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+api_server.py をローカルで起動して (port=0)、応答・304・フィルタを確認する。
+"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import api_server
+
+LINES_YAML = """\
+lines:
+  - name: "身延線"
+    stations:
+      - { name: "富士", lat: 35.1516, lon: 138.6512 }
+      - { name: "身延", lat: 35.3615, lon: 138.4530 }
+"""
+
+
+@pytest.fixture
+def server(tmp_path):
+    today = datetime.now().date()
+    recent = (today - timedelta(days=1)).isoformat()
+    (tmp_path / "sightings.csv").write_text(
+        "prefecture,date,city,location,longitude,latitude\n"
+        "山梨県,2024-04-01,都留市,大野,138.942398,35.516033\n"
+        "神奈川県,2024-04-02,箱根町,宮城野,139.048584,35.263847\n"
+        f"静岡県,{recent},富士市,富士駅前,138.6512,35.1520\n"
+        "静岡県,2024-05-01,静岡市,座標なし,,\n",
+        encoding="utf-8",
+    )
+    (tmp_path / "lines.yaml").write_text(LINES_YAML, encoding="utf-8")
+
+    server = api_server.make_server(port=0, csv_path=str(tmp_path / "sightings.csv"),
+                                    yaml_path=str(tmp_path / "lines.yaml"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get(server, path, headers=None):
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def features(body):
+    return json.loads(body)["features"]
+
+
+def test_sightings_and_not_modified(server):
+    status, headers, body = get(server, "/sightings")
+    assert status == 200
+    assert headers["Content-Type"].startswith("application/geo+json")
+    rows = features(body)
+    # 座標の無い行は除かれ、日付順に並ぶ
+    assert [f["properties"]["city"] for f in rows] == ["都留市", "箱根町", "富士市"]
+    assert [f["properties"]["is_recent"] for f in rows] == [False, False, True]
+    assert rows[2]["properties"]["lines_near"] == ["身延線"]
+
+    status, headers_304, body = get(server, "/sightings", {"If-None-Match": headers["ETag"]})
+    assert status == 304
+    assert body == b""
+    assert headers_304["ETag"] == headers["ETag"]
+
+
+def test_filters(server):
+    _, _, body = get(server, "/sightings?prefecture=" + urllib.request.quote("静岡県"))
+    assert [f["properties"]["city"] for f in features(body)] == ["富士市"]
+
+    _, _, body = get(server, "/sightings?start=2024-04-02&end=2024-04-30")
+    assert [f["properties"]["city"] for f in features(body)] == ["箱根町"]
+
+    _, _, body = get(server, "/sightings?bbox=138.9,35.4,139.0,35.6")
+    assert [f["properties"]["city"] for f in features(body)] == ["都留市"]
+
+    _, _, body = get(server, "/sightings?line=" + urllib.request.quote("身延線"))
+    assert [f["properties"]["city"] for f in features(body)] == ["富士市"]
+
+
+def test_bad_query_and_unknown_path(server):
+    status, _, body = get(server, "/sightings?bbox=1,2,3")
+    assert status == 400
+    assert "error" in json.loads(body)
+    assert get(server, "/nothing")[0] == 404
+    assert json.loads(get(server, "/health")[2]) == {"status": "ok"}
+
+
+def test_gzip(server):
+    status, headers, body = get(server, "/sightings", {"Accept-Encoding": "gzip"})
+    assert status == 200
+    # 小さい応答は圧縮しない
+    assert "Content-Encoding" not in headers
+    assert features(body)
+
+
+def test_etag_changes_with_date(server, monkeypatch):
+    _, headers, _ = get(server, "/sightings")
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    # 日付が変わると is_recent が変わりうるので、版 (ETag) も変わり、304 にはならない
+    monkeypatch.setattr(api_server, "date", Tomorrow)
+    status, headers_next, _ = get(server, "/sightings", {"If-None-Match": headers["ETag"]})
+    assert status == 200
+    assert headers_next["ETag"] != headers["ETag"]
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+dedup.py の重複統合 (県をまたぐ統合・推移的な統合の防止・統合の記録) を確認する。
+"""
+
+import pandas as pd
+
+from dedup import deduplicate_sightings, score_pair, normalize_city, normalize_location
+
+
+def make_df(rows):
+    return pd.DataFrame(rows, columns=["prefecture", "date", "city", "location", "latitude", "longitude"])
+
+
+def test_merges_same_sighting_across_prefectures():
+    df = make_df([
+        ("山梨県", "2024-06-01", "南巨摩郡南部町", "福士", 35.2500, 138.4800),
+        ("静岡県", "2024-06-01", "南部町", "福士 (県境付近)", 35.2510, 138.4805),
+        ("静岡県", "2024-06-10", "富士宮市", "上井出", 35.3500, 138.6000),
+    ])
+    deduped, report = deduplicate_sightings(df)
+
+    assert len(deduped) == 2
+    assert len(report) == 1
+    row = report.iloc[0]
+    assert {row["kept_prefecture"], row["dropped_prefecture"]} == {"山梨県", "静岡県"}
+
+
+def test_keeps_same_prefecture_rows_apart():
+    # 山梨県の2件がどちらも静岡県の1件に近い場合、統合するのは点数の高い1組だけ
+    df = make_df([
+        ("山梨県", "2024-06-01", "南部町", "福士", 35.2500, 138.4800),
+        ("山梨県", "2024-06-01", "南部町", "福士川", 35.2520, 138.4810),
+        ("静岡県", "2024-06-01", "南部町", "福士", 35.2505, 138.4802),
+    ])
+    deduped, report = deduplicate_sightings(df)
+
+    # 山梨県の2件は残り、地点名が一致する1件目と静岡県の1件が組になる
+    assert deduped["location"].tolist() == ["福士", "福士川"]
+    assert deduped["prefecture"].tolist() == ["山梨県", "山梨県"]
+    assert len(report) == 1
+    assert (report.iloc[0]["kept"], report.iloc[0]["dropped"]) == (0, 2)
+
+
+def test_same_prefecture_is_never_merged():
+    df = make_df([
+        ("山梨県", "2024-06-01", "南部町", "福士", 35.2500, 138.4800),
+        ("山梨県", "2024-06-01", "南部町", "福士", 35.2500, 138.4800),
+    ])
+    deduped, report = deduplicate_sightings(df)
+
+    assert len(deduped) == 2
+    assert report.empty
+
+
+def test_report_records_the_linking_pair_and_its_score():
+    rows = [
+        ("山梨県", "2024-06-01", "南部町", "福士", 35.2500, 138.4800),
+        ("静岡県", "2024-06-01", "南部町", "福士", 35.2503, 138.4801),
+        # 神奈川県の行は座標が無いので欠けが多く、残らない
+        ("神奈川県", "2024-06-01", "南部町", "福士", None, None),
+    ]
+    deduped, report = deduplicate_sightings(make_df(rows))
+
+    assert len(deduped) == 1
+    assert len(report) == 2
+    for row in report.itertuples():
+        assert row.dropped_prefecture != row.kept_prefecture
+        a, b = (rows[i] for i in (row.dropped, row.linked_to))
+        assert a[0] != b[0]
+        expected = score_pair(*(
+            {"day": pd.Timestamp(r[1]).toordinal(), "lat": float("nan") if r[4] is None else r[4],
+             "lon": float("nan") if r[5] is None else r[5],
+             "city": normalize_city(r[2]), "location": normalize_location(r[3])}
+            for r in (a, b)
+        ))
+        assert row.score == round(expected, 3)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+tile_server.py の事前取得と配信を、ネットワークを使わずに確認する
+(取得関数を差し替え、サーバーは port=0 でローカルに起動する)。
+"""
+
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+import tile_server
+
+BBOX = (138.5, 35.3, 138.7, 35.5)
+
+
+def fake_fetch(z, x, y):
+    return b"\x89PNG" + f"{z}/{x}/{y}".encode()
+
+
+def get(server, path, headers=None):
+    url = f"http://127.0.0.1:{server.server_port}{path}"
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    path = str(tmp_path / "tiles.mbtiles")
+    store = tile_server.TileStore(path)
+    result = tile_server.seed_tiles(store, BBOX, 8, 11, workers=2, fetch=fake_fetch, interval_s=0)
+    store.close()
+    assert result == {"fetched": tile_server.count_tiles(BBOX, 8, 11), "skipped": 0, "failed": 0}
+    return path
+
+
+def start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_seed_is_resumable_and_stores_tms_rows(seeded_db):
+    store = tile_server.TileStore(seeded_db)
+    try:
+        again = tile_server.seed_tiles(store, BBOX, 8, 11, fetch=fake_fetch, interval_s=0)
+        assert again["fetched"] == 0 and again["skipped"] == store.tile_count()
+        assert store.metadata()["maxzoom"] == "11"
+    finally:
+        store.close()
+
+    # MBTiles の行番号は南から数える (TMS)
+    x, y = tile_server.lonlat_to_tile(138.6, 35.4, 10)
+    with sqlite3.connect(seeded_db) as conn:
+        row = conn.execute("SELECT tile_data FROM tiles WHERE zoom_level=10 AND tile_column=? AND tile_row=?",
+                           (x, 2 ** 10 - 1 - y)).fetchone()
+    assert row[0] == fake_fetch(10, x, y)
+
+
+def test_serve_200_304_404(seeded_db):
+    server = start(tile_server.make_server(port=0, db_path=seeded_db))
+    try:
+        x, y = tile_server.lonlat_to_tile(138.6, 35.4, 11)
+        status, headers, body = get(server, f"/tiles/11/{x}/{y}.png")
+        assert status == 200
+        assert body == fake_fetch(11, x, y)
+        assert headers["Content-Type"] == "image/png"
+        assert f"max-age={tile_server.MAX_AGE_SECONDS}" in headers["Cache-Control"]
+
+        status, headers_304, body = get(server, f"/tiles/11/{x}/{y}.png", {"If-None-Match": headers["ETag"]})
+        assert status == 304 and body == b""
+        assert headers_304["ETag"] == headers["ETag"]
+
+        # 範囲外・未保存は 404、形式の不正は 400
+        assert get(server, "/tiles/11/0/0.png")[0] == 404
+        assert get(server, "/tiles/3/99/0.png")[0] == 400
+        assert get(server, "/tiles/abc")[0] == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.store.close()
+
+
+def test_fetch_missing_stores_tile(seeded_db):
+    server = start(tile_server.make_server(port=0, db_path=seeded_db, fetch=fake_fetch))
+    try:
+        status, _, body = get(server, "/tiles/14/1/2.png")
+        assert status == 200 and body == fake_fetch(14, 1, 2)
+        assert server.store.has(14, 1, 2)
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.store.close()
+
+
+def test_seed_respects_interval(tmp_path):
+    store = tile_server.TileStore(str(tmp_path / "tiles.mbtiles"))
+    started = time.monotonic()
+    try:
+        result = tile_server.seed_tiles(store, BBOX, 8, 10, workers=4, fetch=fake_fetch, interval_s=0.05)
+    finally:
+        store.close()
+    # 接続数によらず、リクエストは interval_s ごとにしか始まらない
+    assert time.monotonic() - started >= 0.05 * (result["fetched"] - 1)
@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""
+地図の背景タイルをローカルの MBTiles (SQLite) に保存し、HTTP で配信する小さなタイルサーバー。
+オフラインの現場端末でも地図を表示でき、パン・ズームのたびに外部へ取りに行く遅延もなくなる。
+
+  - seed:  3県を囲む範囲のタイルを、指定したズームまで事前に取得して MBTiles に保存する
+           (保存済みのタイルは取り直さない。途中で止めても、再実行すると続きから取得する)
+  - serve: MBTiles のタイルを GET /tiles/{z}/{x}/{y}.png で返す
+           ETag / If-None-Match による 304 応答と、長めの Cache-Control を付ける
+           --fetch-missing を付けると、未保存のタイルは取得元から取って保存してから返す
+
+アプリ (app.py) では、環境変数 BEAR_TILE_URL にタイルのURLを設定すると、この背景を使う。
+  BEAR_TILE_URL=http://127.0.0.1:8503/tiles/{z}/{x}/{y}.png streamlit run app.py
+
+起動例:
+  python tile_server.py seed                 # ズーム12まで約900枚 (0.5秒間隔でおよそ8分)
+  python tile_server.py serve --port 8503
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+# タイルの保存先 (MBTiles 形式の SQLite)
+TILE_DB_FILE = "basemap_tiles.mbtiles"
+
+# タイルの取得元 (アプリの既定の背景 'CartoDB positron' と同じ)
+# CARTO の basemap は提供元の利用規約に従って使う (出典表示が必須。利用量の上限や、
+# 用途によっては API キー・契約が必要になる)。一括取得は提供元の負荷になるため、
+# 事前取得は必要な範囲・ズームに限り、SEED_INTERVAL_S の間隔を空けて少ない同時接続で行う。
+# 規約上ローカル保存が認められない場合は、--upstream で自前・契約済みのタイルサーバーを指定する。
+UPSTREAM_URL = "https://a.basemaps.cartocdn.com/light_all/{z}/{x}/{y}.png"
+ATTRIBUTION = "&copy; OpenStreetMap contributors &copy; CARTO"
+USER_AGENT = "bear-sightings-gis-tile-cache/1.0"
+
+# 事前取得する範囲 (西, 南, 東, 北)。神奈川・山梨・静岡の3県を囲む
+SEED_BBOX = (137.4, 34.5, 139.9, 36.0)
+SEED_MIN_ZOOM = 5
+SEED_MAX_ZOOM = 12
+
+# 事前取得の同時接続数、取得元へのリクエストの最小間隔 (秒。全接続で共有)、
+# 1タイルの取得のタイムアウト (秒)
+SEED_WORKERS = 2
+SEED_INTERVAL_S = 0.5
+FETCH_TIMEOUT_S = 15
+
+# よく使うタイルをメモリに置いておく件数
+TILE_CACHE_SIZE = 4096
+
+# クライアント側でのキャッシュ秒数 (背景タイルはほとんど変わらないため長め)
+MAX_AGE_SECONDS = 7 * 24 * 3600
+
+
+# ----------------------------------------------
+# タイル座標
+# ----------------------------------------------
+def lonlat_to_tile(lon: float, lat: float, zoom: int) -> tuple:
+    """
+    経緯度を含むタイルの (x, y) を返す (XYZ 方式。y は北が0)。
+    """
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tiles_in_bbox(bbox: tuple, min_zoom: int, max_zoom: int):
+    """
+    範囲 (西, 南, 東, 北) にかかるタイル (z, x, y) をズームの小さい順に返す。
+    """
+    west, south, east, north = bbox
+    for z in range(min_zoom, max_zoom + 1):
+        x0, y0 = lonlat_to_tile(west, north, z)
+        x1, y1 = lonlat_to_tile(east, south, z)
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                yield z, x, y
+
+
+def count_tiles(bbox: tuple, min_zoom: int, max_zoom: int) -> int:
+    total = 0
+    west, south, east, north = bbox
+    for z in range(min_zoom, max_zoom + 1):
+        x0, y0 = lonlat_to_tile(west, north, z)
+        x1, y1 = lonlat_to_tile(east, south, z)
+        total += (x1 - x0 + 1) * (y1 - y0 + 1)
+    return total
+
+
+# ----------------------------------------------
+# MBTiles の読み書き
+# ----------------------------------------------
+class TileStore:
+    """
+    MBTiles (SQLite) のタイルを読み書きする。
+    MBTiles は行番号が南から数える TMS 方式なので、XYZ の y との変換はこのクラスの中だけで行う。
+    複数スレッドから使うため、接続は1つにしてロックで排他する。よく使うタイルはメモリにも置く。
+    """
+
+    def __init__(self, path: str = TILE_DB_FILE, cache_size: int = TILE_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            );
+        """)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, z: int, x: int, y: int) -> tuple:
+        """
+        タイルの (画像データ, ETag) を返す。保存されていなければ (None, None)。
+        """
+        key = (z, x, y)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            row = self._conn.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, 2 ** z - 1 - y)
+            ).fetchone()
+            if row is None:
+                return None, None
+            return self._remember(key, bytes(row[0]))
+
+    def put(self, z: int, x: int, y: int, data: bytes):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)", (z, x, 2 ** z - 1 - y, data)
+            )
+            self._conn.commit()
+            self._cache.pop((z, x, y), None)
+
+    def has(self, z: int, x: int, y: int) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, 2 ** z - 1 - y)
+            ).fetchone()
+        return row is not None
+
+    def set_metadata(self, **values):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                [(name, str(value)) for name, value in values.items()]
+            )
+            self._conn.commit()
+
+    def metadata(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT name, value FROM metadata").fetchall())
+
+    def tile_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def _remember(self, key: tuple, data: bytes) -> tuple:
+        # ロックを取った状態で呼ぶ
+        etag = f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+        self._cache[key] = (data, etag)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return data, etag
+
+
+# ----------------------------------------------
+# タイルの取得と事前取得
+# ----------------------------------------------
+def fetch_tile(z: int, x: int, y: int, url_template: str = UPSTREAM_URL,
+               timeout: float = FETCH_TIMEOUT_S) -> bytes:
+    """
+    取得元からタイル画像を1枚取得する。
+    """
+    url = url_template.format(z=z, x=x, y=y)
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def seed_tiles(store: TileStore, bbox: tuple = SEED_BBOX, min_zoom: int = SEED_MIN_ZOOM,
+               max_zoom: int = SEED_MAX_ZOOM, workers: int = SEED_WORKERS, fetch=fetch_tile,
+               interval_s: float = SEED_INTERVAL_S) -> dict:
+    """
+    範囲内のタイルのうち、まだ保存されていないものを取得して保存する。
+    fetch(z, x, y) はタイル画像を返す関数 (テストや別の取得元に差し替えられる)。
+    取得元へのリクエストは、全接続あわせて interval_s 秒に1回までに抑える。
+    結果 {"fetched", "skipped", "failed"} を返す。
+    """
+    total = count_tiles(bbox, min_zoom, max_zoom)
+    missing = [tile for tile in tiles_in_bbox(bbox, min_zoom, max_zoom) if not store.has(*tile)]
+    result = {"fetched": 0, "skipped": total - len(missing), "failed": 0}
+    print(f"タイル事前取得: 全 {total:,} 枚 / 未保存 {len(missing):,} 枚 (ズーム {min_zoom}〜{max_zoom})")
+
+    throttle_lock = threading.Lock()
+    next_request = [time.monotonic()]
+
+    def fetch_one(tile):
+        # 次にリクエストしてよい時刻を予約してから待つ (接続数によらず間隔が保たれる)
+        with throttle_lock:
+            wait_s = next_request[0] - time.monotonic()
+            next_request[0] = max(next_request[0], time.monotonic()) + interval_s
+        if wait_s > 0:
+            time.sleep(wait_s)
+        try:
+            return tile, fetch(*tile)
+        except Exception as e:
+            print(f"タイル {tile} の取得に失敗: {e}")
+            return tile, None
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="tile") as executor:
+        for i, (tile, data) in enumerate(executor.map(fetch_one, missing), 1):
+            if data is None:
+                result["failed"] += 1
+            else:
+                store.put(*tile, data)
+                result["fetched"] += 1
+            if i % 500 == 0:
+                print(f"  {i:,} / {len(missing):,} 枚 ({time.monotonic() - started:.0f} 秒)")
+
+    west, south, east, north = bbox
+    store.set_metadata(
+        name="bear_sightings_basemap", format="png", type="baselayer", version="1",
+        bounds=f"{west},{south},{east},{north}", minzoom=min_zoom, maxzoom=max_zoom,
+        attribution=ATTRIBUTION,
+    )
+    print(f"タイル事前取得: 取得 {result['fetched']:,} / 保存済み {result['skipped']:,} / 失敗 {result['failed']:,}")
+    return result
+
+
+# ----------------------------------------------
+# HTTP サーバー
+# ----------------------------------------------
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """
+    /tiles/{z}/{x}/{y}.png と /health を処理するハンドラ。
+    server.store に TileStore を、server.fetch に未保存タイルの取得関数 (None なら取得しない) を持たせて使う。
+    """
+
+    server_version = "BearSightingsTiles/1.0"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            store = self.server.store
+            self._send_json(200, {"status": "ok", "tiles": store.tile_count(), "metadata": store.metadata()})
+        elif path.startswith("/tiles/"):
+            self._handle_tile(path)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    do_HEAD = do_GET
+
+    def _handle_tile(self, path: str):
+        tile = parse_tile_path(path)
+        if tile is None:
+            self._send_json(400, {"error": "タイルは /tiles/{z}/{x}/{y}.png の形式で指定してください"})
+            return
+
+        store = self.server.store
+        data, etag = store.get(*tile)
+        if data is None and self.server.fetch is not None:
+            try:
+                store.put(*tile, self.server.fetch(*tile))
+                data, etag = store.get(*tile)
+            except Exception as e:
+                print(f"[タイル] {tile} の取得に失敗: {e}")
+        if data is None:
+            # 範囲外・未保存のタイルは、ブラウザが何度も取りに来ないよう短時間だけキャッシュさせる
+            self._send(404, b"", cache_seconds=300)
+            return
+
+        if etag in _parse_etags(self.headers.get("If-None-Match", "")):
+            self._send(304, b"", etag=etag, cache_seconds=MAX_AGE_SECONDS)
+            return
+        self._send(200, data, etag=etag, content_type="image/png", cache_seconds=MAX_AGE_SECONDS)
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, content_type="application/json; charset=utf-8")
+
+    def _send(self, status: int, body: bytes, etag: str = None,
+              content_type: str = None, cache_seconds: int = None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        if etag:
+            self.send_header("ETag", etag)
+        if cache_seconds:
+            self.send_header("Cache-Control", f"public, max-age={cache_seconds}")
+        # 地図は Streamlit (別ポート) の画面から読み込まれる
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_request(self, code="-", size="-"):
+        # タイルは1画面で数十枚になるため、正常時と未保存 (404) のアクセスは記録しない
+        if isinstance(code, int) and code >= 400 and code != 404:
+            super().log_request(code, size)
+
+    def log_message(self, format, *args):
+        print("[タイル]", self.address_string(), format % args)
+
+
+def parse_tile_path(path: str):
+    """
+    "/tiles/{z}/{x}/{y}.png" を (z, x, y) にする。形式や範囲が不正なら None。
+    """
+    parts = path.strip("/").split("/")
+    if len(parts) != 4 or not parts[3].endswith(".png"):
+        return None
+    try:
+        z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+    except ValueError:
+        return None
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return None
+    return z, x, y
+
+
+def _parse_etags(header: str) -> set:
+    """
+    If-None-Match ヘッダーの値を ETag の集合にする (弱いETagの W/ は無視)。
+    """
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8503, db_path: str = TILE_DB_FILE,
+                fetch=None) -> ThreadingHTTPServer:
+    """
+    タイルサーバーを作って返す (serve_forever() は呼び出し側で行う)。
+    port=0 を指定すると空いているポートが割り当てられる。
+    fetch を渡すと、未保存のタイルはそれで取得して保存してから返す。
+    """
+    server = ThreadingHTTPServer((host, port), TileRequestHandler)
+    server.store = TileStore(db_path)
+    server.fetch = fetch
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="地図の背景タイルのローカルキャッシュとタイルサーバー")
+    parser.add_argument("--db", default=TILE_DB_FILE, help="MBTiles ファイル")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="3県の範囲のタイルを事前に取得する")
+    seed_parser.add_argument("--bbox", default=",".join(map(str, SEED_BBOX)), help="西,南,東,北")
+    seed_parser.add_argument("--min-zoom", type=int, default=SEED_MIN_ZOOM)
+    seed_parser.add_argument("--max-zoom", type=int, default=SEED_MAX_ZOOM)
+    seed_parser.add_argument("--workers", type=int, default=SEED_WORKERS)
+    seed_parser.add_argument("--interval", type=float, default=SEED_INTERVAL_S,
+                             help="取得元へのリクエストの最小間隔 (秒)")
+    seed_parser.add_argument("--upstream", default=UPSTREAM_URL, help="取得元のURL ({z}/{x}/{y} を含む)")
+
+    serve_parser = subparsers.add_parser("serve", help="タイルを HTTP で配信する")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8503)
+    serve_parser.add_argument("--fetch-missing", action="store_true",
+                              help="未保存のタイルを取得元から取って保存する (オンライン時のみ)")
+    serve_parser.add_argument("--upstream", default=UPSTREAM_URL, help="取得元のURL ({z}/{x}/{y} を含む)")
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        try:
+            bbox = tuple(float(v) for v in args.bbox.split(","))
+        except ValueError:
+            parser.error("--bbox は 西,南,東,北 の4つの数値で指定してください")
+        if len(bbox) != 4:
+            parser.error("--bbox は 西,南,東,北 の4つの数値で指定してください")
+        store = TileStore(args.db)
+        try:
+            seed_tiles(store, bbox, args.min_zoom, args.max_zoom, args.workers,
+                       fetch=lambda z, x, y: fetch_tile(z, x, y, args.upstream),
+                       interval_s=args.interval)
+        finally:
+            store.close()
+        return
+
+    fetch = (lambda z, x, y: fetch_tile(z, x, y, args.upstream)) if args.fetch_missing else None
+    server = make_server(args.host, args.port, args.db, fetch)
+    print(f"タイルサーバー起動: http://{args.host}:{server.server_port}/tiles/{{z}}/{{x}}/{{y}}.png "
+          f"(保存済み {server.store.tile_count():,} 枚)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.store.close()
+
+
+if __name__ == "__main__":
+    main()